@@ -1,16 +1,14 @@
+import time
+LAUNCH_TIME = time.perf_counter()  # 用于统计启动到界面可用的耗时
+
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import threading
 import os
 import sys
 import subprocess
-import shutil
-import time
-
+import traceback
 
-# --- 全局变量 ---
-yt_dlp = None
-ffmpeg_available = False
 
 # Crash Handler (Catch-all)
 def handle_missed_exception(exc_type, exc_value, exc_traceback):
@@ -20,6 +18,9 @@ def handle_missed_exception(exc_type, exc_value, exc_traceback):
     try:
         with open(log_file, "w") as f:
             f.write(error_msg)
+        # 把还在缓冲区里的任务进度写进任务日志，下次启动能接着下载
+        if engine.job_journal is not None:
+            engine.job_journal.flush()
         # Try to show alert if Tk is alive
         subprocess.run(['osascript', '-e', f'display notification "Application Crashed! Log saved to Desktop" with title "Error"'])
     except:
@@ -29,369 +30,197 @@ def handle_missed_exception(exc_type, exc_value, exc_traceback):
 sys.excepthook = handle_missed_exception
 
 import json
-import urllib.request
-import zipfile
-import stat
+import collections
+
+import bandwidth
+import engine
+import remux
+import sections
+from log_channel import LogChannel
+from engine import (log, ConfigManager, DownloadScheduler,
+                    JOB_STATE_LABELS, JOB_DOWNLOADING, JOB_DONE, JOB_FAILED, MAX_PARALLEL_DOWNLOADS, QUALITY_BEST)
 
 CURRENT_VERSION = "v1.1.2"
 UPDATE_URL = "https://github.com/pk197197/youtube-downloader/releases"
 API_URL = "https://api.github.com/repos/pk197197/youtube-downloader/releases/latest"
-CONFIG_FILE = os.path.expanduser("~/.youtube_downloader_config.json")
-
-
-import ssl
-
-def detect_ffmpeg():
-    """检测 FFmpeg 是否存在，包括 Homebrew 路径"""
-    # 1. 检查环境变量中的 ffmpeg
-    if shutil.which("ffmpeg"):
-        return shutil.which("ffmpeg")
-    
-    # 2. 检查常见 Homebrew/MacPorts 路径
-    common_paths = [
-        "/opt/homebrew/bin/ffmpeg",  # Apple Silicon
-        "/usr/local/bin/ffmpeg",     # Intel
-        os.path.expanduser("~/bin/ffmpeg"),
-        os.path.expanduser("~/Library/Application Support/YouTubeDownloader/bin/ffmpeg")
-    ]
-    
-    for path in common_paths:
-        if os.path.exists(path) and os.access(path, os.X_OK):
-            return path
-            
-    return None
-
-def install_ffmpeg():
-    """尝试自动安装 FFmpeg"""
-    log("⏳ 正在尝试自动安装 FFmpeg...")
-    
-    # 1. 尝试使用 Homebrew (如果 installed but not link)
-    # 这里我们只尝试运行 install，如果已经安装了 brew 会自动处理
-    if shutil.which("brew"):
-        log("🍺 检测到 Homebrew，尝试 'brew install ffmpeg'...")
-        try:
-            # 捕获输出防止弹窗
-            subprocess.check_call(["brew", "install", "ffmpeg"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            log("✅ FFmpeg 通过 Homebrew 安装成功！")
-            return True
-        except:
-            # brew 可能会报错如果已经安装，再次尝试检测
-            if detect_ffmpeg():
-                return True
-            log("❌ Homebrew 安装/修复失败。转为下载静态包...")
-    
-    # 2. 尝试下载静态构建
-    FFMPEG_URL = "https://evermeet.cx/ffmpeg/ffmpeg-6.0.zip" # LTS version
-    TARGET_DIR = os.path.expanduser("~/Library/Application Support/YouTubeDownloader/bin")
-    TARGET_BIN = os.path.join(TARGET_DIR, "ffmpeg")
-    
-    if os.path.exists(TARGET_BIN):
-        os.chmod(TARGET_BIN, os.stat(TARGET_BIN).st_mode | stat.S_IEXEC)
-        os.environ["PATH"] += os.pathsep + TARGET_DIR
-        return True
-        
-    log(f"⬇️ 正在下载 FFmpeg 静态包 (约 20MB)...")
-    try:
-        if not os.path.exists(TARGET_DIR):
-            os.makedirs(TARGET_DIR)
-            
-        zip_path = os.path.join(TARGET_DIR, "ffmpeg.zip")
-        
-        # 忽略 SSL 证书验证 (防止 Python 环境缺失证书)
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        
-        # 添加 User-Agent
-        opener = urllib.request.build_opener(urllib.request.HTTPSHandler(context=ctx))
-        opener.addheaders = [('User-Agent', 'Mozilla/5.0')]
-        urllib.request.install_opener(opener)
-        
-        urllib.request.urlretrieve(FFMPEG_URL, zip_path)
-        
-        log("📦 正在解压 FFmpeg...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(TARGET_DIR)
-            
-        # 赋予执行权限
-        os.chmod(TARGET_BIN, os.stat(TARGET_BIN).st_mode | stat.S_IEXEC)
-        
-        # 移除 Gatekeeper 隔离属性 (安全地)
-        try:
-            subprocess.run(["xattr", "-d", "com.apple.quarantine", TARGET_BIN], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except:
-            pass
-        
-        # Cleanup
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-        
-        # 添加到环境变量
-        os.environ["PATH"] += os.pathsep + TARGET_DIR
-        log("✅ FFmpeg 静态包安装成功！")
-        return True
-    except Exception as e:
-        log(f"❌ FFmpeg 自动安装失败: {e}")
-        return False
+# 列表里最多保留多少个已结束的任务，更早的收起：展开几千个视频的频道时列表不会一直变长
+MAX_FINISHED_ROWS = 200
 
 # 调整 init_app 增加静默检查
 def init_app():
-    global yt_dlp, ffmpeg_available
-    
     # 0. 静默检查更新
     threading.Thread(target=check_update_silent).start()
     
-    log("正在初始化核心组件...")
-    
-    # 1. 检查/安装 yt-dlp
-    if not ensure_ytdlp_installed():
-        log("❌ 核心组件 yt-dlp 加载失败，程序无法使用。")
+    ok = engine.init_components()
+    log(f"⏱ 组件初始化耗时: {engine.format_startup_timings()}")
+    if not ok:
         return
 
-    import yt_dlp as ydl_module
-    yt_dlp = ydl_module
-    log("✅ 核心组件加载完成。")
-
-    # 2. 检测 FFmpeg
-    ffmpeg_path = detect_ffmpeg()
-    
-    if ffmpeg_path:
-        ffmpeg_available = True
-        # 如果是手动找到的路径，确保它在 PATH 里，主要是为了 yt-dlp 能找到
-        ffmpeg_dir = os.path.dirname(ffmpeg_path)
-        if ffmpeg_dir not in os.environ["PATH"]:
-             os.environ["PATH"] += os.pathsep + ffmpeg_dir
-        log(f"✅ 检测到 FFmpeg 组件: {ffmpeg_path}")
-    else:
-        # 尝试自动安装
-        if install_ffmpeg():
-             ffmpeg_available = True
-        else:
-             ffmpeg_available = False
-
-    if not ffmpeg_available:
-        log("⚠️ 未检测到 FFmpeg！")
-        log("👉 后果：无法下载 1080p+ 画质，所有视频将自动降级为兼容格式（通常是 720p 或更低）。")
+    if not engine.ffmpeg_available:
         window.after(1000, lambda: messagebox.showwarning("画质受限警告", 
             "未检测到 FFmpeg 组件！且自动安装失败。\n\n程序将运行在【兼容低画质模式】。\n\n建议手动安装 Homebrew 后运行 'brew install ffmpeg'。"))
 
-def ensure_ytdlp_installed():
-    # 如果是打包后的环境，直接跳过检查
-    if getattr(sys, 'frozen', False):
-        try:
-            import yt_dlp
-            return True
-        except ImportError:
-            return False
-
-    try:
-        import yt_dlp
-        return True
-    except ImportError:
-        log("正在尝试自动修复依赖...")
-        try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp", "--break-system-packages"])
-            return True
-        except:
-            return False
-
 # --- 日志输出 ---
-def log(message):
-    timestamp = time.strftime("%H:%M:%S", time.localtime())
-    full_msg = f"[{timestamp}] {message}\n"
-    window.after(0, lambda: _append_log(full_msg))
+# 工作线程只写入通道，界面线程每帧批量取出刷新，避免每条日志一次 window.after
+LOG_FLUSH_INTERVAL_MS = 80
+MAX_LOG_LINES = 1000
+log_channel = LogChannel()
+
+def flush_log_channel():
+    lines, dropped, jobs = log_channel.drain()
+    if dropped:
+        lines.insert(0, f"...（日志过多，省略 {dropped} 条）...\n")
+    if lines:
+        _append_log("".join(lines))
+    for item in jobs:
+        if isinstance(item, engine.PlaylistExpansion):
+            playlist_updated(item)
+        else:
+            job_updated(item)
+    window.after(LOG_FLUSH_INTERVAL_MS, flush_log_channel)
 
 def _append_log(msg):
     log_area.config(state='normal')
     log_area.insert(tk.END, msg)
+    # 日志框只保留最近 MAX_LOG_LINES 行
+    excess = int(log_area.index('end-1c').split('.')[0]) - MAX_LOG_LINES
+    if excess > 0:
+        log_area.delete('1.0', f'{excess + 1}.0')
     log_area.see(tk.END) # 自动滚动到底部
     log_area.config(state='disabled')
 
 def start_download():
-    if yt_dlp is None:
-        messagebox.showwarning("提示", "正在初始化组件，请稍后...")
-        return
-
-    url = url_entry.get().strip()
-    if not url:
+    # 组件还在后台初始化时也可以直接加入队列，解析阶段会等待初始化完成
+    # 支持一次粘贴多个链接（空格/换行分隔），全部加入队列
+    urls = url_entry.get().split()
+    if not urls:
         messagebox.showwarning("提示", "请先粘贴视频链接！")
         return
     
-    # 智能判断：如果未解析直接点下载，自动触发解析并下载最高画质
-    if not quality_var.get():
-        log("检测到未选择画质，正在自动解析并下载最佳画质...")
-        # 这里为了简化逻辑，我们直接用Best配置启动下载任务，跳过手动选择
-        # 但为了用户体验，最好还是走一遍解析流程，或者赋予默认值
-        # 简单方案：赋予默认最高画质
-        download_btn.config(state=tk.DISABLED, text="下载中...")
-        thread = threading.Thread(target=run_download_task, args=(url, "1. 最高画质 (最佳效果)", path_entry.get().strip()))
-        thread.start()
-        return
-
+    # 智能判断：如果未解析直接点下载，默认下载最高画质
     quality = quality_var.get()
+    if not quality:
+        log("检测到未选择画质，将默认下载最佳画质...")
+        quality = QUALITY_BEST
+
     save_path = path_entry.get().strip()
     if not save_path or not os.path.isdir(save_path):
         messagebox.showwarning("提示", "请选择有效的保存路径！")
         return
     
-    download_btn.config(state=tk.DISABLED, text="下载中...")
-    log("🚀 开始下载任务...")
-
-    thread = threading.Thread(target=run_download_task, args=(url, quality, save_path))
-    thread.start()
-
-def run_download_task(url, quality, save_path):
-    # has_ffmpeg = check_ffmpeg() # 使用全局变量
-    
-    ydl_opts = {
-        'outtmpl': os.path.join(save_path, '%(title)s.%(ext)s'),
-        # 'cookiesfrombrowser': ('safari',), 
-        'merge_output_format': 'mp4',
-        'noplaylist': True, 
-        'progress_hooks': [progress_hook],
-        'logger': MyLogger(), # 捕获 yt-dlp 内部日志
-    }
-    
-    if not ffmpeg_available:
-        log("⚠️ [兼容模式] 未检测到FFmpeg，将根据可用格式下载")
-        if 'merge_output_format' in ydl_opts:
-            del ydl_opts['merge_output_format'] # 没有ffmpeg无法合并，不能指定merge_output_format
-
-    if "仅音频" in quality:
-        if ffmpeg_available:
-            ydl_opts.update({
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-            })
-        else:
-             ydl_opts.update({'format': 'bestaudio/best'})
-             window.after(0, lambda: messagebox.showinfo("提示", "无FFmpeg，下载原始音频"))
-
-    elif "最高画质" in quality or "1." in quality: # 兼容带序号的选项
-        if ffmpeg_available:
-            ydl_opts.update({'format': 'bestvideo+bestaudio/best'})
-        else:
-            # 没有FFmpeg，强制只能下载 best（通常是720p或更低，已经包含音频的单个文件）
-            ydl_opts.update({'format': 'best'}) 
-            
-    elif "标准画质" in quality: # 旧逻辑兼容
-        ydl_opts.update({'format': 'best[height<=720][ext=mp4]/best[height<=720]'})
-
-    # 处理带序号的选项 "2. 1080p xxx"
-    elif any(x in quality for x in ["2.", "3.", "4.", "5."]):
+    if playlist_var.get():
         try:
-            # 提取数字部分，例如 "2. 1080p" -> "1080"
-            import re
-            res_match = re.search(r'(\d+)p', quality)
-            if res_match:
-                res = res_match.group(1)
-                if ffmpeg_available:
-                    ydl_opts.update({'format': f'bestvideo[height<={res}]+bestaudio/best[height<={res}]'})
-                else:
-                    ydl_opts.update({'format': f'best[height<={res}]'})
-        except:
-            pass 
-
-    try:
-        log("正在连接下载服务器...")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        
-        window.after(0, lambda: download_finished(True))
-    except Exception as e:
-        log(f"❌ 下载发生异常: {str(e)}")
-        window.after(0, lambda: download_finished(False, str(e)))
-
-class MyLogger:
-    def debug(self, msg):
-        if not msg.startswith('[debug] '):
-            # log(f"[内部] {msg}")
-            pass
-    def warning(self, msg):
-        # 过滤掉一些不影响使用的警告
-        if "challenge" in msg or "AppSupport" in msg:
-            return 
-        log(f"⚠️ {msg}")
-    def error(self, msg):
-        log(f"❌ {msg}")
-
-def progress_hook(d):
-    global last_percent
-    if d['status'] == 'downloading':
-        p = d.get('_percent_str', '0%')
-#         s = d.get('_speed_str', 'N/A')
-        # 减少刷屏，只在整10%或者完成时记录
-        s = d.get('_speed_str', 'N/A')
-        # 减少刷屏，只在整10%或者完成时记录
-        # 但为了让用户看到动静，还是实时更新log的最后一样比较好？
-        # 这里我们就简单地每一段时间log一次，或者直接只更新Label，log里只记关键节点
-        # 用户的需求是debug，所以最好详细一点
-        # 这里用 window.after 更新到 log 可能会太快导致界面卡顿，所以只记录关键节点
-        pass 
-        # 实时速度还是显示在状态栏比较好，log里记录 milestones
-    elif d['status'] == 'finished':
-        log("✅ 文件下载完成，正在进行后期处理（合并/转码）...")
-
-def download_finished(success, error_msg=""):
-    download_btn.config(state=tk.NORMAL, text="立即下载")
-    if success:
+            items = engine.parse_playlist_items(playlist_items_entry.get())
+            date_range = engine.parse_date_range(date_after_entry.get().strip())
+        except ValueError as e:
+            messagebox.showwarning("提示", str(e))
+            return
+        for url in urls:
+            scheduler.submit_playlist(url, quality, save_path, items, date_range)
+        log(f"📃 正在展开 {len(urls)} 个播放列表/频道，视频会边发现边加入队列")
+    else:
+        try:
+            section = sections.parse_section(section_start_entry.get(), section_end_entry.get())
+        except ValueError as e:
+            messagebox.showwarning("提示", str(e))
+            return
+        for url in urls:
+            scheduler.submit(url, quality, save_path, section=section)
+        log(f"🚀 已加入下载队列: {len(urls)} 个任务"
+            + (f"（只下载 {sections.format_timestamp(section[0])}~"
+               f"{sections.format_timestamp(section[1]) if section[1] is not None else '结尾'}）" if section else ""))
+    url_entry.delete(0, tk.END)
+
+def on_job_update(job):
+    # 由工作线程回调（状态变化和下载进度），下一帧统一刷新列表
+    log_channel.touch(job.id, job)
+
+def job_row(job):
+    if job.state == JOB_DOWNLOADING and job.percent is not None:
+        progress = f"{job.percent:.1f}% / {engine.format_bytes(job.total_bytes)}"
+    else:
+        progress = engine.format_bytes(job.downloaded_bytes) if job.downloaded_bytes else "-"
+    speed = engine.format_bytes(job.speed) + "/s" if job.speed and job.state == JOB_DOWNLOADING else "-"
+    eta = engine.format_eta(job.eta) if job.state == JOB_DOWNLOADING else "-"
+    state = JOB_STATE_LABELS[job.state]
+    if job.live and job.state == JOB_DOWNLOADING:
+        # 直播没有总大小和剩余时间：剩余一栏显示已录时长，等待开播时显示距开播的时间
+        state = "停止中" if job.stop_event.is_set() else "等待开播" if job.eta is not None else "录制中"
+        eta = engine.format_eta(job.eta if job.eta is not None else job.live_seconds)
+    if job.retries:
+        state += f" ↻{sum(job.retries.values())}"
+    if job.state == JOB_DOWNLOADING and job.metrics is not None and job.metrics.stalled:
+        state += " 停滞"
+    return (job.title, job.quality, state, progress, speed, eta)
+
+def on_playlist_update(playlist):
+    log_channel.touch(playlist.id, playlist)
+
+finished_rows = collections.deque()  # 列表里已结束的任务，按结束先后
+collapsed_rows = set()  # 已经收起的任务，之后再有回调也不再加回列表
+
+def job_updated(job):
+    if job_tree.exists(job.id):
+        job_tree.item(job.id, values=job_row(job))
+    elif job.id not in collapsed_rows:
+        # 播放列表展开时由后台线程加入的任务
+        job_tree.insert("", tk.END, iid=job.id, values=job_row(job))
+    if job.finished and job.id not in collapsed_rows and job.id not in finished_rows:
+        finished_rows.append(job.id)
+        collapse_finished_rows()
+    if job.state == JOB_DONE:
+        log(f"🎉 任务完成: {job.title}")
+    elif job.state == JOB_FAILED:
+        log(f"❌ 任务失败: {job.title}")
+    if job.finished and scheduler.active_count() == 0:
+        download_finished()
+
+def collapse_finished_rows():
+    while len(finished_rows) > MAX_FINISHED_ROWS:
+        job_id = finished_rows.popleft()
+        if job_tree.exists(job_id):
+            job_tree.delete(job_id)
+        collapsed_rows.add(job_id)
+    if collapsed_rows:
+        queue_label.config(text=f"下载队列（已收起 {len(collapsed_rows)} 个已结束的任务）：")
+
+def playlist_updated(playlist):
+    title_label.config(text=f"📃 {playlist.title}：已翻过 {playlist.found} 条，加入队列 {playlist.queued} 个"
+                            + ("（展开完成）" if playlist.finished else "..."))
+    if playlist.finished and scheduler.active_count() == 0:
+        download_finished()
+
+def download_finished():
+    """队列全部跑完后汇总提示一次"""
+    done, failed = scheduler.take_finished()
+    if not failed:
         log("🎉 所有任务执行成功！")
-        messagebox.showinfo("成功", "视频下载完成！")
+        messagebox.showinfo("成功", f"{done} 个视频下载完成！")
         try:
             subprocess.call(["open", path_entry.get()])
         except:
             pass
     else:
-        log("❌ 任务失败")
-        messagebox.showerror("错误", f"下载出错了：{error_msg}")
+        log(f"❌ {len(failed)} 个任务失败")
+        messagebox.showerror("错误", f"成功 {done} 个，失败 {len(failed)} 个：\n{failed[0].error}")
 
 def analyze_url(url):
     if not url: return
 
-    # 没加载完 yt-dlp 时点击也没用
-    if yt_dlp is None:
-        messagebox.showwarning("提示", "核心组件正在后台初始化，请稍后...")
-        return
-    
     log(f"🔍 正在解析视频信息: {url}")
     log("⏳ 请稍候，这可能需要几秒钟...")
     
     options_frame.pack_forget()
 
     def run_analysis():
+        # 核心组件还在后台初始化时先等它完成
+        if not engine.wait_for_components():
+            window.after(0, lambda: update_fail("核心组件 yt-dlp 加载失败"))
+            return
         try:
-            ydl_opts = {
-                'noplaylist': True,
-                'quiet': True,
-                # 'cookiesfrombrowser': ('safari',), # 移除复杂鉴权
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-            
+            info = engine.probe_url(url)
             video_title = info.get('title', '未知标题')
-            
-            formats = info.get('formats', [])
-            resolutions = set()
-            for f in formats:
-                if f.get('vcodec') != 'none' and f.get('height'):
-                    resolutions.add(f['height'])
-            
-            # 排序：从高到低
-            sorted_res = sorted(list(resolutions), reverse=True)
-            
-            # 构建带序号的选项列表
-            options = ["1. 最高画质 (最佳效果)"]
-            
-            idx = 2
-            for r in sorted_res:
-                options.append(f"{idx}. {r}p (MP4)")
-                idx += 1
-                
-            options.append(f"{idx}. 仅音频 (MP3)")
+            options = engine.list_quality_options(info)
             
             # 回到主线程更新 UI
             window.after(0, lambda: update_success(options, video_title))
@@ -402,6 +231,24 @@ def analyze_url(url):
 
     threading.Thread(target=run_analysis).start()
 
+def analyze_batch(urls):
+    """多个链接用常驻解析池批量解析，逐条输出标题/时长/画质/大小，方便挑选后再下载"""
+    log(f"📋 检测到 {len(urls)} 个链接，正在批量解析...")
+    options_frame.pack_forget()
+
+    def run_batch():
+        if not engine.wait_for_components():
+            window.after(0, lambda: update_fail("核心组件 yt-dlp 加载失败"))
+            return
+        rows = engine.probe_batch(urls, on_result=lambda row: log(engine.format_probe_row(row)))
+        # 画质选项取所有链接可选高度的并集，每个视频下载时按"不超过该高度"选择
+        heights = sorted({h for row in rows for h in row['heights']}, reverse=True)
+        options = engine.list_quality_options({'formats': [{'height': h} for h in heights]})
+        total = sum(row['filesize'] or 0 for row in rows)
+        window.after(0, lambda: update_success(options, f"{len(urls)} 个视频，预计共 {engine.format_bytes(total)}"))
+
+    threading.Thread(target=run_batch, daemon=True).start()
+
 def update_success(options, title):
     log(f"✅ 解析成功: {title}")
     quality_menu['values'] = options
@@ -455,6 +302,7 @@ def apply_theme():
     s.theme_use('clam')
     s.configure('TCombobox', fieldbackground=theme["entry_bg"], background=theme["btn_bg"], foreground=theme["fg"], selectbackground=theme["btn_bg"], selectforeground=theme["fg"])
     s.map('TCombobox', fieldbackground=[('readonly', theme["entry_bg"])], background=[('readonly', theme["btn_bg"])])
+    s.configure('Treeview', background=theme["log_bg"], fieldbackground=theme["log_bg"], foreground=theme["fg"])
     
     def update_widget(parent):
         for widget in parent.winfo_children():
@@ -467,6 +315,8 @@ def apply_theme():
                 # 特殊处理模拟按钮的 Label
                 if widget in [paste_btn, browse_label]:
                     widget.config(bg=theme["btn_bg"], fg=theme["fg"], padx=20, pady=10)
+                elif widget == stop_label:
+                    widget.config(bg=theme["btn_bg"], fg=theme["fg"])
                 else:
                     widget.config(bg=theme["bg"], fg=theme["fg"])
             elif w_type == "Button":
@@ -481,12 +331,16 @@ def apply_theme():
                 widget.config(highlightthickness=2, borderwidth=0)
             elif w_type == "Entry":
                 widget.config(bg=theme["entry_bg"], fg=theme["fg"], highlightbackground=theme["highlight"], insertbackground=theme["fg"], highlightthickness=1)
+            elif w_type == "Checkbutton":
+                widget.config(bg=theme["bg"], fg=theme["fg"], activebackground=theme["bg"], selectcolor=theme["entry_bg"])
+            elif w_type == "Spinbox":
+                widget.config(bg=theme["entry_bg"], fg=theme["fg"], highlightbackground=theme["highlight"], insertbackground=theme["fg"])
             elif "Text" in w_type:
                 widget.config(bg=theme["log_bg"], fg=theme["fg"], highlightbackground=theme["highlight"])
 
     update_widget(window)
     # 强制刷新一些关键容器
-    for f in [header_frame, content_frame, entry_frame, options_frame, path_frame, log_frame]:
+    for f in [header_frame, content_frame, entry_frame, options_frame, path_frame, job_frame, job_header, log_frame]:
         try: f.config(bg=theme["bg"])
         except: pass
 
@@ -502,25 +356,6 @@ try:
 except:
     pass
 
-class ConfigManager:
-    @staticmethod
-    def load():
-        if os.path.exists(CONFIG_FILE):
-            try:
-                with open(CONFIG_FILE, 'r') as f:
-                    return json.load(f)
-            except:
-                pass
-        return {"skipped_version": "", "auto_check": True}
-
-    @staticmethod
-    def save(config):
-        try:
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(config, f)
-        except:
-            pass
-
 class UpdateDialog(tk.Toplevel):
     def __init__(self, parent, version_info):
         super().__init__(parent)
@@ -607,7 +442,7 @@ def check_update_silent():
         return
 
     try:
-        with urllib.request.urlopen(API_URL, timeout=5) as response:
+        with engine.get_http_pool().urlopen(API_URL, timeout=5) as response:
             data = json.loads(response.read().decode())
             latest_version = data['tag_name']
             
@@ -620,7 +455,7 @@ def check_update_silent():
 def check_update_manual():
     log("正在检查更新...")
     try:
-        with urllib.request.urlopen(API_URL, timeout=5) as response:
+        with engine.get_http_pool().urlopen(API_URL, timeout=5) as response:
             data = json.loads(response.read().decode())
             latest_version = data['tag_name']
             
@@ -679,7 +514,19 @@ def paste_link(event=None):
         content = window.clipboard_get()
         url_entry.delete(0, tk.END)
         url_entry.insert(0, content)
-        analyze_url(content)
+        urls = content.split()
+        if len(urls) == 1 and engine.is_playlist_url(urls[0]):
+            # 播放列表/频道不做完整解析（可能有上万个视频），直接按播放列表模式下载
+            playlist_var.set(True)
+            log("📃 检测到播放列表/频道链接，点击下载将边展开边下载。")
+            update_success([QUALITY_BEST, "2. 1080p (MP4)", "3. 720p (MP4)", f"4. {engine.audio_quality_label()}"],
+                           "播放列表 / 频道")
+        elif len(urls) > 1:
+            playlist_var.set(False)
+            analyze_batch(urls)
+        else:
+            playlist_var.set(False)
+            analyze_url(content.strip())
     except:
         pass
 
@@ -711,6 +558,28 @@ quality_var = tk.StringVar()
 quality_menu = ttk.Combobox(options_frame, textvariable=quality_var, state="readonly", font=default_font)
 quality_menu.pack(pady=5, padx=30, fill=tk.X, ipady=5)
 
+# 3.1.1 播放列表 / 频道模式
+playlist_frame = tk.Frame(options_frame)
+playlist_frame.pack(pady=5, padx=30, fill=tk.X)
+playlist_var = tk.BooleanVar(value=False)
+tk.Checkbutton(playlist_frame, text="整个播放列表/频道", variable=playlist_var, font=default_font).pack(side=tk.LEFT)
+tk.Label(playlist_frame, text="范围:", font=default_font).pack(side=tk.LEFT, padx=(10, 0))
+playlist_items_entry = tk.Entry(playlist_frame, width=8, font=default_font, relief="flat")  # 如 1-50,60
+playlist_items_entry.pack(side=tk.LEFT, padx=(5, 0))
+tk.Label(playlist_frame, text="起始日期:", font=default_font).pack(side=tk.LEFT, padx=(10, 0))
+date_after_entry = tk.Entry(playlist_frame, width=9, font=default_font, relief="flat")  # YYYYMMDD
+date_after_entry.pack(side=tk.LEFT, padx=(5, 0))
+
+# 3.1.2 片段模式：只下载其中一段，都留空时下载整个视频
+section_frame = tk.Frame(options_frame)
+section_frame.pack(pady=5, padx=30, fill=tk.X)
+tk.Label(section_frame, text="片段:  开始", font=default_font).pack(side=tk.LEFT)
+section_start_entry = tk.Entry(section_frame, width=9, font=default_font, relief="flat")  # 如 1:02:03
+section_start_entry.pack(side=tk.LEFT, padx=(5, 0))
+tk.Label(section_frame, text="结束", font=default_font).pack(side=tk.LEFT, padx=(10, 0))
+section_end_entry = tk.Entry(section_frame, width=9, font=default_font, relief="flat")
+section_end_entry.pack(side=tk.LEFT, padx=(5, 0))
+
 # 3.2 保存路径选择
 tk.Label(options_frame, text="第三步：保存位置", font=label_font).pack(pady=(15, 5))
 path_frame = tk.Frame(options_frame)
@@ -747,7 +616,167 @@ log_area = scrolledtext.ScrolledText(log_frame, height=8, font=("Courier", 12),
                                      relief="flat", highlightthickness=1)
 log_area.pack(fill=tk.BOTH, expand=True)
 
+# 6. 下载队列 (日志上方)
+job_frame = tk.Frame(window)
+job_frame.pack(side=tk.BOTTOM, fill=tk.BOTH, padx=20)
+
+job_header = tk.Frame(job_frame)
+job_header.pack(fill=tk.X, pady=(0, 5))
+queue_label = tk.Label(job_header, text="下载队列：", font=("Arial", 12))
+queue_label.pack(side=tk.LEFT)
+
+def stop_recordings(event=None):
+    """停止选中的直播录制任务（没选中时停止全部），已经录好的文件保留"""
+    selected = set(job_tree.selection())
+    jobs = [j for j in list(scheduler.jobs) if j.live and (not selected or j.id in selected)]
+    if not any([scheduler.stop_recording(j) for j in jobs]):
+        log("⚠️ 没有正在录制的直播")
+
+stop_label = tk.Label(job_header, text="⏹ 停止录制", font=("Arial", 12), cursor="hand2", padx=6)
+stop_label.pack(side=tk.LEFT)
+stop_label.bind("<Button-1>", stop_recordings)
+stop_label.bind("<Enter>", on_enter)
+stop_label.bind("<Leave>", on_leave)
+
+app_config = ConfigManager.load()
+parallel_var = tk.IntVar(value=app_config.get("max_parallel_downloads", MAX_PARALLEL_DOWNLOADS))
+
+def on_parallel_change(*args):
+    try:
+        n = parallel_var.get()
+    except tk.TclError:
+        return
+    scheduler.set_max_downloads(n)
+    app_config["max_parallel_downloads"] = n
+    ConfigManager.save(app_config)
+
+parallel_spin = tk.Spinbox(job_header, from_=1, to=8, width=3, textvariable=parallel_var,
+                           command=on_parallel_change, font=("Arial", 12), relief="flat")
+parallel_spin.pack(side=tk.RIGHT)
+tk.Label(job_header, text="同时下载数：", font=("Arial", 12)).pack(side=tk.RIGHT)
+
+# 分段加速：大文件拆成多个 Range 连接并发下载，中断后可续传
+segmented_var = tk.BooleanVar(value=app_config.get("segmented_download", False))
+
+def on_segmented_change():
+    engine.segment_workers = app_config.get("segment_workers", 4) if segmented_var.get() else 0
+    app_config["segmented_download"] = segmented_var.get()
+    ConfigManager.save(app_config)
+
+segmented_check = tk.Checkbutton(job_header, text="分段加速", variable=segmented_var,
+                                 command=on_segmented_change, font=("Arial", 12))
+segmented_check.pack(side=tk.RIGHT, padx=(0, 15))
+
+# 音视频并行：两路流同时下载，音频不必排在视频后面
+parallel_streams_var = tk.BooleanVar(value=app_config.get("parallel_streams", True))
+
+def on_parallel_streams_change():
+    engine.parallel_streams = parallel_streams_var.get()
+    app_config["parallel_streams"] = parallel_streams_var.get()
+    ConfigManager.save(app_config)
+
+parallel_streams_check = tk.Checkbutton(job_header, text="音视频并行", variable=parallel_streams_var,
+                                        command=on_parallel_streams_change, font=("Arial", 12))
+parallel_streams_check.pack(side=tk.RIGHT, padx=(0, 15))
+on_parallel_streams_change()
+
+# 流式合并：下载数据直接喂给 FFmpeg 合并/转码，不写中间文件
+streaming_var = tk.BooleanVar(value=app_config.get("streaming_postprocess", False))
+
+def on_streaming_change():
+    engine.streaming_postprocess = streaming_var.get()
+    app_config["streaming_postprocess"] = streaming_var.get()
+    ConfigManager.save(app_config)
+
+streaming_check = tk.Checkbutton(job_header, text="流式合并", variable=streaming_var,
+                                 command=on_streaming_change, font=("Arial", 12))
+streaming_check.pack(side=tk.RIGHT, padx=(0, 15))
+on_streaming_change()
+engine.segment_size = int(app_config.get("segment_size_mb", 10) * 1024 * 1024)
+# 格式选择条件，没有界面控件，可在配置文件里修改
+if app_config.get("max_filesize_mb"):
+    engine.max_filesize = int(app_config["max_filesize_mb"] * 1024 * 1024)
+engine.max_bitrate = app_config.get("max_bitrate_kbps")
+engine.codec_preference = tuple(app_config.get("codec_preference", engine.DEFAULT_CODEC_PREFERENCE))
+# 下载指标导出和停滞检测，同样只在配置文件里设置
+engine.metrics_file = app_config.get("metrics_file")
+engine.stall_seconds = app_config.get("stall_seconds", engine.DEFAULT_STALL_SECONDS)
+engine.stall_speed = app_config.get("stall_speed_kb", engine.DEFAULT_STALL_SPEED / 1024) * 1024
+# 输出文件：临时目录（下载和合并在这里进行，完成后移到保存目录）、写缓冲、磁盘保留空间（0 = 不检查）
+if app_config.get("temp_dir"):
+    engine.temp_dir = os.path.expanduser(app_config["temp_dir"])
+engine.write_buffer_size = int(app_config.get("write_buffer_kb", engine.DEFAULT_WRITE_BUFFER / 1024) * 1024)
+engine.preallocate = app_config.get("preallocate", True)
+min_free_space_mb = app_config.get("min_free_space_mb", engine.DEFAULT_MIN_FREE_SPACE / 1024 / 1024)
+if min_free_space_mb:
+    engine.disk_space.min_free = int(min_free_space_mb * 1024 * 1024)
+else:
+    engine.disk_space = None
+# 本地媒体缓存：cache_dir 设为多人共用的目录（如 /Users/Shared/ytdl-cache），同一视频同一格式只下载一次
+if app_config.get("cache_dir"):
+    engine.set_media_cache(os.path.expanduser(app_config["cache_dir"]),
+                           int(app_config.get("cache_size_gb", 20) * 1024 ** 3))
+# 字幕、封面、元数据：write_* 保存为单独的文件，embed_* 合并时一起嵌入视频
+engine.subtitle_langs = list(app_config.get("subtitle_langs", engine.subtitle_langs))
+for key in ("write_subtitles", "embed_subtitles", "write_thumbnail", "embed_thumbnail",
+            "write_info_json", "embed_metadata"):
+    setattr(engine, key, bool(app_config.get(key, False)))
+# 直播录制：每个文件的时长（分钟）
+engine.live_segment_seconds = int(app_config.get("live_segment_minutes", engine.DEFAULT_ROLL_SECONDS / 60) * 60)
+# 仅音频的输出格式：mp3（默认，需要转码）、m4a（AAC 直接封装，不转码）、original（保留原编码）
+if app_config.get("audio_format") in remux.AUDIO_FORMATS:
+    engine.audio_format = app_config["audio_format"]
+on_segmented_change()
+
+# 总限速：所有任务合计的速率上限（如 2M），留空不限；单任务上限和按时段规则在配置文件里设置
+rate_limit_var = tk.StringVar(value=app_config.get("rate_limit", ""))
+
+def on_rate_limit_change(*args):
+    try:
+        rate = bandwidth.parse_rate(rate_limit_var.get())
+        schedule = bandwidth.parse_schedule(app_config.get("rate_schedule"))
+        engine.job_rate_limit = bandwidth.parse_rate(app_config.get("job_rate_limit"))
+    except ValueError as e:
+        log(f"⚠️ 限速设置无效: {e}")
+        return
+    engine.bandwidth.configure(rate, schedule)
+    app_config["rate_limit"] = rate_limit_var.get().strip()
+    ConfigManager.save(app_config)
+    if engine.bandwidth.rate:
+        log(f"🚦 当前总限速 {engine.format_bytes(engine.bandwidth.rate)}/s")
+
+rate_limit_entry = tk.Entry(job_header, textvariable=rate_limit_var, width=6, font=("Arial", 12), relief="flat")
+rate_limit_entry.pack(side=tk.RIGHT, padx=(0, 15))
+rate_limit_entry.bind("<Return>", on_rate_limit_change)
+rate_limit_entry.bind("<FocusOut>", on_rate_limit_change)
+tk.Label(job_header, text="总限速：", font=("Arial", 12)).pack(side=tk.RIGHT)
+on_rate_limit_change()
+
+job_tree = ttk.Treeview(job_frame, columns=("title", "quality", "state", "progress", "speed", "eta"),
+                        show="headings", height=5)
+job_tree.heading("title", text="视频")
+job_tree.heading("quality", text="画质")
+job_tree.heading("state", text="状态")
+job_tree.heading("progress", text="进度")
+job_tree.heading("speed", text="速度")
+job_tree.heading("eta", text="剩余")
+job_tree.column("title", width=200)
+job_tree.column("quality", width=110)
+job_tree.column("state", width=70, anchor="center")
+job_tree.column("progress", width=120, anchor="center")
+job_tree.column("speed", width=80, anchor="center")
+job_tree.column("eta", width=60, anchor="center")
+job_tree.pack(fill=tk.BOTH, expand=True)
+
+scheduler = DownloadScheduler(on_job_update, max_downloads=parallel_var.get(), on_progress=on_job_update,
+                              on_playlist=on_playlist_update)
+
+engine.set_log_handler(log_channel.write)
 log("程序已就绪，请粘贴链接或点击按钮开始。")
+# 上次崩溃/关闭时还没完成的任务，重新加入队列
+scheduler.resume_journal()
+window.after_idle(lambda: log(f"⚡ 界面就绪耗时 {time.perf_counter() - LAUNCH_TIME:.2f}s"))
+flush_log_channel()
 
 # 初始化UI主题
 apply_theme()
@@ -0,0 +1,53 @@
+"""下载记录：按 "提取器 视频ID" 记录已下载的视频，重复粘贴同一视频时直接跳过
+
+存储用 SQLite（WAL 模式），主键索引查询，十万条记录也是毫秒内完成；
+多个下载线程、GUI 和命令行进程同时读写都是安全的。
+接口兼容 yt-dlp 的 download_archive 参数（支持 `in` 和 `add`）。
+"""
+import sqlite3
+import threading
+import time
+
+
+class DownloadArchive:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # sqlite 连接不能跨线程共用，每个线程一个
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS archive (
+                                id TEXT PRIMARY KEY,
+                                added_at REAL NOT NULL
+                            ) WITHOUT ROWID""")
+            self._local.conn = conn
+        return conn
+
+    # yt-dlp 用 `if not self.archive` 判断是否启用，不需要为此去数行数
+    def __bool__(self):
+        return True
+
+    def __contains__(self, vid_id):
+        if not vid_id:
+            return False
+        return self._conn().execute("SELECT 1 FROM archive WHERE id = ?", (vid_id,)).fetchone() is not None
+
+    def add(self, vid_id):
+        """记录一条下载，单条 INSERT 自成事务，重复记录直接忽略"""
+        self._conn().execute("INSERT OR IGNORE INTO archive (id, added_at) VALUES (?, ?)", (vid_id, time.time()))
+
+    def remove(self, vid_id):
+        self._conn().execute("DELETE FROM archive WHERE id = ?", (vid_id,))
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
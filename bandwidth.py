@@ -0,0 +1,206 @@
+"""带宽限制：令牌桶实现的全局总速率 + 单任务上限 + 按时段切换的速率
+
+所有任务共用一个全局桶，每个任务另有一个可选的单任务桶；读到的每块数据同时从两个桶
+取令牌，等待时间取两者中较长的。空闲或被单任务上限卡住的任务不会再从全局桶取令牌，
+省下的额度自然留给其他正在下载的任务，总速率保持在上限附近。
+只依赖标准库，可以直接对本地 HTTP 服务测试。
+"""
+import re
+import threading
+import time
+
+# 限速时每次最多读这么多，避免一次读入大块数据造成突发
+THROTTLE_CHUNK = 64 * 1024
+# 每次读取的块大小按连接的实际速度调整，大约每 READ_SLICE_SECONDS 秒读完一块：
+# 慢速连接上一次大块读取会阻塞很久，期间没有进度回调，停滞检测也就无从发现
+READ_SLICE_SECONDS = 0.5
+MIN_READ_SLICE = 4 * 1024
+MAX_READ_SLICE = 1024 * 1024
+# 桶容量（秒）：空闲后最多允许突发这么多秒的量
+DEFAULT_BURST = 1.0
+# 每隔多久检查一次时段规则
+SCHEDULE_CHECK_INTERVAL = 30
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(text):
+    """'500K' / '1.5M' / '2000000' -> 每秒字节数；'0'、'none'、空字符串表示不限速，返回 None"""
+    if text is None or isinstance(text, (int, float)):
+        return text or None
+    text = text.strip().upper()
+    if text in ("", "0", "NONE", "UNLIMITED"):
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?)(?:I?B)?(?:/S)?", text)
+    if not match:
+        raise ValueError(f"无法识别的速率: {text}，示例: 500K、1.5M")
+    return int(float(match.group(1)) * _UNITS[match.group(2)]) or None
+
+
+def _parse_clock(text):
+    hours, _, minutes = text.strip().partition(":")
+    if not (hours.isdigit() and (minutes or "0").isdigit()) or int(hours) > 24 or int(minutes or 0) > 59:
+        raise ValueError(f"无法识别的时间: {text}，示例: 09:00")
+    return int(hours) * 60 + int(minutes or 0)
+
+
+def parse_schedule(specs):
+    """['09:00-18:00=1M', '18:00-09:00=0'] -> [(开始分钟, 结束分钟, 速率), ...]
+
+    结束时间早于开始时间表示跨过午夜；按顺序匹配，第一条命中的生效，都不命中时用默认速率
+    """
+    schedule = []
+    for spec in specs or []:
+        window, sep, rate = spec.partition("=")
+        start, dash, end = window.partition("-")
+        if not sep or not dash:
+            raise ValueError(f"无法识别的时段规则: {spec}，示例: 09:00-18:00=1M")
+        schedule.append((_parse_clock(start), _parse_clock(end), parse_rate(rate)))
+    return schedule
+
+
+def scheduled_rate(schedule, default, now=None):
+    t = time.localtime(now)
+    minute = t.tm_hour * 60 + t.tm_min
+    for start, end, rate in schedule:
+        if start <= minute < end if start <= end else (minute >= start or minute < end):
+            return rate
+    return default
+
+
+class TokenBucket:
+    """rate 为每秒字节数，None 表示不限；令牌可以透支，透支多少就要等多久补回来"""
+    def __init__(self, rate, burst=DEFAULT_BURST):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self._tokens = rate * burst if rate else 0
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.rate * self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            # 速率变了，之前的透支按旧速率算已经没有意义，从空桶重新开始
+            self._tokens = max(0, min(self._tokens, rate * self.burst)) if rate else 0
+
+    def reserve(self, n):
+        """取走 n 个令牌，返回需要等待的秒数"""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._refill()
+            self._tokens -= n
+            return max(0.0, -self._tokens / self.rate)
+
+
+class BandwidthManager:
+    """全局带宽管理，每个下载任务通过 limiter() 拿到自己的 Limiter"""
+    def __init__(self, rate=None, schedule=None):
+        self.default_rate = rate
+        self.schedule = schedule or []
+        self._bucket = TokenBucket(None)
+        self._lock = threading.Lock()
+        self._checked = 0
+        self.stats = {"bytes": 0, "throttled_seconds": 0.0}
+        self._apply()
+
+    def configure(self, rate=None, schedule=None):
+        self.default_rate = rate
+        self.schedule = schedule or []
+        self._apply()
+
+    @property
+    def rate(self):
+        """当前生效的全局速率，None 表示不限"""
+        return self._bucket.rate
+
+    def _apply(self):
+        self._checked = time.monotonic()
+        rate = scheduled_rate(self.schedule, self.default_rate)
+        if rate != self._bucket.rate:
+            self._bucket.set_rate(rate)
+
+    def limiter(self, rate=None):
+        return Limiter(self, rate)
+
+    def _consume(self, n, job_bucket):
+        if self.schedule and time.monotonic() - self._checked >= SCHEDULE_CHECK_INTERVAL:
+            self._apply()
+        wait = self._bucket.reserve(n)
+        if job_bucket is not None:
+            wait = max(wait, job_bucket.reserve(n))
+        with self._lock:
+            self.stats["bytes"] += n
+            self.stats["throttled_seconds"] += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class Limiter:
+    """单个任务的限速器，任务内的所有连接（分段、音视频两路流）共用
+
+    也负责断开重连：reconnect() 之后，之前打开的连接下次读取时抛出 reconnect_error，
+    由下载器的重试逻辑从断开处续传
+    """
+    def __init__(self, manager, rate=None):
+        self.manager = manager
+        self.bucket = TokenBucket(rate) if rate else None
+        self.bytes = 0  # 经过这个限速器的字节数
+        self.waited = 0.0  # 因限速累计等待的秒数
+        self.reconnect_error = ConnectionResetError
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return bool(self.manager.rate or self.bucket is not None)
+
+    def consume(self, n):
+        wait = self.manager._consume(n, self.bucket)
+        with self._lock:
+            self.bytes += n
+            self.waited += wait
+
+    def reconnect(self):
+        self._generation += 1
+
+    def wrap(self, response):
+        """让 response.read 按限速读取，返回同一个 response"""
+        read = response.read
+        generation = self._generation
+        read_slice = [MIN_READ_SLICE]  # 先小块试探，快的连接读一次就会放大
+
+        def read_piece(amt):
+            if generation != self._generation:
+                response.close()
+                raise self.reconnect_error("连接已断开，重新连接")
+            amt = min(amt, read_slice[0], THROTTLE_CHUNK if self.active else amt)
+            start = time.monotonic()
+            data = read(amt)
+            if data:
+                elapsed = max(time.monotonic() - start, 1e-3)
+                read_slice[0] = max(MIN_READ_SLICE, min(MAX_READ_SLICE, int(len(data) / elapsed * READ_SLICE_SECONDS)))
+                self.consume(len(data))
+            return data
+
+        def throttled_read(amt=None):
+            if amt is not None:
+                return read_piece(amt)
+            # read() 读到结尾：同样分块读、逐块取令牌，不能一次读完再记账绕过限速
+            pieces = []
+            while True:
+                data = read_piece(MAX_READ_SLICE)
+                if not data:
+                    return b"".join(pieces)
+                pieces.append(data)
+
+        response.read = throttled_read
+        return response
@@ -0,0 +1,645 @@
+"""性能基准：对本地测试服务器跑解析、下载、后期处理各阶段，输出耗时、吞吐量和内存峰值，并和保存的基线对比
+
+用法:
+    python benchmark.py                              # 跑全部场景，输出表格
+    python benchmark.py -s merge -s segmented -r 5   # 只跑指定场景，每个跑 5 次取中位数
+    python benchmark.py --save baseline.json         # 保存结果作为基线
+    python benchmark.py --compare baseline.json      # 和基线对比，变慢超过阈值时返回 1
+
+本地 HTTP 服务器（支持 Range）提供 FFmpeg 生成的合成媒体：音视频一体的 MP4、DASH 格式的
+分片 MP4 直链（带 sidx 索引）、DASH 分片、HLS 直播（按时间滑动的播放列表）、字幕和封面，
+以及按格式组合生成的伪造 info JSON。
+每次运行都在单独的子进程里，内存峰值互不影响；子进程走真实的调度器 → run_download_task → 格式选择 → 下载 → 后期处理流程，
+不联网。合成媒体按参数缓存在临时目录，多次运行使用同一份文件，结果可以相互比较。
+"""
+import argparse
+import http.server
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+import engine
+import live
+
+FIXTURE_VERSION = 4
+DEFAULT_DURATION = 30  # 合成媒体时长（秒）
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 10.0  # 变化超过这个百分比才算回退/提升
+SEGMENT_SECONDS = 2  # DASH / HLS 分片时长，也是关键帧间隔
+# 模拟直播：按这个倍速发布新分片，播放列表里保留最近 LIVE_WINDOW 个分片
+LIVE_SPEEDUP = 4
+LIVE_WINDOW = 6
+
+# 各格式组合包含的 format_id，对应 fixture_formats 里的定义
+FORMAT_SETS = {
+    "progressive": ["18"],
+    "dash": ["137", "140", "18"],
+    "fragments": ["dash-v", "dash-a"],
+    "live": ["hls"],
+}
+
+SCENARIOS = {
+    "progressive": {"desc": "单文件直链，音视频一体，无需合并", "formats": "progressive"},
+    "generic": {"desc": "通用提取器解析直链（真实解析流程）后下载", "media": "progressive.mp4"},
+    "merge": {"desc": "DASH 视频+音频两路直链，下载后合并", "formats": "dash", "ffmpeg": True},
+    "parallel": {"desc": "两路流同时下载，完成后合并", "formats": "dash", "ffmpeg": True,
+                 "engine": {"parallel_streams": True}},
+    "segmented": {"desc": "分段并发下载（4 连接）后合并", "formats": "dash", "ffmpeg": True,
+                  "engine": {"segment_workers": 4, "segment_size": 1024 * 1024}},
+    "streaming": {"desc": "边下载边通过管道合并，不写中间文件", "formats": "dash", "ffmpeg": True,
+                  "engine": {"streaming_postprocess": True}},
+    "fragments": {"desc": "DASH 分片（yt-dlp 分片下载器）下载后合并", "formats": "fragments", "ffmpeg": True},
+    "audio": {"desc": "仅音频，转码 MP3", "formats": "dash", "quality": "audio", "ffmpeg": True},
+    "audio-m4a": {"desc": "仅音频，AAC 直接封装为 m4a（不转码）", "formats": "dash", "quality": "audio", "ffmpeg": True,
+                  "engine": {"audio_format": "m4a"}},
+    "batch": {"desc": "4 个任务排队，下载和合并在流水线里重叠", "formats": "dash", "ffmpeg": True, "jobs": 4},
+    "scratch": {"desc": "下载和合并在单独的临时目录进行，完成后移到保存目录", "formats": "dash", "ffmpeg": True,
+                "temp_dir": True},
+    "sidecars": {"desc": "字幕、封面和视频同时下载，合并时一起嵌入字幕、封面和章节", "formats": "dash", "ffmpeg": True,
+                 "engine": {"embed_subtitles": True, "embed_thumbnail": True, "embed_metadata": True,
+                            "subtitle_langs": ["en", "zh-Hans"]}},
+    # section 是占视频时长的比例，对照 merge / fragments 看下载量
+    "section": {"desc": "只下载中间 1/3：按 sidx 索引请求字节范围，合并时剪切", "formats": "dash", "ffmpeg": True,
+                "section": (1 / 3, 2 / 3)},
+    "section-fragments": {"desc": "只下载中间 1/3：只下载覆盖这段的 DASH 分片", "formats": "fragments",
+                          "ffmpeg": True, "section": (1 / 3, 2 / 3)},
+    "live": {"desc": f"录制 HLS 直播（{LIVE_SPEEDUP} 倍速发布分片），每 10 秒一个文件", "formats": "live",
+             "ffmpeg": True, "engine": {"live_segment_seconds": 10}},
+}
+
+# (键, 名称, 单位, 越大越好, 噪声下限)：变化量小于噪声下限的不算回退
+METRICS = [
+    ("extract", "解析", "s", False, 0.05),
+    ("download", "下载", "s", False, 0.05),
+    ("postprocess", "后期处理", "s", False, 0.05),
+    ("total", "总耗时", "s", False, 0.05),
+    ("throughput", "吞吐量", "B/s", True, 0),
+    ("bytes", "下载量", "B", False, 64 * 1024),
+    ("cpu", "CPU", "s", False, 0.05),
+    ("children_cpu", "FFmpeg CPU", "s", False, 0.05),
+    ("rss", "内存峰值", "MB", False, 2),
+]
+
+
+# --- 合成媒体 ---
+
+def fixture_dir(root, duration, ffmpeg):
+    return os.path.join(root, f"v{FIXTURE_VERSION}-{duration}s" + ("" if ffmpeg else "-raw"))
+
+
+def generate_fixtures(directory, duration, ffmpeg):
+    """生成合成媒体（已生成过的直接复用），返回 fixtures.json 的内容
+
+    参数固定、单线程编码、bitexact，同一版本的 FFmpeg 每次生成的文件完全相同
+    """
+    manifest_path = os.path.join(directory, "fixtures.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    print(f"正在生成合成媒体 ({duration}s) -> {directory}")
+    files = {}
+    if ffmpeg:
+        bitexact = ["-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact"]
+        video = ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-threads", "1",
+                 "-g", str(SEGMENT_SECONDS * 30), "-keyint_min", str(SEGMENT_SECONDS * 30), "-sc_threshold", "0"]
+        # 分片 MP4，和 YouTube 的 DASH 格式一样可以边收边解析，文件头里有 sidx 索引
+        fragmented = ["-movflags", "frag_keyframe+empty_moov+default_base_moof+global_sidx"]
+
+        def run(*args):
+            subprocess.run([ffmpeg, "-hide_banner", "-loglevel", "error", "-y", *args],
+                           check=True, cwd=directory)
+
+        run("-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={duration}",
+            *video, "-b:v", "2M", "-maxrate", "2M", "-bufsize", "4M", "-an", *fragmented, *bitexact, "video.mp4")
+        run("-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}",
+            "-c:a", "aac", "-b:a", "128k", "-vn", *fragmented, "-frag_duration", str(SEGMENT_SECONDS * 1000000),
+            *bitexact, "audio.m4a")
+        run("-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=30:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}",
+            *video, "-b:v", "600k", "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", *bitexact, "progressive.mp4")
+        os.makedirs(os.path.join(directory, "dash"))
+        run("-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=1", "-frames:v", "1", "-c:v", "libwebp",
+            *bitexact, "thumbnail.webp")
+        run("-i", "video.mp4", "-i", "audio.m4a", "-map", "0:v", "-map", "1:a", "-c", "copy",
+            "-f", "dash", "-seg_duration", str(SEGMENT_SECONDS), "-use_timeline", "0", *bitexact,
+            os.path.join("dash", "manifest.mpd"))
+        names = sorted(os.listdir(os.path.join(directory, "dash")))
+        for stream in ("0", "1"):
+            # 第一个分片是初始化段，DASH 分片下载器会把所有分片按顺序拼成一个文件
+            files[f"dash/stream{stream}"] = [f"dash/init-stream{stream}.m4s"] + [
+                f"dash/{n}" for n in names if n.startswith(f"chunk-stream{stream}-")]
+        # HLS 分片（TS），直播的播放列表由服务器按时间生成
+        os.makedirs(os.path.join(directory, "live"))
+        run("-i", "progressive.mp4", "-c", "copy", "-f", "hls", "-hls_time", str(SEGMENT_SECONDS),
+            "-hls_list_size", "0", "-hls_segment_filename", os.path.join("live", "seg%03d.ts"), *bitexact,
+            os.path.join("live", "index.m3u8"))
+        with open(os.path.join(directory, "live", "index.m3u8"), encoding="utf-8") as f:
+            playlist = live.parse_playlist(f.read(), "live/index.m3u8")
+        files["live"] = [[s.uri, s.duration] for s in playlist.segments]
+    else:
+        # 没有 FFmpeg 时只能生成随机数据，只用于不需要合并的场景
+        rng = random.Random(duration)
+        with open(os.path.join(directory, "progressive.mp4"), "wb") as f:
+            for _ in range(duration):
+                f.write(rng.randbytes(96 * 1024))
+    for lang in ("en", "zh-Hans"):
+        # 每 SEGMENT_SECONDS 秒一条字幕
+        cues = [f"{t // 60:02d}:{t % 60:02d}.000 --> {(t + SEGMENT_SECONDS) // 60:02d}:{(t + SEGMENT_SECONDS) % 60:02d}.000\n"
+                f"{lang} {t // SEGMENT_SECONDS + 1}\n" for t in range(0, duration, SEGMENT_SECONDS)]
+        with open(os.path.join(directory, f"subtitles.{lang}.vtt"), "w", encoding="utf-8") as f:
+            f.write("WEBVTT\n\n" + "\n".join(cues))
+    for name in ("video.mp4", "audio.m4a", "progressive.mp4", "thumbnail.webp", "subtitles.en.vtt", "subtitles.zh-Hans.vtt"):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            files[name] = os.path.getsize(path)
+    manifest = {"version": FIXTURE_VERSION, "duration": duration, "ffmpeg": ffmpeg_version(ffmpeg), "files": files}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+
+def ffmpeg_version(ffmpeg):
+    if not ffmpeg:
+        return None
+    output = subprocess.run([ffmpeg, "-version"], capture_output=True, text=True).stdout
+    return output.splitlines()[0] if output else None
+
+
+def fixture_formats(base_url, directory, manifest):
+    """format_id -> yt-dlp 格式字典，地址指向本地服务器"""
+    duration = manifest["duration"]
+    files = manifest["files"]
+    formats = {}
+
+    def direct(format_id, name, **fields):
+        if name in files:
+            size = files[name]
+            formats[format_id] = dict(fields, format_id=format_id, url=f"{base_url}/media/{name}",
+                                      filesize=size, tbr=round(size * 8 / duration / 1000, 1))
+
+    direct("18", "progressive.mp4", ext="mp4", width=640, height=360, fps=30,
+           vcodec="avc1.42c01e", acodec="mp4a.40.2")
+    direct("137", "video.mp4", ext="mp4", container="mp4_dash", width=1280, height=720, fps=30,
+           vcodec="avc1.42c01f", acodec="none")
+    direct("140", "audio.m4a", ext="m4a", container="m4a_dash", abr=128, asr=44100,
+           vcodec="none", acodec="mp4a.40.2")
+    if "live" in files:
+        size = sum(os.path.getsize(os.path.join(directory, p)) for p, _ in files["live"])
+        formats["hls"] = dict(format_id="hls", protocol="m3u8_native", ext="mp4", width=640, height=360, fps=30,
+                              vcodec="avc1.42c01e", acodec="mp4a.40.2", tbr=round(size * 8 / duration / 1000, 1),
+                              url=f"{base_url}/live/{{video_id}}/index.m3u8")
+    for format_id, stream, fields in (
+            ("dash-v", "dash/stream0", dict(ext="mp4", width=1280, height=720, fps=30,
+                                            vcodec="avc1.42c01f", acodec="none")),
+            ("dash-a", "dash/stream1", dict(ext="m4a", abr=128, vcodec="none", acodec="mp4a.40.2"))):
+        if stream in files:
+            paths = files[stream]
+            size = sum(os.path.getsize(os.path.join(directory, p)) for p in paths)
+            formats[format_id] = dict(
+                fields, format_id=format_id, protocol="http_dash_segments",
+                url=f"{base_url}/media/dash/manifest.mpd", manifest_url=f"{base_url}/media/dash/manifest.mpd",
+                fragment_base_url=f"{base_url}/media/",
+                fragments=[{"path": p} for p in paths[:1]] + [{"path": p, "duration": SEGMENT_SECONDS} for p in paths[1:]],
+                filesize=size, tbr=round(size * 8 / duration / 1000, 1))
+    return formats
+
+
+def build_info(base_url, directory, manifest, format_set, video_id):
+    """伪造的 info JSON，和提取器返回的结构一致"""
+    formats = fixture_formats(base_url, directory, manifest)
+    files = manifest["files"]
+    duration = manifest["duration"]
+    info = {
+        "id": video_id,
+        "title": f"bench-{video_id}",
+        "duration": duration,
+        "formats": [dict(formats[f], url=formats[f]["url"].format(video_id=video_id))
+                    for f in FORMAT_SETS[format_set] if f in formats],
+        "subtitles": {lang: [{"ext": "vtt", "url": f"{base_url}/media/subtitles.{lang}.vtt"}]
+                      for lang in ("en", "zh-Hans") if f"subtitles.{lang}.vtt" in files},
+        "thumbnails": [{"url": f"{base_url}/media/thumbnail.webp", "width": 1280, "height": 720}]
+                      if "thumbnail.webp" in files else [],
+        "chapters": [{"start_time": t, "end_time": min(t + 10, duration), "title": f"第 {t // 10 + 1} 段"}
+                     for t in range(0, duration, 10)],
+        "extractor": "benchmark",
+        "extractor_key": "Benchmark",
+        "webpage_url": f"{base_url}/watch/{video_id}",
+        "webpage_url_basename": video_id,
+        "webpage_url_domain": urlparse(base_url).hostname,
+    }
+    if format_set == "live":
+        info.update(duration=None, chapters=[], is_live=True, live_status="is_live")
+    return info
+
+
+# --- 本地服务器 ---
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    """/media/<文件> 提供合成媒体（支持 Range），/info/<格式组合>/<视频ID>.json 提供伪造的 info JSON，
+    /live/<视频ID>/index.m3u8 是模拟直播的播放列表：第一次请求时开播，之后按 LIVE_SPEEDUP 倍速出现新分片
+    """
+    protocol_version = "HTTP/1.1"
+    CONTENT_TYPES = {".mp4": "video/mp4", ".m4a": "audio/mp4", ".m4s": "video/mp4",
+                     ".mpd": "application/dash+xml", ".json": "application/json", ".webp": "image/webp",
+                     ".vtt": "text/vtt", ".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/mp2t"}
+
+    def setup(self):
+        super().setup()
+        # 和真实的服务器一样关掉 Nagle，否则长连接上响应头和响应体分两次写时会多等一个延迟确认
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _serve(self, head=False):
+        path = urlparse(self.path).path
+        server = self.server
+        match = re.fullmatch(r"/info/(\w+)/([\w.-]+)\.json", path)
+        if match and match.group(1) in FORMAT_SETS:
+            body = json.dumps(build_info(server.base_url, server.directory, server.manifest, *match.groups())).encode()
+            self._send_headers(200, ".json", len(body))
+            if not head:
+                self.wfile.write(body)
+            return
+        match = re.fullmatch(r"/live/([\w.-]+)/index\.m3u8", path)
+        if match and "live" in server.manifest["files"]:
+            body = self._live_playlist(match.group(1)).encode()
+            self._send_headers(200, ".m3u8", len(body))
+            if not head:
+                self.wfile.write(body)
+            return
+        name = os.path.normpath(path[len("/media/"):]) if path.startswith("/media/") else ""
+        file_path = os.path.join(server.directory, name)
+        if not name or name.startswith("..") or not os.path.isfile(file_path):
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(file_path)
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header or "")
+        if match and match.group(0) != "bytes=-":
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        partial = match is not None and match.group(0) != "bytes=-"
+        self._send_headers(206 if partial else 200, os.path.splitext(name)[1], end - start + 1,
+                           f"bytes {start}-{end}/{size}" if partial else None)
+        if head:
+            return
+        remaining = end - start + 1
+        try:
+            with open(file_path, "rb") as f:
+                f.seek(start)
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 256 * 1024))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端提前断开（如分段下载的探测请求）
+
+    def _live_playlist(self, video_id):
+        """按开播后经过的时间生成滑动窗口播放列表，所有分片都发布后加上 #EXT-X-ENDLIST"""
+        server = self.server
+        segments = server.manifest["files"]["live"]
+        with server.live_lock:
+            started = server.live_started.setdefault(video_id, time.time())
+        published = min(len(segments), 1 + int((time.time() - started) * LIVE_SPEEDUP / SEGMENT_SECONDS))
+        first = max(0, published - LIVE_WINDOW)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+                 f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+        for path, duration in segments[first:published]:
+            lines += [f"#EXTINF:{duration:.3f},", f"{server.base_url}/media/{path}"]
+        if published == len(segments):
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def _send_headers(self, status, ext, length, content_range=None):
+        self.send_response(status)
+        self.send_header("Content-Type", self.CONTENT_TYPES.get(ext, "application/octet-stream"))
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        if content_range:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+
+
+class FixtureServer(http.server.ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # 子进程退出时，连接池里的空闲长连接被直接断开，不算错误
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_server(directory, manifest):
+    server = FixtureServer(("127.0.0.1", 0), FixtureHandler)
+    server.directory = directory
+    server.manifest = manifest
+    server.live_started = {}  # 视频ID -> 开播时间
+    server.live_lock = threading.Lock()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server
+
+
+# --- 子进程：跑一次场景 ---
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_scenario(name, base_url, connection_pool=True):
+    """在当前进程里跑一次场景，返回结果字典（子进程入口）"""
+    scenario = SCENARIOS[name]
+    engine.connection_pool = connection_pool
+    for key, value in scenario.get("engine", {}).items():
+        setattr(engine, key, value)
+    # 每次都要真的下载，不查下载记录，也不写任务日志
+    engine.download_archive = None
+    engine.job_journal = None
+    if not engine.init_components(auto_install=False):
+        raise RuntimeError("yt-dlp 加载失败")
+    if scenario.get("ffmpeg") and not engine.ffmpeg_available:
+        raise RuntimeError("需要 FFmpeg")
+
+    times = {}  # job.id -> {状态: 时间}
+
+    def on_update(job):
+        times.setdefault(job.id, {})[job.state] = time.perf_counter()
+
+    jobs_count = scenario.get("jobs", 1)
+    save_path = tempfile.mkdtemp(prefix="ytdl-bench-")
+    engine.temp_dir = tempfile.mkdtemp(prefix="ytdl-bench-tmp-") if scenario.get("temp_dir") else None
+    scheduler = engine.DownloadScheduler(on_update, max_downloads=min(jobs_count, engine.MAX_PARALLEL_DOWNLOADS))
+    quality = engine.quality_from_preset(scenario.get("quality", "best"))
+    cpu_start = cpu_seconds(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    info_seconds = 0.0
+    jobs = []
+    try:
+        for i in range(jobs_count):
+            video_id = f"{name}-{i + 1}"
+            if "media" in scenario:
+                url = f"{base_url}/media/{scenario['media']}"
+            else:
+                # 伪造的 info JSON 代替联网解析，放进解析缓存，解析阶段会直接命中
+                url = f"{base_url}/watch/{video_id}"
+                t = time.perf_counter()
+                with urllib.request.urlopen(f"{base_url}/info/{scenario['formats']}/{video_id}.json") as r:
+                    info = json.load(r)
+                engine.info_cache.put(url, info)
+                info_seconds += time.perf_counter() - t
+            section = scenario.get("section")
+            if section:
+                section = tuple(round(t * info["duration"], 3) for t in section)
+            jobs.append(scheduler.submit(url, quality, save_path, section=section))
+        scheduler.wait()
+        total = time.perf_counter() - start
+        output_bytes = sum(os.path.getsize(os.path.join(save_path, n)) for n in os.listdir(save_path))
+        if engine.temp_dir and os.listdir(engine.temp_dir):
+            raise RuntimeError(f"临时目录里还有文件: {os.listdir(engine.temp_dir)}")
+    finally:
+        shutil.rmtree(save_path, ignore_errors=True)
+        if engine.temp_dir:
+            shutil.rmtree(engine.temp_dir, ignore_errors=True)
+
+    failed = [j for j in jobs if j.state != engine.JOB_DONE]
+    if failed:
+        raise RuntimeError(f"{failed[0].title}: {failed[0].error}")
+
+    def stage(begin, end):
+        # 没有后期处理阶段的任务（yt-dlp 没有留下待处理文件）直接从下载进入完成
+        spans = [(t.get(end) or t[engine.JOB_DONE]) - (t.get(begin) or t.get(end) or t[engine.JOB_DONE])
+                 for t in times.values()]
+        return statistics.mean(spans)
+
+    downloaded = sum(j.downloaded_bytes for j in jobs)
+    download_start = min(t[engine.JOB_DOWNLOADING] for t in times.values())
+    download_end = max(t.get(engine.JOB_POSTPROCESSING) or t[engine.JOB_DONE] for t in times.values())
+    return {
+        "format": jobs[0].format_spec,
+        "info_json": round(info_seconds / jobs_count, 4),
+        "extract": round(stage(engine.JOB_EXTRACTING, engine.JOB_DOWNLOADING) + info_seconds / jobs_count, 4),
+        "download": round(stage(engine.JOB_DOWNLOADING, engine.JOB_POSTPROCESSING), 4),
+        "postprocess": round(stage(engine.JOB_POSTPROCESSING, engine.JOB_DONE), 4),
+        "total": round(total, 4),
+        "bytes": downloaded,
+        "output_bytes": output_bytes,
+        "throughput": round(downloaded / (download_end - download_start)) if download_end > download_start else None,
+        "cpu": round(cpu_seconds(resource.RUSAGE_SELF) - cpu_start, 3),
+        "children_cpu": round(cpu_seconds(resource.RUSAGE_CHILDREN), 3),
+        # 子进程（FFmpeg）的内存峰值在 fork 时会算上父进程的内存，不准，只统计 CPU
+        "rss": max_rss_mb(),
+        "streams": jobs[0].stream_timings,
+        "http": engine.http_pool and engine.http_pool.snapshot(),
+        "yt_dlp": engine.yt_dlp.version.__version__,
+    }
+
+
+def run_worker(name, base_url, verbose, connection_pool=True):
+    """启动子进程跑一次场景，返回结果字典；失败时返回 {'error': ...}"""
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", name, "--base-url", base_url]
+    if not connection_pool:
+        cmd.append("--no-connection-pool")
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=None if verbose else subprocess.PIPE, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode == 0 and lines:
+        return json.loads(lines[-1])
+    tail = "\n".join((proc.stderr or "").strip().splitlines()[-10:])
+    return {"error": (lines[-1] if lines else f"子进程退出码 {proc.returncode}") + (f"\n{tail}" if tail else "")}
+
+
+# --- 汇总、保存、对比 ---
+
+def summarize(runs):
+    """多次运行取中位数，耗时类指标受调度抖动影响，中位数比平均值稳定"""
+    summary = {}
+    for key, *_ in METRICS + [("info_json",), ("output_bytes",)]:
+        values = [r[key] for r in runs if r.get(key) is not None]
+        if values:
+            summary[key] = round(statistics.median(values), 4)
+    summary["format"] = runs[0].get("format")
+    return summary
+
+
+def format_value(value, unit):
+    if value is None:
+        return "-"
+    if unit == "B/s":
+        return f"{engine.format_bytes(value)}/s"
+    if unit == "B":
+        return engine.format_bytes(value)
+    if unit == "s":
+        return f"{value:.3f}s"
+    return f"{value:.1f}{unit}"
+
+
+def print_table(results):
+    width = max([12] + [len(name) + 2 for name in results["scenarios"]])
+    header = f"{'场景':<{width}}" + "".join(f"{label:>14}" for _, label, *_ in METRICS)
+    print(header)
+    for name, result in results["scenarios"].items():
+        if "error" in result:
+            print(f"{name:<{width}}  ❌ {result['error'].splitlines()[0]}")
+            continue
+        median = result["median"]
+        print(f"{name:<{width}}" + "".join(f"{format_value(median.get(key), unit):>14}" for key, _, unit, *_ in METRICS))
+
+
+def compare(results, baseline, threshold):
+    """逐项和基线对比，返回回退的项数"""
+    regressions = 0
+    for field in ("fixtures", "yt_dlp", "python", "machine"):
+        if baseline["environment"].get(field) != results["environment"].get(field):
+            print(f"⚠️ 环境和基线不同 ({field}): {baseline['environment'].get(field)} -> "
+                  f"{results['environment'].get(field)}，对比结果仅供参考")
+    for name, result in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None or "error" in base or "error" in result:
+            continue
+        for key, label, unit, higher_better, noise in METRICS:
+            old, new = base["median"].get(key), result["median"].get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_better else change
+            mark = ""
+            if abs(new - old) > noise and abs(change) >= threshold:
+                mark = "⚠️ 回退" if worse > 0 else "✅ 提升"
+                regressions += worse > 0
+            if mark or abs(change) >= threshold / 2:
+                print(f"{name:<12}{label:<10}{format_value(old, unit):>14} -> {format_value(new, unit):<14}"
+                      f"{change:+7.1f}%  {mark}")
+    print(f"对比基线: {regressions} 项回退（阈值 {threshold:g}%）")
+    return regressions
+
+
+def environment(manifest, runs):
+    yt_dlp_version = next((r["yt_dlp"] for r in runs if r.get("yt_dlp")), None)
+    return {
+        "fixtures": f"v{manifest['version']}-{manifest['duration']}s ({manifest['ffmpeg'] or '随机数据'})",
+        "yt_dlp": yt_dlp_version,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {os.cpu_count()} 核",
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="对本地测试服务器跑解析/下载/后期处理基准")
+    parser.add_argument("-s", "--scenario", action="append", choices=list(SCENARIOS),
+                        help="只跑指定场景，可重复 (默认全部)")
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT, help="每个场景跑几次，取中位数")
+    parser.add_argument("--duration", type=int, default=DEFAULT_DURATION, help="合成媒体时长 (秒)")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "youtube_downloader_bench"),
+                        help="合成媒体缓存目录")
+    parser.add_argument("--save", metavar="FILE", help="把结果保存为基线")
+    parser.add_argument("--compare", metavar="FILE", help="和基线对比，有回退时返回 1")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="变化超过百分之多少算回退/提升 (默认 %(default)s)")
+    parser.add_argument("--list", action="store_true", help="列出全部场景")
+    parser.add_argument("-v", "--verbose", action="store_true", help="显示下载日志")
+    parser.add_argument("--no-connection-pool", action="store_true", help="不使用共享连接池，用于对比")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        try:
+            result = run_scenario(args.worker, args.base_url, not args.no_connection_pool)
+        except Exception as e:
+            print(str(e))
+            return 1
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:<12}{scenario['desc']}")
+        return 0
+
+    ffmpeg = engine.detect_ffmpeg()
+    directory = fixture_dir(args.fixtures, args.duration, ffmpeg)
+    manifest = generate_fixtures(directory, args.duration, ffmpeg)
+    server = start_server(directory, manifest)
+    names = args.scenario or list(SCENARIOS)
+    results = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "repeat": args.repeat, "scenarios": {}}
+    all_runs = []
+    try:
+        for name in names:
+            if SCENARIOS[name].get("ffmpeg") and not ffmpeg:
+                results["scenarios"][name] = {"error": "需要 FFmpeg，已跳过"}
+                continue
+            runs = []
+            for i in range(args.repeat):
+                run = run_worker(name, server.base_url, args.verbose, not args.no_connection_pool)
+                if "error" in run:
+                    results["scenarios"][name] = {"error": run["error"]}
+                    break
+                runs.append(run)
+                print(f"  {name} #{i + 1}: {run['total']:.3f}s", file=sys.stderr)
+            else:
+                all_runs += runs
+                results["scenarios"][name] = {"desc": SCENARIOS[name]["desc"], "median": summarize(runs), "runs": runs}
+    finally:
+        server.shutdown()
+    results["environment"] = environment(manifest, all_runs)
+
+    print_table(results)
+    for name, result in results["scenarios"].items():
+        if "error" in result and "\n" in result["error"]:
+            print(f"\n[{name}] {result['error']}")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"已保存基线: {args.save}")
+    failed = any("error" in r and r["error"] != "需要 FFmpeg，已跳过" for r in results["scenarios"].values())
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
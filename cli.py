@@ -0,0 +1,283 @@
+"""命令行 / 批量下载入口，和 GUI 共用 engine，不加载 Tk
+
+用法示例:
+    python cli.py -a urls.txt -q 1080 -o ~/Downloads
+    cat urls.txt | python cli.py -a - -q audio
+    python cli.py https://www.youtube.com/watch?v=xxxx
+    python cli.py --playlist --items 1-50 --date-after 20240101 https://www.youtube.com/@xxxx/videos
+    python cli.py --probe -a urls.txt
+    python cli.py --start 1:02:03 --end 1:02:33 https://www.youtube.com/watch?v=xxxx
+    python cli.py -q audio --audio-format original https://www.youtube.com/watch?v=xxxx   # 保留原音频编码，不转码
+    python cli.py --live-segment 30:00 https://www.youtube.com/watch?v=xxxx   # 直播/首映，Ctrl+C 停止录制
+    python cli.py --resume
+    python cli.py --startup-benchmark
+"""
+import time
+_start = time.perf_counter()
+
+import argparse
+import os
+import subprocess
+import sys
+
+import bandwidth
+import engine
+import remux
+import sections
+import storage
+
+ENGINE_IMPORT_TIME = time.perf_counter() - _start
+BENCHMARK_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def read_urls(args):
+    """从命令行参数和 URL 列表文件（'-' 表示 stdin）读取链接，忽略空行和 # 注释"""
+    urls = list(args.urls)
+    if args.batch_file:
+        f = sys.stdin if args.batch_file == "-" else open(args.batch_file, encoding="utf-8")
+        with f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    urls.append(line)
+    return urls
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="YouTube 极简下载器 - 命令行批量模式")
+    parser.add_argument("urls", nargs="*", help="视频链接")
+    parser.add_argument("-a", "--batch-file", help="URL 列表文件，每行一个链接，'-' 表示从 stdin 读取")
+    parser.add_argument("-q", "--quality", default="best",
+                        help="画质预设: best / audio / mp3 / 1080 / 720 ... (默认 best)")
+    parser.add_argument("--audio-format", choices=remux.AUDIO_FORMATS,
+                        help="仅音频时的输出格式: mp3（需要转码）/ m4a（AAC 直接封装）/ original（保留原编码，从不转码）"
+                             "（默认 mp3）")
+    parser.add_argument("-o", "--output", default=os.path.expanduser("~/Downloads"), help="保存目录")
+    parser.add_argument("--max-filesize", type=float, help="文件大小上限 (MB)，选不超过它的最高画质")
+    parser.add_argument("--max-bitrate", type=float, help="总码率上限 (kbps)，按带宽预算选格式")
+    parser.add_argument("--codecs", default=",".join(engine.DEFAULT_CODEC_PREFERENCE),
+                        help="视频编码偏好，靠前的优先 (默认 avc1,vp9,av1：解码开销从低到高)")
+    parser.add_argument("--limit-rate", help="所有任务合计的速率上限，如 2M、500K (默认不限)")
+    parser.add_argument("--job-limit-rate", help="单个任务的速率上限，空闲任务省下的额度会分给其他任务")
+    parser.add_argument("--limit-schedule", action="append", metavar="HH:MM-HH:MM=RATE",
+                        help="按时段设置总速率，如 09:00-18:00=1M，可重复；不在任何时段内时用 --limit-rate")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="定期把各任务速度/剩余时间和各 CDN 节点的汇总写到 FILE (JSON) 和同名 .prom 文件")
+    parser.add_argument("--stall-speed", default="10K", help="速度低于它视为停滞 (默认 10K/s)")
+    parser.add_argument("--stall-timeout", type=float, default=engine.DEFAULT_STALL_SECONDS,
+                        help="停滞持续多少秒后断开重连 (默认 %(default)s，0 = 不检测)")
+    parser.add_argument("--no-connection-pool", action="store_true",
+                        help="不使用共享连接池（长连接 / TLS 会话复用 / DNS 缓存），每个任务各自建立连接")
+    parser.add_argument("--temp-dir", help="下载和合并在这个目录进行（如本机 SSD），完成后移动到保存目录")
+    parser.add_argument("--write-buffer", default="1M", help="写缓冲大小，攒够这么多数据才写盘 (默认 1M)")
+    parser.add_argument("--min-free-space", default="256M",
+                        help="磁盘至少保留的空间，任务预计会占用到这里时排队等待或直接失败 (默认 256M，0 = 不检查)")
+    parser.add_argument("--no-preallocate", action="store_true", help="不预先分配磁盘块")
+    parser.add_argument("--cache-dir", help="本地媒体缓存目录，多人共用同一目录时，同一视频同一格式只下载一次")
+    parser.add_argument("--cache-size", default="20G", help="缓存大小上限，超出时淘汰最久没用过的 (默认 20G)")
+    parser.add_argument("--verify-cache", action="store_true", help="校验缓存里所有文件的摘要，删掉损坏的后退出")
+    parser.add_argument("--write-subs", action="store_true", help="字幕另存为单独的文件（含自动生成的字幕）")
+    parser.add_argument("--embed-subs", action="store_true", help="把字幕嵌入视频（mp4/mkv/webm）")
+    parser.add_argument("--sub-langs", default=",".join(engine.subtitle_langs),
+                        help=f"字幕语言，逗号分隔 (默认 {','.join(engine.subtitle_langs)}，all = 全部)")
+    parser.add_argument("--write-thumbnail", action="store_true", help="封面另存为单独的文件")
+    parser.add_argument("--embed-thumbnail", action="store_true", help="把封面嵌入视频/音频文件")
+    parser.add_argument("--write-info-json", action="store_true", help="视频信息另存为 .info.json")
+    parser.add_argument("--embed-metadata", action="store_true", help="把标题、上传者、简介等元数据和章节写入文件")
+    parser.add_argument("--start", help="只下载从这个时间开始的片段，如 90、1:30、1:02:03、1h2m3s")
+    parser.add_argument("--end", help="片段结束时间，不指定时下载到结尾")
+    parser.add_argument("--live-segment", default=str(engine.DEFAULT_ROLL_SECONDS),
+                        help="录制直播时每个文件的时长，如 600、10:00、1h (默认 10 分钟)")
+    parser.add_argument("--resume", action="store_true",
+                        help="先恢复上次中断（崩溃/被关闭）时未完成的任务，并记录本次任务以便下次恢复")
+    parser.add_argument("--no-archive", action="store_true", help="忽略下载记录，已下载过的视频也重新下载")
+    parser.add_argument("--segments", type=int, default=0,
+                        help="分段并发下载：每个文件同时使用的连接数 (默认 0 = 关闭)")
+    parser.add_argument("--segment-size", type=float, default=engine.DEFAULT_SEGMENT_SIZE / 1024 / 1024,
+                        help="分段大小 (MB)")
+    parser.add_argument("--parallel-streams", action="store_true",
+                        help="视频和音频两路流同时下载，完成后立即合并")
+    parser.add_argument("--stream-postprocess", action="store_true",
+                        help="边下载边通过管道交给 FFmpeg 合并/转码，不写中间文件")
+    parser.add_argument("-j", "--jobs", type=int, default=engine.MAX_PARALLEL_DOWNLOADS, help="同时下载数")
+    parser.add_argument("--postprocess-jobs", type=int, default=engine.MAX_PARALLEL_POSTPROCESS,
+                        help="同时进行的合并/转码数 (默认为 CPU 核数)")
+    parser.add_argument("--playlist", action="store_true",
+                        help="播放列表/频道模式：展开链接里的全部视频，边翻页边下载")
+    parser.add_argument("--items", help="播放列表序号范围，如 1-10,15,20- (从 1 开始)")
+    parser.add_argument("--date-after", help="只下载该日期及之后上传的视频 (YYYYMMDD)")
+    parser.add_argument("--date-before", help="只下载该日期及之前上传的视频 (YYYYMMDD)")
+    parser.add_argument("--probe", action="store_true",
+                        help="只批量解析，输出每个链接的标题、时长、可选画质和预计大小，不下载")
+    parser.add_argument("--startup-benchmark", nargs="?", const=BENCHMARK_URL, metavar="URL",
+                        help="输出各启动阶段耗时后退出（不联网，URL 只用于匹配提取器）")
+    return parser.parse_args(argv)
+
+
+def probe(urls):
+    """批量解析并输出表格（制表符分隔，方便导入表格软件筛选）"""
+    rows = engine.probe_batch(urls, on_result=lambda row: engine.log(engine.format_probe_row(row)))
+    print("url\ttitle\tduration\theights\tfilesize\terror")
+    for row in rows:
+        print("\t".join([
+            row['url'], row['title'] or "", engine.format_eta(row['duration']),
+            ",".join(map(str, row['heights'])), str(int(row['filesize'])) if row['filesize'] else "",
+            row['error'] or "",
+        ]))
+    return 1 if any(row['error'] for row in rows) else 0
+
+
+def startup_benchmark(url):
+    """逐阶段统计从启动到可以开始解析的耗时，并和 yt-dlp 默认注册全部提取器的方式对比"""
+    phases = [("导入引擎模块", ENGINE_IMPORT_TIME)]
+    ok = engine.init_components(auto_install=False)
+    phases += engine.startup_timings
+    if not ok:
+        return 1
+
+    with engine.startup_phase("定义下载器类"):
+        ydl_class = engine.engine_ydl_class()
+    with engine.startup_phase("按链接加载提取器"):
+        ie = engine.match_extractor(url)
+        ydl_class({"quiet": True}).get_info_extractor(ie.ie_key())
+    phases += engine.startup_timings[-2:]
+    full_init = default_init_time(ie.ie_key())
+
+    for name, seconds in phases:
+        print(f"{name:<16}{seconds * 1000:>9.1f} ms")
+    print(f"{'合计':<16}{sum(s for _, s in phases) * 1000:>9.1f} ms")
+    print(f"提取器: {ie.ie_key()}；按链接加载 {phases[-1][1] * 1000:.1f} ms，"
+          f"对比 yt-dlp 默认初始化（注册全部提取器后加载同一个提取器）{full_init * 1000:.1f} ms")
+    return 0
+
+
+def default_init_time(ie_key):
+    """在新进程里量 yt-dlp 默认初始化的耗时（不含 import yt_dlp）
+
+    本进程已经导入过提取器模块，在这里量会漏掉这部分；两边都从冷启动开始才可比
+    """
+    code = ("import time, yt_dlp\n"
+            "start = time.perf_counter()\n"
+            f"yt_dlp.YoutubeDL({{'quiet': True}}).get_info_extractor({ie_key!r})\n"
+            "print(time.perf_counter() - start)")
+    # 和本进程用同一份 yt-dlp（可能是自动安装到应用目录里的）
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(engine.yt_dlp.__file__)))
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.startup_benchmark:
+        return startup_benchmark(args.startup_benchmark)
+    try:
+        quality = engine.quality_from_preset(args.quality)
+        items = engine.parse_playlist_items(args.items)
+        date_range = engine.parse_date_range(args.date_after, args.date_before)
+        section = sections.parse_section(args.start, args.end)
+        live_segment = sections.parse_timestamp(args.live_segment)
+        if not live_segment or live_segment <= 0:
+            raise ValueError(f"直播分段时长要大于 0: {args.live_segment}")
+        engine.bandwidth.configure(bandwidth.parse_rate(args.limit_rate), bandwidth.parse_schedule(args.limit_schedule))
+        engine.job_rate_limit = bandwidth.parse_rate(args.job_limit_rate)
+        engine.stall_speed = bandwidth.parse_rate(args.stall_speed) or 0
+        engine.write_buffer_size = storage.parse_size(args.write_buffer) or 0
+        min_free_space = storage.parse_size(args.min_free_space)
+        cache_size = storage.parse_size(args.cache_size)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    if args.cache_dir:
+        engine.set_media_cache(os.path.expanduser(args.cache_dir), cache_size)
+    if args.verify_cache:
+        if engine.media_cache is None:
+            print("❌ 需要用 --cache-dir 指定缓存目录", file=sys.stderr)
+            return 2
+        bad = engine.media_cache.verify()
+        engine.log(f"🔎 缓存校验完成，删除损坏/丢失的条目 {bad} 个")
+        return 0
+
+    urls = read_urls(args)
+    if not urls and not args.resume:
+        print("❌ 没有需要下载的链接", file=sys.stderr)
+        return 2
+
+    save_path = os.path.expanduser(args.output)
+    os.makedirs(save_path, exist_ok=True)
+    if args.temp_dir:
+        engine.temp_dir = os.path.expanduser(args.temp_dir)
+        os.makedirs(engine.temp_dir, exist_ok=True)
+
+    if args.no_archive:
+        engine.download_archive = None
+    if not args.resume:
+        # 任务日志默认只给 GUI 用；命令行一次性批量任务不记录，也不会和 GUI 同时写同一个日志
+        engine.job_journal = None
+    engine.max_filesize = int(args.max_filesize * 1024 * 1024) if args.max_filesize else None
+    engine.max_bitrate = args.max_bitrate
+    engine.codec_preference = tuple(c.strip() for c in args.codecs.split(",") if c.strip())
+    engine.connection_pool = not args.no_connection_pool
+    engine.segment_workers = args.segments
+    engine.stall_seconds = args.stall_timeout
+    engine.metrics_file = args.metrics
+    engine.segment_size = int(args.segment_size * 1024 * 1024)
+    engine.parallel_streams = args.parallel_streams
+    engine.streaming_postprocess = args.stream_postprocess
+    engine.preallocate = not args.no_preallocate
+    engine.subtitle_langs = [lang.strip() for lang in args.sub_langs.split(",") if lang.strip()]
+    engine.write_subtitles = args.write_subs
+    engine.embed_subtitles = args.embed_subs
+    engine.write_thumbnail = args.write_thumbnail
+    engine.embed_thumbnail = args.embed_thumbnail
+    engine.write_info_json = args.write_info_json
+    engine.embed_metadata = args.embed_metadata
+    engine.live_segment_seconds = live_segment
+    engine.audio_format = args.audio_format or engine.audio_format
+    if min_free_space is None:
+        engine.disk_space = None
+    else:
+        engine.disk_space.min_free = min_free_space
+
+    if not engine.init_components():
+        return 1
+    if args.probe:
+        return probe(urls)
+
+    def on_update(job):
+        engine.log(f"[{job.id}] {engine.JOB_STATE_LABELS[job.state]}: {job.title}")
+
+    scheduler = engine.DownloadScheduler(on_update, max_downloads=args.jobs, max_postprocess=args.postprocess_jobs)
+    playlists = []
+    scheduler.resume_journal()
+    for url in urls:
+        if args.playlist:
+            playlists.append(scheduler.submit_playlist(url, quality, save_path, items, date_range))
+        else:
+            scheduler.submit(url, quality, save_path, section=section)
+    try:
+        scheduler.wait()
+    except KeyboardInterrupt:
+        # 正在录制的直播：Ctrl+C 停止录制并保留已录的文件，其他任务照常完成；再按一次直接退出
+        recording = [j for j in list(scheduler.jobs) if scheduler.stop_recording(j)]
+        if not recording:
+            raise
+        scheduler.wait()
+
+    done, failed = scheduler.take_finished()
+    skipped = sum(p.skipped for p in playlists)
+    engine.log(f"完成 {done} 个，失败 {len(failed)} 个" + (f"，跳过 {skipped} 个" if skipped else ""))
+    if args.metrics:
+        engine.metrics.export(args.metrics)
+    if engine.http_pool is not None:
+        engine.log(f"🔌 连接复用: {engine.http_pool.describe()}")
+    if engine.media_cache is not None:
+        engine.log(f"📦 本地缓存: {engine.media_cache.describe()}")
+    stats = engine.bandwidth.stats
+    if stats['throttled_seconds']:
+        engine.log(f"🚦 限速: 共传输 {engine.format_bytes(stats['bytes'])}，累计等待 {stats['throttled_seconds']:.1f}s")
+    return 1 if failed or any(p.error for p in playlists) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2677 @@
+"""下载引擎：解析、格式选择、下载队列，不依赖 Tk，可供 GUI 和命令行共用"""
+import threading
+import queue
+import itertools
+import os
+import sys
+import subprocess
+import shutil
+import time
+import json
+import stat
+import copy
+import re
+import contextlib
+import functools
+import importlib.util
+import uuid
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+from archive import DownloadArchive
+from segmented import SegmentedDownloader, RangeNotSupported, DEFAULT_SEGMENT_SIZE
+from streaming import StreamingMuxer, StreamingError
+from sections import SectionDownloader, SectionUnsupported, cut_input_args, format_timestamp, select_fragments
+from bandwidth import BandwidthManager
+from journal import JobJournal
+from metrics import DEFAULT_STALL_SECONDS, DEFAULT_STALL_SPEED, MetricsRegistry
+from storage import (DEFAULT_MIN_FREE_SPACE, DEFAULT_WRITE_BUFFER, MERGE_OVERHEAD, BufferedOutput, DiskSpaceManager,
+                     InsufficientSpace, atomic_move, reserve_blocks, same_device)
+from retry import ERR_EXPIRED, ERR_EXTRACTOR, ERR_NETWORK, ERROR_LABELS, RetryPolicy, classify_error
+from formats import DEFAULT_CODEC_PREFERENCE, build_formats, available_heights, select_formats
+from live import DEFAULT_ROLL_SECONDS, LiveRecorder, next_index
+import remux
+
+
+# --- 全局变量 ---
+yt_dlp = None
+ffmpeg_available = False
+components_ready = threading.Event()  # init_components 结束（无论成功与否）后置位
+
+CONFIG_FILE = os.path.expanduser("~/.youtube_downloader_config.json")
+# 下载记录和配置文件放在一起
+ARCHIVE_FILE = os.path.join(os.path.dirname(CONFIG_FILE), ".youtube_downloader_archive.sqlite3")
+JOURNAL_DIR = os.path.join(os.path.dirname(CONFIG_FILE), ".youtube_downloader_jobs")
+
+# --- 日志输出 ---
+_log_handler = None
+
+def set_log_handler(handler):
+    """设置日志输出目标（GUI 写入日志框，命令行默认输出到 stderr）"""
+    global _log_handler
+    _log_handler = handler
+
+def log(message):
+    timestamp = time.strftime("%H:%M:%S", time.localtime())
+    full_msg = f"[{timestamp}] {message}\n"
+    if _log_handler is not None:
+        _log_handler(full_msg)
+    else:
+        sys.stderr.write(full_msg)
+
+class ConfigManager:
+    @staticmethod
+    def load():
+        if os.path.exists(CONFIG_FILE):
+            try:
+                with open(CONFIG_FILE, 'r') as f:
+                    return json.load(f)
+            except:
+                pass
+        return {"skipped_version": "", "auto_check": True}
+
+    @staticmethod
+    def save(config):
+        """合并写入：只覆盖 config 里有的键，GUI 和后台初始化线程各自保存时不会互相冲掉"""
+        try:
+            merged = ConfigManager.load()
+            merged.update(config)
+            tmp = CONFIG_FILE + ".tmp"
+            with open(tmp, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp, CONFIG_FILE)
+        except:
+            pass
+
+
+# 解析结果缓存：签名直链一般 6 小时过期，这里保守地只缓存 20 分钟
+INFO_CACHE_TTL = 20 * 60
+# 直链剩余有效期不足该值时视为过期，避免下载到一半 403
+INFO_CACHE_EXPIRE_MARGIN = 5 * 60
+
+def normalize_url(url):
+    """把同一视频的不同链接形式归一化，作为缓存 key"""
+    url = url.strip()
+    parsed = urlparse(url if "://" in url else "https://" + url)
+    host = parsed.netloc.lower()
+    if host.startswith("www.") or host.startswith("m."):
+        host = host.split(".", 1)[1]
+
+    video_id = None
+    if host == "youtu.be":
+        video_id = parsed.path.lstrip("/").split("/")[0]
+    elif host in ("youtube.com", "music.youtube.com"):
+        if parsed.path == "/watch":
+            video_id = parse_qs(parsed.query).get("v", [None])[0]
+        elif parsed.path.startswith(("/shorts/", "/live/", "/embed/")):
+            video_id = parsed.path.split("/")[2]
+    if video_id:
+        return f"https://www.youtube.com/watch?v={video_id}"
+
+    # 其他站点：去掉 fragment，scheme/host 小写
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), fragment="").geturl()
+
+class InfoCache:
+    """解析结果（info dict）缓存，解析和下载共用，省掉第二次完整解析"""
+    def __init__(self, ttl=INFO_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (过期时间, info)
+
+    def _expires_at(self, info):
+        expires = time.time() + self.ttl
+        # 直链里带 expire 参数时，以最早过期的那条为准
+        for f in info.get('formats') or []:
+            expire = parse_qs(urlparse(f.get('url') or '').query).get('expire', [None])[0]
+            if expire and expire.isdigit():
+                expires = min(expires, int(expire) - INFO_CACHE_EXPIRE_MARGIN)
+        return expires
+
+    def get(self, url):
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            # 下载过程会修改 info，返回副本保证缓存干净
+            return copy.deepcopy(entry[1])
+
+    def put(self, url, info):
+        key = normalize_url(url)
+        with self._lock:
+            self._entries[key] = (self._expires_at(info), copy.deepcopy(info))
+
+    def invalidate(self, url):
+        with self._lock:
+            self._entries.pop(normalize_url(url), None)
+
+info_cache = InfoCache()
+
+# 已下载视频记录，设为 None 可关闭跳过逻辑（命令行 --no-archive）
+download_archive = DownloadArchive(ARCHIVE_FILE)
+
+# 分段并发下载：每个文件同时发起的 Range 连接数，0 表示关闭（沿用 yt-dlp 单连接下载）
+segment_workers = 0
+segment_size = DEFAULT_SEGMENT_SIZE
+# 视频+音频两路流同时下载，都完成后立即合并
+parallel_streams = False
+# 流式后期处理：下载数据直接通过管道喂给 FFmpeg，不落中间文件
+streaming_postprocess = False
+# 格式选择条件（见 formats.select_formats）：文件大小上限（字节）、总码率上限（kbps）、视频编码偏好
+max_filesize = None
+max_bitrate = None
+codec_preference = DEFAULT_CODEC_PREFERENCE
+# 带宽限制：全局总速率和时段规则用 bandwidth.configure() 设置；job_rate_limit 为每个任务的默认上限（字节/秒）
+bandwidth = BandwidthManager()
+job_rate_limit = None
+# 任务日志：记录排队中/下载中的任务，崩溃或关闭后重启时恢复（见 DownloadScheduler.resume_journal），None 表示不记录
+job_journal = JobJournal(JOURNAL_DIR, on_error=lambda e: log(f"⚠️ 任务日志读写失败，本次运行不再记录（不影响下载）: {e}"))
+JOURNAL_PROGRESS_INTERVAL = 5  # 下载进度每个任务每隔这么多秒记一次
+# 失败重试：任务级（重新解析 / 整体重来，已下载的部分续传）和 yt-dlp 内部连接级、分片级重试共用退避策略
+retry_policy = RetryPolicy(attempts=4)
+HTTP_RETRIES = 5
+# 下载指标：速度/剩余时间时间序列和停滞检测；metrics_file 设置后定期导出 JSON 和 .prom 文件
+metrics = MetricsRegistry()
+metrics_file = None
+METRICS_EXPORT_INTERVAL = 10
+_metrics_export_error = None
+# 速度连续 stall_seconds 秒低于 stall_speed（字节/秒）视为停滞，断开重连；stall_seconds 为 0 时不检测
+stall_speed = DEFAULT_STALL_SPEED
+stall_seconds = DEFAULT_STALL_SECONDS
+# 共享连接池：解析、下载、检查更新共用长连接、TLS 会话和 DNS 缓存；为 False 时 yt-dlp 用它自己的连接
+connection_pool = True
+http_pool = None
+_http_pool_lock = threading.Lock()
+
+def get_http_pool():
+    """进程内唯一的 httppool.ConnectionPool，首次使用时创建，连接复用统计随下载指标一起导出"""
+    global http_pool
+    with _http_pool_lock:
+        if http_pool is None:
+            from httppool import ConnectionPool  # 会导入 http.client 和 ssl，不在启动时导入
+            http_pool = ConnectionPool()
+            metrics.add_source("http", http_pool.snapshot)
+        return http_pool
+
+# 输出文件：设置 temp_dir 后下载和合并都在这个目录进行（如本机 SSD），完成后再移动到保存目录；
+# 写入攒够 write_buffer_size 字节才落盘；preallocate 为 True 时大小已知的文件预先分配磁盘块；
+# 开始下载前按预计占用做磁盘空间准入，disk_space 为 None 时不检查
+temp_dir = None
+write_buffer_size = DEFAULT_WRITE_BUFFER
+preallocate = True
+disk_space = DiskSpaceManager(DEFAULT_MIN_FREE_SPACE)
+# 本地媒体缓存：同一视频同一格式已经有人下载过时直接从缓存取，用 set_media_cache() 开启，None 表示不使用
+media_cache = None
+# 字幕、封面、元数据：write_* 保存为单独的文件，embed_* 嵌入到视频文件；字幕和封面在后台线程和视频同时下载，
+# 嵌入和音视频合并在同一次 FFmpeg 调用里完成（见 SidecarMuxPP）；字幕包括自动生成的
+subtitle_langs = ['zh-Hans', 'en']
+write_subtitles = False
+embed_subtitles = False
+write_thumbnail = False
+embed_thumbnail = False
+write_info_json = False
+embed_metadata = False  # 标题、上传者、简介等元数据和章节
+# 直播和首映：正在直播的跟着 HLS 播放列表一直录，每录够这么多秒换一个文件（见 live.LiveRecorder）；
+# 还没开始的等到开播时间再录，等待期间每隔 LIVE_UPCOMING_POLL 秒重新解析一次（开播时间可能推迟或提前）
+live_segment_seconds = DEFAULT_ROLL_SECONDS
+LIVE_UPCOMING_POLL = 60
+
+def set_media_cache(directory, max_size=None):
+    """开启（directory 为 None 时关闭）本地媒体缓存，命中率等统计随下载指标一起导出"""
+    global media_cache
+    if directory is None:
+        media_cache = None
+        return None
+    from mediacache import DEFAULT_MAX_SIZE, MediaCache  # 会导入 sqlite3 和 hashlib，不开缓存时不导入
+    media_cache = MediaCache(directory, max_size or DEFAULT_MAX_SIZE)
+    metrics.add_source("cache", media_cache.snapshot)
+    return media_cache
+
+def detect_ffmpeg():
+    """检测 FFmpeg 是否存在，包括 Homebrew 路径"""
+    # 1. 检查环境变量中的 ffmpeg
+    if shutil.which("ffmpeg"):
+        return shutil.which("ffmpeg")
+    
+    # 2. 检查常见 Homebrew/MacPorts 路径
+    common_paths = [
+        "/opt/homebrew/bin/ffmpeg",  # Apple Silicon
+        "/usr/local/bin/ffmpeg",     # Intel
+        os.path.expanduser("~/bin/ffmpeg"),
+        os.path.expanduser("~/Library/Application Support/YouTubeDownloader/bin/ffmpeg")
+    ]
+    
+    for path in common_paths:
+        if os.path.exists(path) and os.access(path, os.X_OK):
+            return path
+            
+    return None
+
+def install_ffmpeg():
+    """尝试自动安装 FFmpeg"""
+    # 只有这里用到，放在函数里导入，不拖慢启动
+    import zipfile
+
+    log("⏳ 正在尝试自动安装 FFmpeg...")
+    
+    # 1. 尝试使用 Homebrew (如果 installed but not link)
+    # 这里我们只尝试运行 install，如果已经安装了 brew 会自动处理
+    if shutil.which("brew"):
+        log("🍺 检测到 Homebrew，尝试 'brew install ffmpeg'...")
+        try:
+            # 捕获输出防止弹窗
+            subprocess.check_call(["brew", "install", "ffmpeg"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            log("✅ FFmpeg 通过 Homebrew 安装成功！")
+            return True
+        except:
+            # brew 可能会报错如果已经安装，再次尝试检测
+            if detect_ffmpeg():
+                return True
+            log("❌ Homebrew 安装/修复失败。转为下载静态包...")
+    
+    # 2. 尝试下载静态构建
+    FFMPEG_URL = "https://evermeet.cx/ffmpeg/ffmpeg-6.0.zip" # LTS version
+    TARGET_DIR = os.path.expanduser("~/Library/Application Support/YouTubeDownloader/bin")
+    TARGET_BIN = os.path.join(TARGET_DIR, "ffmpeg")
+    
+    if os.path.exists(TARGET_BIN):
+        os.chmod(TARGET_BIN, os.stat(TARGET_BIN).st_mode | stat.S_IEXEC)
+        os.environ["PATH"] += os.pathsep + TARGET_DIR
+        return True
+        
+    log(f"⬇️ 正在下载 FFmpeg 静态包 (约 20MB)...")
+    try:
+        if not os.path.exists(TARGET_DIR):
+            os.makedirs(TARGET_DIR)
+            
+        zip_path = os.path.join(TARGET_DIR, "ffmpeg.zip")
+        
+        # 忽略 SSL 证书验证 (防止 Python 环境缺失证书)
+        # 走共享连接池，不再用 install_opener 改全局的 urllib 设置
+        with get_http_pool().urlopen(FFMPEG_URL, timeout=60, verify=False) as response, open(zip_path, 'wb') as f:
+            shutil.copyfileobj(response, f)
+        
+        log("📦 正在解压 FFmpeg...")
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(TARGET_DIR)
+            
+        # 赋予执行权限
+        os.chmod(TARGET_BIN, os.stat(TARGET_BIN).st_mode | stat.S_IEXEC)
+        
+        # 移除 Gatekeeper 隔离属性 (安全地)
+        try:
+            subprocess.run(["xattr", "-d", "com.apple.quarantine", TARGET_BIN], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except:
+            pass
+        
+        # Cleanup
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+        
+        # 添加到环境变量
+        os.environ["PATH"] += os.pathsep + TARGET_DIR
+        log("✅ FFmpeg 静态包安装成功！")
+        return True
+    except Exception as e:
+        log(f"❌ FFmpeg 自动安装失败: {e}")
+        return False
+
+# --- 启动耗时统计 ---
+startup_timings = []  # [(阶段, 秒)]，按发生顺序记录
+
+@contextlib.contextmanager
+def startup_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings.append((name, time.perf_counter() - start))
+
+def format_startup_timings(timings=None):
+    timings = startup_timings if timings is None else timings
+    return " | ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings)
+
+# 组件检测结果缓存在配置文件里，路径和修改时间都没变就直接复用，不用每次启动都重新查找
+COMPONENTS_CONFIG_KEY = "components"
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def _cached_component(cache, name):
+    """缓存项对应的文件还在且修改时间没变时返回缓存项，否则返回 None"""
+    entry = cache.get(name)
+    if entry and entry.get("mtime") is not None and _file_mtime(entry.get("path") or "") == entry["mtime"]:
+        return entry
+    return None
+
+def find_ytdlp():
+    """不导入 yt-dlp，只定位安装位置并读出版本号；找不到（或打包环境里没有源文件）时返回 None"""
+    try:
+        spec = importlib.util.find_spec("yt_dlp")
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin:
+        return None
+    path = os.path.join(os.path.dirname(spec.origin), "version.py")
+    try:
+        with open(path, encoding="utf-8") as f:
+            match = re.search(r"""__version__\s*=\s*['"]([^'"]+)['"]""", f.read())
+    except OSError:
+        return None
+    return {"path": path, "mtime": _file_mtime(path), "version": match and match.group(1)}
+
+def init_components(auto_install=sys.platform == "darwin"):
+    """加载 yt-dlp 并检测 FFmpeg，yt-dlp 不可用时返回 False"""
+    try:
+        return _init_components(auto_install)
+    finally:
+        components_ready.set()
+
+def _init_components(auto_install):
+    global yt_dlp, ffmpeg_available
+
+    log("正在初始化核心组件...")
+    with startup_phase("读取组件缓存"):
+        cache = ConfigManager.load().get(COMPONENTS_CONFIG_KEY) or {}
+
+    # 1. 检查/安装 yt-dlp
+    ytdlp = _cached_component(cache, "yt_dlp")
+    with startup_phase("检测 yt-dlp" + ("(缓存)" if ytdlp else "")):
+        ytdlp = ytdlp or find_ytdlp()
+        if ytdlp is None and not ensure_ytdlp_installed():
+            log("❌ 核心组件 yt-dlp 加载失败，程序无法使用。")
+            return False
+
+    # 只导入 yt-dlp 主体，提取器在解析时按链接单独加载（见 engine_ydl_class）
+    with startup_phase("导入 yt-dlp"):
+        import yt_dlp as ydl_module
+    yt_dlp = ydl_module
+    log(f"✅ 核心组件加载完成 (yt-dlp {ytdlp['version'] if ytdlp else yt_dlp.version.__version__})。")
+
+    # 2. 检测 FFmpeg
+    ffmpeg = _cached_component(cache, "ffmpeg")
+    with startup_phase("检测 FFmpeg" + ("(缓存)" if ffmpeg else "")):
+        ffmpeg_path = ffmpeg["path"] if ffmpeg else detect_ffmpeg()
+    
+    if ffmpeg_path:
+        ffmpeg_available = True
+        # 如果是手动找到的路径，确保它在 PATH 里，主要是为了 yt-dlp 能找到
+        ffmpeg_dir = os.path.dirname(ffmpeg_path)
+        if ffmpeg_dir not in os.environ["PATH"]:
+             os.environ["PATH"] += os.pathsep + ffmpeg_dir
+        log(f"✅ 检测到 FFmpeg 组件: {ffmpeg_path}")
+    else:
+        # 尝试自动安装（静态包只有 macOS 版本）
+        ffmpeg_available = auto_install and install_ffmpeg()
+
+    if not ffmpeg_available:
+        log("⚠️ 未检测到 FFmpeg！")
+        log("👉 后果：无法下载 1080p+ 画质，所有视频将自动降级为兼容格式（通常是 720p 或更低）。")
+
+    # 只缓存找到了的组件，没找到的下次启动还要重新检测（用户可能刚装好）
+    new_cache = {}
+    if ytdlp and ytdlp["mtime"] is not None:
+        new_cache["yt_dlp"] = ytdlp
+    if ffmpeg_path:
+        new_cache["ffmpeg"] = {"path": ffmpeg_path, "mtime": _file_mtime(ffmpeg_path)}
+    if new_cache != cache:
+        ConfigManager.save({COMPONENTS_CONFIG_KEY: new_cache})
+    return True
+
+def wait_for_components():
+    """等待后台初始化结束，yt-dlp 可用时返回 True"""
+    components_ready.wait()
+    return yt_dlp is not None
+
+def ensure_ytdlp_installed():
+    # 如果是打包后的环境，直接跳过检查
+    if getattr(sys, 'frozen', False):
+        try:
+            import yt_dlp
+            return True
+        except ImportError:
+            return False
+
+    try:
+        import yt_dlp
+        return True
+    except ImportError:
+        log("正在尝试自动修复依赖...")
+        try:
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp", "--break-system-packages"])
+            return True
+        except:
+            return False
+
+QUALITY_BEST = "1. 最高画质 (最佳效果)"
+QUALITY_AUDIO = "仅音频"
+AUDIO_BITRATE = remux.DEFAULT_AUDIO_BITRATE  # kbps，音频需要转码时的码率
+# 仅音频时输出的格式：mp3（默认，和以前一样；非 MP3 源都要转码）、m4a（AAC 源直接复制）、original（保留源编码，从不转码）；
+# 复制还是转码由 remux 按选中格式的编码决定，见 EngineYoutubeDL.PlannedAudioPP
+audio_format = 'mp3'
+AUDIO_FORMAT_LABELS = {'mp3': 'MP3', 'm4a': 'M4A', 'original': '原始编码'}
+AUDIO_CODEC_PREFERENCE = {'m4a': ('aac',), 'mp3': ('mp3',)}  # 优先选目标容器能直接装下的音频
+transcode_slots = remux.TranscodeSlots()  # 并发数由 DownloadScheduler 按后处理并发数设置
+
+def audio_quality_label():
+    """画质列表里仅音频选项的文字，标出当前的输出格式，如 "仅音频 (MP3)"；按 QUALITY_AUDIO 识别"""
+    return f"{QUALITY_AUDIO} ({AUDIO_FORMAT_LABELS.get(audio_format, audio_format)})"
+
+def quality_from_preset(preset):
+    """把命令行画质预设（best / audio / 1080 / 720p）转换成和界面一致的画质选项"""
+    preset = preset.strip().lower()
+    if preset == "best":
+        return QUALITY_BEST
+    if preset in ("audio", "mp3"):
+        return QUALITY_AUDIO
+    match = re.fullmatch(r'(\d+)p?', preset)
+    if not match:
+        raise ValueError(f"无法识别的画质预设: {preset}")
+    return f"{match.group(1)}p (MP4)"
+
+def quality_criteria(quality):
+    """把画质选项（界面上显示的文字）转换成格式选择条件，这是唯一解析选项文字的地方"""
+    # 旧版本的选项文字是 "仅音频 (MP3)"，任务日志里恢复的任务也按仅音频处理
+    if QUALITY_AUDIO in quality:
+        return {'audio_only': True}
+    # "2. 1080p (MP4) ..." 按高度匹配，序号不参与判断
+    match = re.search(r'(\d+)p\b', quality)
+    if match:
+        return {'height': int(match.group(1))}
+    if "标准画质" in quality: # 旧逻辑兼容
+        return {'height': 720}
+    return {} # "1. 最高画质" 及未知选项都按最高画质处理
+
+def format_criteria(quality):
+    """画质选项加上全局的大小/码率/编码限制，即 formats.select_formats 的参数"""
+    criteria = quality_criteria(quality)
+    if criteria.get('audio_only') and ffmpeg_available:
+        criteria['audio_codecs'] = AUDIO_CODEC_PREFERENCE.get(audio_format, ())
+    return dict(criteria, max_filesize=max_filesize, max_bitrate=max_bitrate,
+                codecs=codec_preference, can_merge=ffmpeg_available)
+
+def section_label(section):
+    """文件名里标注的时间段，如 ' [1.02.03-1.02.33]'（文件名里不能有冒号）"""
+    start, end = section
+    return f" [{format_timestamp(start)}-{format_timestamp(end) if end is not None else ''}]".replace(':', '.')
+
+def build_ydl_opts(quality, save_path, section=None):
+    """根据画质选项生成 yt-dlp 下载参数；section 为 (开始秒数, 结束秒数或 None) 时只下载这一段"""
+    # has_ffmpeg = check_ffmpeg() # 使用全局变量
+    outtmpl = '%(title)s' + (section_label(section) if section else '') + '.%(ext)s'
+    
+    ydl_opts = {
+        'outtmpl': os.path.join(save_path, outtmpl),
+        # 'cookiesfrombrowser': ('safari',), 
+        'merge_output_format': 'mp4',
+        'noplaylist': True, 
+        'progress_hooks': [],
+        'logger': MyLogger(), # 捕获 yt-dlp 内部日志
+        # 全部后期处理完成后由 yt-dlp 写入下载记录，失败的任务不会记录
+        'download_archive': download_archive,
+        # 自定义参数，yt-dlp 本身会忽略，由 EngineYoutubeDL 读取
+        'segment_workers': segment_workers,
+        'segment_size': segment_size,
+        'parallel_streams': parallel_streams,
+        'streaming_postprocess': streaming_postprocess,
+        'write_buffer_size': write_buffer_size,
+        'preallocate': preallocate,
+    }
+    if temp_dir:
+        # yt-dlp 的 paths 只接受相对的文件名模板：下载、合并在 temp 进行，完成后由 AtomicMoveFilesPP 移到 home
+        ydl_opts['outtmpl'] = outtmpl
+        ydl_opts['paths'] = {'home': save_path, 'temp': temp_dir}
+    if section:
+        # 只下载覆盖这段时间的分片/字节范围，剪切不重新编码（见 EngineYoutubeDL._dl_section）
+        start, end = section
+        # 没有结束时间时 yt-dlp 需要 inf，会换成视频时长
+        ydl_opts['download_ranges'] = lambda info, ydl: [{'start_time': start,
+                                                          'end_time': float('inf') if end is None else end}]
+        ydl_opts['section'] = section
+        # 多个格式时 yt-dlp 默认交给一个 FFmpeg 同时读取并合并，这里改为各路流分别按片段下载，合并时再剪
+        ydl_opts['compat_opts'] = {'no-direct-merge'}
+    
+    if not ffmpeg_available:
+        log("⚠️ [兼容模式] 未检测到FFmpeg，将根据可用格式下载")
+        if 'merge_output_format' in ydl_opts:
+            del ydl_opts['merge_output_format'] # 没有ffmpeg无法合并，不能指定merge_output_format
+
+    criteria = quality_criteria(quality)
+    # 格式由 formats.select_formats 按条件选出确切的 format_id，见 EngineYoutubeDL._select_by_criteria
+    ydl_opts['format_criteria'] = format_criteria(quality)
+    if criteria.get('audio_only'):
+        if ffmpeg_available:
+            # 由 EngineYoutubeDL.run_pp 换成 PlannedAudioPP：源编码目标容器装得下时直接复制，不转码
+            ydl_opts['postprocessors'] = [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'best' if audio_format == 'original' else audio_format,
+                'preferredquality': str(AUDIO_BITRATE),
+            }]
+            ydl_opts['audio_format'] = audio_format
+        else:
+            log("提示：无FFmpeg，下载原始音频")
+
+    if write_subtitles or embed_subtitles:
+        ydl_opts.update(writesubtitles=True, writeautomaticsub=True, subtitleslangs=list(subtitle_langs))
+    if write_thumbnail or embed_thumbnail:
+        ydl_opts['writethumbnail'] = True
+    if write_info_json:
+        ydl_opts['writeinfojson'] = True  # 直接由解析得到的 info 写出，不需要联网
+    if embed_metadata or embed_subtitles or embed_thumbnail:
+        if ffmpeg_available:
+            # 这三个后期处理不会各自执行，由 EngineYoutubeDL.run_pp 换成一次 SidecarMuxPP
+            postprocessors = ydl_opts.setdefault('postprocessors', [])
+            if embed_metadata:
+                postprocessors.append({'key': 'FFmpegMetadata', 'add_metadata': True, 'add_chapters': True})
+            if embed_subtitles:
+                postprocessors.append({'key': 'FFmpegEmbedSubtitle', 'already_have_subtitle': write_subtitles})
+            if embed_thumbnail:
+                postprocessors.append({'key': 'EmbedThumbnail', 'already_have_thumbnail': write_thumbnail})
+        else:
+            log("提示：无FFmpeg，字幕/封面只保存为单独的文件")
+
+    return ydl_opts
+
+class LiveNotStarted(Exception):
+    """直播/首映还没开始，info 里有开播时间（release_timestamp，可能没有）"""
+    def __init__(self, info):
+        super().__init__(f"直播尚未开始: {info.get('title') or info.get('id')}")
+        self.info = info
+
+def live_formats(info):
+    """可以录制的直播格式：HLS（m3u8）里音视频在同一路，不需要合并"""
+    return [f for f in info.get('formats') or []
+            if f.get('protocol') in ('m3u8', 'm3u8_native') and f.get('url')]
+
+def wants_recording(info):
+    """正在直播（有 HLS 格式）或还没开始的直播/首映交给录制，其他走普通下载"""
+    status = info.get('live_status')
+    return status == 'is_upcoming' or ((status == 'is_live' or bool(info.get('is_live'))) and bool(live_formats(info)))
+
+def live_format(info, quality):
+    """按画质选项选一路 HLS 格式；都不符合条件时取码率最高的"""
+    formats = live_formats(info)
+    # 直播没有文件大小，大小限制不适用
+    criteria = dict(format_criteria(quality), max_filesize=None, can_merge=False)
+    selection = select_formats(formats, **criteria)
+    if selection is not None:
+        return next(f for f in formats if f['format_id'] == selection.format_spec)
+    return max(formats, key=lambda f: f.get('tbr') or 0, default=None)
+
+def probe_live(url):
+    """重新解析直播（不用缓存）；还没开始时返回带开播时间的 info"""
+    info_cache.invalidate(url)
+    try:
+        return probe_url(url)
+    except LiveNotStarted as e:
+        return e.info
+
+def wait_for_live_start(job, info):
+    """等到直播/首映开始，返回开播后解析的 info；等待期间被停止时返回 None"""
+    release = info.get('release_timestamp')
+    when = time.strftime('%m-%d %H:%M', time.localtime(release)) if release else "时间未知"
+    log(f"⏰ 直播尚未开始（预计 {when}），开播后自动录制: {job.title}")
+    while info.get('live_status') == 'is_upcoming':
+        release = info.get('release_timestamp')
+        remaining = release - time.time() if release else None
+        job.eta = max(0, remaining) if remaining is not None else None
+        # 离开播时间还远就睡到开播，快到或已经过了预定时间就按间隔轮询
+        wait = min(max(remaining or 0, 5), LIVE_UPCOMING_POLL) if remaining is not None else LIVE_UPCOMING_POLL
+        if job.stop_event.wait(wait):
+            return None
+        info = probe_live(job.url)
+    job.eta = None
+    log(f"🔴 已开播: {job.title}")
+    return info
+
+def run_live_recording(job, scheduler):
+    """录制阶段（直播）：等到开播，跟着 HLS 播放列表一直录到直播结束或 stop_recording 被调用
+
+    录好的文件是 标题.001.ts、标题.002.ts ...，每个文件 live_segment_seconds 秒，不需要后期处理
+    """
+    info = job.info or probe_live(job.url)
+    if info.get('live_status') == 'is_upcoming':
+        info = wait_for_live_start(job, info)
+        if info is None:
+            log(f"⏹ 还没开播就停止了，没有录制: {job.title}")
+            return None
+        job.info = info
+    if not (info.get('is_live') or info.get('live_status') == 'is_live'):
+        raise yt_dlp.utils.DownloadError(f"直播已经结束，可以重新添加链接下载回放: {job.title}")
+    fmt = live_format(info, job.quality)
+    if fmt is None:
+        raise yt_dlp.utils.DownloadError(f"直播没有可以录制的 HLS 格式: {job.title}")
+
+    ydl_opts = {'noplaylist': True, 'quiet': True, 'logger': MyLogger()}
+    limiter = ydl_opts['bandwidth_limiter'] = job.limiter = bandwidth.limiter(job.rate_limit or job_rate_limit)
+    limiter.reconnect_error = yt_dlp.networking.exceptions.TransportError
+    job.metrics = metrics.job(job.id, job.title, stall_speed=stall_speed, stall_seconds=stall_seconds)
+    basename = yt_dlp.utils.sanitize_filename(info.get('title') or info.get('id') or 'live')
+    # 有临时目录时在临时目录里录，每个文件写完就移到保存目录
+    directory = temp_dir or job.save_path
+    os.makedirs(directory, exist_ok=True)
+
+    def progress(filename, recorded, seconds, speed):
+        job.downloaded_bytes = recorded
+        job.speed = speed
+        job.live_seconds = seconds
+        # 分片按直播的速度产生，两次刷新之间本来就没有数据，不做停滞检测，只记录指标
+        metrics.observe(job.id, 'live', urlparse(fmt['url']).hostname, recorded, None, None, limiter.waited)
+        export_metrics()
+        if scheduler.on_progress is not None:
+            scheduler.on_progress(job)
+
+    def on_file(path, seconds):
+        if temp_dir:
+            final = os.path.join(job.save_path, os.path.basename(path))
+            atomic_move(path, final, write_buffer_size or DEFAULT_WRITE_BUFFER)
+            path = final
+        log(f"🎞 {os.path.basename(path)} 已保存（{format_eta(seconds)}）")
+
+    def on_gap(segments, seconds):
+        log(f"⚠️ {job.title}: 漏掉 {segments} 个分片（约 {seconds:.0f}s），之后的内容录到新文件")
+
+    def refresh_url():
+        # 播放列表地址过期：重新解析拿新地址，已经不在直播了返回 None 结束录制
+        fresh = probe_live(job.url)
+        if not (fresh.get('is_live') or fresh.get('live_status') == 'is_live'):
+            return None
+        new = live_format(fresh, job.quality)
+        return new and new['url']
+
+    log(f"🔴 开始录制: {job.title}（{fmt.get('format_id')}，{fmt.get('height') or '?'}p，"
+        f"每 {format_eta(live_segment_seconds)} 一个文件）")
+    try:
+        with engine_ydl_class()(ydl_opts) as ydl:
+            recorder = LiveRecorder(
+                fmt['url'], directory, basename, roll_seconds=live_segment_seconds,
+                headers=fmt.get('http_headers'),
+                opener=lambda url, headers: ydl.urlopen(yt_dlp.networking.Request(url, headers=headers)),
+                stop_event=job.stop_event, progress=progress, on_file=on_file, on_gap=on_gap,
+                on_retry=job.record_retry, refresh_url=refresh_url, retry_policy=retry_policy,
+                min_free=disk_space.min_free if disk_space is not None else None,
+                write_buffer=write_buffer_size or -1,
+                first_index=next_index(basename, directory, job.save_path))
+            stats = recorder.record()
+    finally:
+        job.add_transferred(limiter.bytes)
+    reason = "已停止" if job.stop_event.is_set() else "直播已结束"
+    log(f"⏹ 录制结束（{reason}）: {job.title}: {stats['files']} 个文件，时长 {format_eta(stats['seconds'])}，"
+        f"{format_bytes(stats['bytes'])}"
+        + (f"，漏掉 {stats['missed_segments']} 个分片（约 {stats['missed_seconds']:.0f}s）" if stats['gaps'] else ""))
+    return None
+
+def run_download_task(job, scheduler):
+    """下载阶段：用解析阶段拿到的 info 直接下载，不再重复解析
+
+    文件落盘后就返回，合并/转码不在这里做：还需要后期处理时返回对应的 ydl，
+    由调用方交给 run_postprocess_task；不需要时返回 None
+    """
+    def format_selected(spec):
+        job.format_spec = spec
+        scheduler.journal(job, format=spec)
+
+    ydl_opts = build_ydl_opts(job.quality, job.save_path, job.section)
+    ydl_opts['progress_hooks'].append(lambda d: update_job_progress(job, d, scheduler))
+    ydl_opts['defer_postprocess'] = True
+    # 任务内的所有连接（分段、音视频两路流）共用一个限速器，顺便统计实际传输的字节数
+    limiter = ydl_opts['bandwidth_limiter'] = job.limiter = bandwidth.limiter(job.rate_limit or job_rate_limit)
+    # 停滞时断开的连接按 yt-dlp 的网络错误处理，由它（或分段下载）从断开处续传
+    limiter.reconnect_error = yt_dlp.networking.exceptions.TransportError
+    job.metrics = metrics.job(job.id, job.title, stall_speed=stall_speed, stall_seconds=stall_seconds)
+    # 恢复/重试的任务沿用上次选好的格式，才能接着已有的 .part 文件续传
+    ydl_opts['resume_format'] = job.format_spec
+    ydl_opts['format_selected_hook'] = format_selected
+    # 连接断开、分片失败在 yt-dlp / 分段下载内部就地重试，不用整个任务重来
+    ydl_opts['retries'] = ydl_opts['fragment_retries'] = HTTP_RETRIES
+    ydl_opts['retry_sleep_functions'] = {
+        'http': retry_policy.sleep_function(ERR_NETWORK, job.record_retry),
+        'fragment': retry_policy.sleep_function(ERR_NETWORK, job.record_retry),
+    }
+    ydl_opts['segment_retry_hook'] = job.record_retry
+    # 后期处理（合并/转码）开始时切换任务状态
+    ydl_opts['postprocessor_hooks'] = [
+        lambda d: d['status'] == 'started' and job.state == JOB_DOWNLOADING and scheduler.set_state(job, JOB_POSTPROCESSING)
+    ]
+
+    with job.lock:
+        job.streams.clear()  # 重试时按本次的文件重新汇总进度（续传的部分会算进去）
+    try:
+        with contextlib.ExitStack() as stack:
+            ydl = stack.enter_context(engine_ydl_class()(ydl_opts))
+            if job.info is None:
+                # 下载地址过期（403）等情况会清掉 info，重新解析拿新地址
+                log("正在连接下载服务器...")
+                start = time.time()
+                job.info = extract_info_cached(ydl, job.url)
+                log(f"🔍 重新解析耗时 {time.time() - start:.2f}s")
+            if media_cache is not None and fetch_from_cache(job, ydl, scheduler):
+                return None
+            # 下载过程会修改 info，重试时还要用，传副本
+            ydl.process_ie_result(copy.deepcopy(job.info), download=True)
+
+            if ydl.pending_postprocess:
+                stack.pop_all()  # ydl 由后期处理阶段负责关闭
+                return ydl
+    finally:
+        job.add_transferred(limiter.bytes)
+
+    record_stream_timings(job, ydl)
+    store_in_cache(job, ydl)
+    return None
+
+def media_cache_key(ydl, info, format_id):
+    # 提取成 m4a / mp3 的和原始音频是不同的文件，嵌入了字幕、封面、元数据的也是
+    variant = [ydl.params['audio_format']] if ydl.params.get('audio_format') else []
+    embeds = ydl._sidecar_embeds()
+    if 'subtitles' in embeds:
+        variant.append('subs=' + ','.join(ydl.params.get('subtitleslangs') or []))
+    variant += sorted(name for name in embeds if name != 'subtitles')
+    if ydl.params.get('section'):
+        start, end = ydl.params['section']
+        variant.append(f"section={start:g}-{'' if end is None else f'{end:g}'}")
+    return media_cache.key(info.get('extractor_key') or info.get('extractor'), info.get('id'), format_id,
+                           '+'.join(variant))
+
+def fetch_from_cache(job, ydl, scheduler):
+    """选中的格式在本地缓存里时直接把文件放到保存目录，返回是否命中"""
+    if write_subtitles or write_thumbnail or write_info_json:
+        return False  # 缓存里只有视频文件，单独的字幕、封面、info.json 还得照常下载
+    info = job.info
+    spec = job.format_spec
+    if not spec:
+        selection = select_formats(info, **format_criteria(job.quality))
+        spec = selection and selection.format_spec
+    if not spec or not info.get('id'):
+        return False
+    entry = media_cache.lookup(media_cache_key(ydl, info, spec))
+    if entry is None:
+        return False
+    dest = ydl.prepare_filename(dict(info, ext=entry.ext))
+    if os.path.exists(dest):
+        return False  # 保存目录里已经有同名文件，照常交给 yt-dlp 处理
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    method = media_cache.materialize(entry, dest)
+    if method is None:
+        return False
+    job.format_spec = spec
+    update_job_progress(job, {'status': 'finished', 'filename': dest, 'downloaded_bytes': entry.size,
+                              'total_bytes': entry.size, 'info_dict': {}}, scheduler)
+    ydl.record_download_archive(info)
+    log(f"📦 缓存命中（{CACHE_METHOD_LABELS[method]}）: {job.title} [{spec}] {format_bytes(entry.size)}")
+    return True
+
+CACHE_METHOD_LABELS = {'hardlink': "硬链接", 'reflink': "写时复制", 'copy': "复制"}
+
+def store_in_cache(job, ydl):
+    """把这次下载（并处理）完成的文件加入本地缓存；缓存出错不影响任务本身"""
+    if media_cache is None:
+        return
+    for info in ydl.finished_outputs:
+        path = info.get('filepath')
+        if not path or not os.path.isfile(path) or not info.get('id') or not info.get('format_id'):
+            continue
+        try:
+            media_cache.store(media_cache_key(ydl, info, info['format_id']), path)
+        except (OSError, sqlite3.Error) as e:
+            log(f"⚠️ 写入缓存失败: {job.title}: {e}")
+
+def run_with_retry(job, task, *args):
+    """执行解析/下载阶段，失败时按错误类型决定是否重试
+
+    限流、网络中断按指数退避等待后重试；下载地址过期、解析出错时丢掉缓存的 info 重新解析。
+    已下载的部分保留在 .part / 分段记录里，重试时续传，不会从头下载
+    """
+    retry = 0
+    while True:
+        try:
+            return task(job, *args)
+        except Exception as e:
+            kind = classify_error(e)
+            retry += 1
+            if retry >= retry_policy.attempts or not retry_policy.retryable(kind):
+                raise
+            job.record_retry(kind)
+            if kind in (ERR_EXPIRED, ERR_EXTRACTOR):
+                info_cache.invalidate(job.url)
+                job.info = None
+            delay = retry_policy.delay(retry, kind, e)
+            log(f"🔁 {ERROR_LABELS[kind]}，{delay:.1f}s 后重试（第 {retry} 次）: {job.title}: {e}")
+            time.sleep(delay)
+
+def format_retries(job):
+    counts = "，".join(f"{ERROR_LABELS[k]} {n}" for k, n in job.retries.items())
+    return f"重试 {sum(job.retries.values())} 次（{counts}），浪费流量约 {format_bytes(job.wasted_bytes)}"
+
+def run_postprocess_task(job, ydl):
+    """后期处理阶段：合并/转码下载阶段留下的文件，并写入下载记录"""
+    with ydl:
+        ydl.run_pending_postprocess()
+    record_stream_timings(job, ydl)
+    store_in_cache(job, ydl)
+
+def record_stream_timings(job, ydl):
+    job.stream_timings = [{k: v for k, v in t.items() if k != 'start'} for t in ydl.stream_timings]
+    if job.stream_timings:
+        log(f"⏱ 耗时明细 ({job.title}): {format_stream_timings(job.stream_timings)}")
+    if ydl.ffmpeg_cpu:
+        log(f"🧮 FFmpeg 共用 CPU {ydl.ffmpeg_cpu:.2f}s: {job.title}")
+
+def format_stream_timings(timings):
+    parts = []
+    for t in timings:
+        if t['stage'] == 'download':
+            kind = "音频" if t['kind'] == 'audio' else "视频"
+            parts.append(f"f{t['format_id']} {kind} {t.get('elapsed', 0):.1f}s")
+        elif t['stage'] == 'stream':
+            parts.append(f"流式下载+处理 {t['elapsed']:.1f}s")
+        else:
+            parts.append(f"后期处理 {t['elapsed']:.1f}s")
+        if t.get('cpu'):
+            parts[-1] += f"（FFmpeg CPU {t['cpu']:.2f}s）"
+    return " | ".join(parts)
+
+_engine_ydl_class = None
+
+def engine_ydl_class():
+    """返回带分段下载、按需加载提取器的 YoutubeDL 子类（yt-dlp 是延迟加载的，只能在加载后再定义）"""
+    global _engine_ydl_class
+    if _engine_ydl_class is not None:
+        return _engine_ydl_class
+
+    import urllib.error
+    import urllib.request
+    from yt_dlp.downloader import FFmpegFD, HttpFD, get_suitable_downloader
+    from yt_dlp.downloader.common import FileDownloader
+    from yt_dlp.networking import Request
+    from yt_dlp.networking._urllib import UrllibRH
+    from yt_dlp.networking.common import _REQUEST_HANDLERS, _RH_PREFERENCES
+    from yt_dlp.postprocessor import (
+        EmbedThumbnailPP,
+        FFmpegEmbedSubtitlePP,
+        FFmpegExtractAudioPP,
+        FFmpegMergerPP,
+        FFmpegMetadataPP,
+        FFmpegPostProcessor,
+        MoveFilesAfterDownloadPP,
+    )
+    from yt_dlp.postprocessor.ffmpeg import FFmpegFixupPostProcessor
+    from yt_dlp.utils import (
+        ISO639Utils,
+        PostProcessingError,
+        determine_protocol,
+        make_parent_dirs,
+        prepend_extension,
+        replace_extension,
+    )
+
+    class PooledOpenHandler(urllib.request.BaseHandler):
+        """urllib 建立 http(s) 连接的那一步改从共享连接池取连接
+
+        请求头、cookie、跳转、解压仍由 yt-dlp 的 urllib 处理器完成；走代理的请求返回 None，
+        交回 yt-dlp 原来的 HTTPHandler
+        """
+        handler_order = 499  # 排在 yt-dlp 的 HTTPHandler（500）前面
+
+        def __init__(self, context, source_address):
+            self._context = context
+            self._source_address = source_address and (source_address, 0)
+
+        def http_open(self, req):
+            return self._open(req, None)
+
+        def https_open(self, req):
+            return self._open(req, self._context)
+
+        def _open(self, req, context):
+            if req.has_proxy() or req._tunnel_host or req.has_header('Ytdl-socks-proxy'):
+                return None
+            # 和 urllib 的 do_open 一样合并请求头，只是不加 Connection: close
+            headers = dict(req.unredirected_hdrs)
+            headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+            headers = {name.title(): value for name, value in headers.items()}
+            try:
+                response = get_http_pool().request(
+                    req.get_method(), req.full_url, req.data, headers, req.timeout, context, self._source_address,
+                    encode_chunked=req.has_header('Transfer-encoding'))
+            except OSError as e:
+                raise urllib.error.URLError(e)
+            response.url = req.get_full_url()
+            response.msg = response.reason
+            return response
+
+    class PooledRH(UrllibRH):
+        """yt-dlp 的 urllib 请求处理器，http(s) 连接改用进程共享的连接池
+
+        SSLContext 按配置共用：TLS 会话只能在创建它的 context 上恢复，每个 YoutubeDL 各建一个就没法跨任务复用
+        """
+        RH_NAME = 'pooled'
+        _ssl_contexts = {}
+        _ssl_lock = threading.Lock()
+
+        def _make_sslcontext(self, legacy_ssl_support=None):
+            legacy = self.legacy_ssl_support if legacy_ssl_support is None else legacy_ssl_support
+            key = (self.verify, legacy, self.prefer_system_certs, tuple(sorted(self._client_cert.items())))
+            with self._ssl_lock:
+                if key not in self._ssl_contexts:
+                    self._ssl_contexts[key] = super()._make_sslcontext(legacy_ssl_support)
+                return self._ssl_contexts[key]
+
+        def _create_instance(self, proxies, cookiejar, legacy_ssl_support=None):
+            opener = super()._create_instance(proxies, cookiejar, legacy_ssl_support)
+            opener.add_handler(PooledOpenHandler(self._make_sslcontext(legacy_ssl_support), self.source_address))
+            return opener
+
+    def pooled_preference(rh, request):
+        """只对连接池能直接处理的请求优先：不走代理、不伪装浏览器的 http(s) 请求
+
+        其他请求（代理、impersonate、ws 等）返回 0，按 yt-dlp 自己的偏好选处理器（如 requests、curl_cffi）
+        """
+        if not isinstance(rh, PooledRH):
+            return 0
+        if urlparse(request.url).scheme not in ('http', 'https') or request.extensions.get('impersonate'):
+            return 0
+        if request.proxies or rh.proxies:
+            return 0
+        # 高于 requests 处理器（100）
+        return 200
+
+    class SegmentedFD(FileDownloader):
+        """把 http(s) 格式拆成多个 Range 分段并发下载，支持跨重启续传"""
+        FD_NAME = 'segmented'
+
+        def real_download(self, filename, info_dict):
+            tmpfilename = self.temp_name(filename)
+            self.report_destination(filename)
+            start = time.time()
+
+            def progress(downloaded, total, speed):
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': total,
+                    'speed': speed,
+                    'eta': (total - downloaded) / speed if speed else None,
+                    'elapsed': time.time() - start,
+                    'filename': filename,
+                    'tmpfilename': tmpfilename,
+                }, info_dict)
+
+            downloader = SegmentedDownloader(
+                info_dict['url'], tmpfilename, total_bytes=info_dict.get('filesize'),
+                headers=info_dict.get('http_headers'),
+                segment_size=self.params.get('segment_size') or DEFAULT_SEGMENT_SIZE,
+                workers=self.params['segment_workers'],
+                opener=lambda url, headers: self.ydl.urlopen(Request(url, headers=headers)),
+                progress=progress, retry_policy=retry_policy, on_retry=self.params.get('segment_retry_hook'),
+                write_buffer=self.params.get('write_buffer_size') or -1,
+                preallocate=self.params.get('preallocate', True))
+            try:
+                stats = downloader.download()
+            except RangeNotSupported as e:
+                # 预先撑满的 .part 和分段记录已经删掉（见 SegmentedDownloader.download），HttpFD 从头下载
+                log(f"⚠️ 服务器不支持分段下载 ({e})，改用单连接下载")
+                fd = HttpFD(self.ydl, self.params)
+                for ph in self._progress_hooks:
+                    fd.add_progress_hook(ph)
+                return fd.real_download(filename, info_dict)
+
+            log(f"📊 分段下载完成: {format_bytes(stats['downloaded_bytes'])} / {stats['elapsed']:.1f}s，"
+                f"平均 {format_bytes(stats['speed'])}/s ({stats['segments']} 段，{self.params['segment_workers']} 并发"
+                + (f"，续传跳过 {format_bytes(stats['resumed_bytes'])}" if stats['resumed_bytes'] else "") + ")")
+            self.try_rename(tmpfilename, filename)
+            self._hook_progress({
+                'status': 'finished',
+                'downloaded_bytes': stats['total_bytes'],
+                'total_bytes': stats['total_bytes'],
+                'elapsed': stats['elapsed'],
+                'filename': filename,
+            }, info_dict)
+            return True
+
+    class SectionFD(FileDownloader):
+        """DASH 直链只下载覆盖 section_start ~ section_end 的字节范围（见 sections.SectionDownloader）
+
+        没有 sidx 索引等情况下交给 FFmpegFD，由 FFmpeg 直接读网络地址并剪好
+        """
+        FD_NAME = 'section'
+
+        def real_download(self, filename, info_dict):
+            tmpfilename = self.temp_name(filename)
+            self.report_destination(filename)
+            start = time.time()
+
+            def progress(downloaded, total, speed):
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': total,
+                    'speed': speed,
+                    'eta': (total - downloaded) / speed if speed else None,
+                    'elapsed': time.time() - start,
+                    'filename': filename,
+                    'tmpfilename': tmpfilename,
+                }, info_dict)
+
+            downloader = SectionDownloader(
+                info_dict['url'], tmpfilename, info_dict.get('section_start') or 0, info_dict.get('section_end'),
+                headers=info_dict.get('http_headers'),
+                opener=lambda url, headers: self.ydl.urlopen(Request(url, headers=headers)),
+                progress=progress, retry_policy=retry_policy, on_retry=self.params.get('segment_retry_hook'),
+                write_buffer=self.params.get('write_buffer_size') or -1)
+            try:
+                stats = downloader.download()
+            except SectionUnsupported as e:
+                log(f"⚠️ 格式 {info_dict.get('format_id')} 不能按字节范围截取 ({e})，改用 FFmpeg 读取")
+                fd = FFmpegFD(self.ydl, self.params)
+                for ph in self._progress_hooks:
+                    fd.add_progress_hook(ph)
+                return fd.real_download(filename, info_dict)
+
+            self.try_rename(tmpfilename, filename)
+            self.ydl._section_offsets[filename] = stats['offset']
+            self._hook_progress({
+                'status': 'finished',
+                'downloaded_bytes': stats['total_bytes'],
+                'total_bytes': stats['total_bytes'],
+                'elapsed': stats['elapsed'],
+                'filename': filename,
+            }, info_dict)
+            return True
+
+    class AtomicMoveFilesPP(MoveFilesAfterDownloadPP):
+        """把文件从临时目录移到保存目录；跨磁盘时用 storage.atomic_move，保存目录里不会出现写了一半的文件"""
+        def run(self, info):
+            dl_path, dl_name = os.path.split(info['filepath'])
+            finaldir = info.get('__finaldir', dl_path)
+            finalpath = os.path.join(finaldir, dl_name)
+            if self._downloaded:
+                info['__files_to_move'][info['filepath']] = finalpath
+
+            for oldfile, newfile in info['__files_to_move'].items():
+                newfile = newfile or os.path.join(finaldir, os.path.basename(oldfile))
+                if os.path.abspath(oldfile) == os.path.abspath(newfile):
+                    continue
+                if not os.path.exists(oldfile):
+                    self.report_warning(f'File "{oldfile}" cannot be found')
+                    continue
+                if os.path.exists(newfile):
+                    if not self.get_param('overwrites', True):
+                        self.report_warning(
+                            f'Cannot move file "{oldfile}" out of temporary directory since "{newfile}" already exists. ')
+                        continue
+                    self.report_warning(f'Replacing existing file "{newfile}"')
+                try:
+                    make_parent_dirs(newfile)
+                except OSError as e:
+                    raise PostProcessingError(f'Unable to create directory: {e}') from e
+                self.to_screen(f'Moving file "{oldfile}" to "{newfile}"')
+                try:
+                    atomic_move(oldfile, newfile, self.get_param('write_buffer_size') or DEFAULT_WRITE_BUFFER)
+                except OSError as e:
+                    raise PostProcessingError(f'无法移动到保存目录: {e}') from e
+
+            info['filepath'] = finalpath
+            return [], info
+
+    class PlannedFFmpegMixin:
+        """按 remux.Plan 执行 FFmpeg：记录处理方案；转码时按本机核数分配线程；统计 FFmpeg 实际用掉的 CPU 时间"""
+        def run_planned(self, inputs, output, args, plan=None, label=None):
+            label = label or os.path.basename(output)
+            if plan is not None:
+                log(f"🧮 {label}: {plan.describe()}")
+            with contextlib.ExitStack() as stack:
+                threads = None
+                if plan is not None and not plan.copy_only:
+                    threads = stack.enter_context(transcode_slots.acquire())
+                    log(f"🔥 需要转码，FFmpeg 使用 {threads} 个线程")
+                # -benchmark 让 FFmpeg 结束时输出自己用掉的 CPU 时间，并发的其他 FFmpeg 不会算进来
+                (first, first_args), *rest = inputs
+                stderr = self.real_run_ffmpeg(
+                    [(first, ['-benchmark', *first_args]), *rest],
+                    [(output, [*(plan.codec_args(threads) if plan is not None else []), *args])])
+            usage = remux.parse_benchmark(stderr)
+            if usage is not None:
+                self._downloader.ffmpeg_cpu += usage[0]
+                if plan is not None:
+                    log(f"⏱ FFmpeg CPU {usage[0]:.2f}s / 实际 {usage[1]:.2f}s: {label}")
+            return stderr
+
+    class PlannedAudioPP(PlannedFFmpegMixin, FFmpegExtractAudioPP):
+        """仅音频：源编码目标容器装得下就直接复制（重新封装），装不下才转码，代替 FFmpegExtractAudioPP
+
+        yt-dlp 原来的做法是按 preferredcodec 一律转码（m4a 源转 mp3 也要整段重新编码），
+        这里按 audio_format 和格式信息里的编码交给 remux.plan_audio 决定
+        """
+        def run(self, info):
+            path = info['filepath']
+            plan = remux.plan_audio(info.get('acodec'), info.get('ext'),
+                                    self._downloader.params.get('audio_format') or audio_format, AUDIO_BITRATE)
+            output = replace_extension(path, plan.container)
+            if plan.copy_only and output == path and info.get('vcodec') in (None, 'none'):
+                log(f"🧮 {os.path.basename(path)}: {plan.describe()}，已经是目标格式，不需要处理")
+                return [], info
+            temp_filename = prepend_extension(output, 'temp')
+            self.run_planned([(path, [])], temp_filename, ['-vn', '-map', '0:a:0'], plan, label=os.path.basename(output))
+            os.replace(temp_filename, output)
+            info['filepath'] = output
+            info['ext'] = plan.container
+            return ([path] if path != output else []), info
+
+    class SidecarMuxPP(PlannedFFmpegMixin, FFmpegMergerPP):
+        """合并音视频的同时嵌入字幕、封面、章节和元数据，整个文件只重新封装一次
+
+        yt-dlp 原本合并之后再由 FFmpegMetadataPP、FFmpegEmbedSubtitlePP、EmbedThumbnailPP 各自把整个文件
+        重写一遍；不需要合并时（单文件格式、流式处理、仅音频）在第一个嵌入步骤里一次做完。
+        embeds 为 {'subtitles' / 'thumbnail': 嵌入后是否保留单独的文件, 'metadata': True}。
+        只下载一段时，还没剪的各路流和字幕也在这一次里按同一时间点剪好。
+        合并时每路流复制还是转码由 remux.plan_merge 决定，不会悄悄重新编码
+        """
+        def __init__(self, downloader, embeds, merge):
+            super().__init__(downloader)
+            self._embeds = embeds
+            self._merge = merge
+
+        def run(self, info):
+            filename, ext = info['filepath'], info['ext']
+            section = self._downloader._section(info)
+            input_args = {}
+            if self._merge:
+                inputs = list(info['__files_to_merge'])
+                for path in inputs:
+                    offset = self._downloader._section_offsets.pop(path, None)
+                    if section is not None and offset is not None:
+                        input_args[path] = cut_input_args(*section, offset)
+                # 容器在选格式时已经按编码定好（见 EngineYoutubeDL._plan_container），这里文件名已定，不再换容器
+                plan = remux.plan_merge(info['requested_formats'], ext, AUDIO_BITRATE, fallback=None)
+                copied = {(p.kind, p.index) for p in plan.streams if p.copy}
+                args = []
+                audio_streams = video_streams = 0
+                for i, fmt in enumerate(info['requested_formats']):
+                    if fmt.get('acodec') != 'none':
+                        args += ['-map', f'{i}:a:0']
+                        if (('audio', audio_streams) in copied and fmt['protocol'].startswith('m3u8')
+                                and self.get_audio_codec(fmt['filepath']) == 'aac'):
+                            args += [f'-bsf:a:{audio_streams}', 'aac_adtstoasc']
+                        audio_streams += 1
+                    if fmt.get('vcodec') != 'none':
+                        args += ['-map', f'{i}:v:0']
+                        video_streams += 1
+                files_to_delete = list(inputs)
+            else:
+                inputs, files_to_delete = [filename], []
+                plan = None
+                args = list(self.stream_copy_opts())
+                # 按格式信息数视频流，不另外调用 ffprobe（不一定装了）；提取出来的音频文件没有视频流
+                video_streams = 0 if ext in remux.AUDIO_CONTAINERS else sum(
+                    f.get('vcodec') != 'none' for f in info.get('requested_formats') or [info])
+            embedded, sidecars, attachments = [], [], 0
+
+            subtitles = self._subtitles(info) if 'subtitles' in self._embeds else []
+            if subtitles:
+                if not self._merge:
+                    args += ['-map', '-0:s']  # 换成这次下载的字幕
+                for n, (lang, path) in enumerate(subtitles):
+                    args += ['-map', f'{len(inputs)}:0', f'-metadata:s:s:{n}',
+                             f'language={ISO639Utils.short2long(lang) or lang}']
+                    inputs.append(path)
+                    if section is not None:
+                        input_args[path] = cut_input_args(*section)
+                if ext in ('mp4', 'mov', 'm4a'):
+                    args += ['-c:s', 'mov_text']
+                embedded.append(f"嵌入字幕 {len(subtitles)} 条")
+                if not self._embeds['subtitles']:
+                    sidecars += [path for _, path in subtitles]
+
+            thumbnail = self._thumbnail(info) if 'thumbnail' in self._embeds else None
+            if thumbnail:
+                thumb_ext = os.path.splitext(thumbnail)[1][1:].lower()
+                if ext in ('mkv', 'mka'):
+                    args += ['-attach', self._ffmpeg_filename_argument(thumbnail),
+                             f'-metadata:s:t:{attachments}', f"mimetype=image/{thumb_ext.replace('jpg', 'jpeg')}"]
+                    attachments += 1
+                elif ext in ('mp4', 'm4v', 'mov', 'm4a', 'mp3'):
+                    # 封面作为一路只有一帧的视频流；webp 等格式播放器不认，转成 jpg（只编码一张图）
+                    args += ['-map', f'{len(inputs)}:0', f'-disposition:v:{video_streams}', 'attached_pic',
+                             f'-c:v:{video_streams}', 'copy' if thumb_ext in ('jpg', 'jpeg', 'png') else 'mjpeg']
+                    inputs.append(thumbnail)
+                else:
+                    self.report_warning(f'{ext} 文件不支持嵌入封面，保留为单独的文件')
+                    thumbnail = None
+                if thumbnail:
+                    embedded.append("嵌入封面")
+                    if not self._embeds['thumbnail']:
+                        sidecars.append(thumbnail)
+
+            metadata_filename = None
+            if 'metadata' in self._embeds:
+                metadata_pp = FFmpegMetadataPP(self._downloader)
+                chapters = self._chapters(info, section)
+                if chapters:
+                    metadata_filename = replace_extension(filename, 'meta')
+                    list(metadata_pp._get_chapter_opts(chapters, metadata_filename))  # 只借用它写章节文件
+                    args += ['-map_metadata', str(len(inputs)), '-map_chapters', str(len(inputs))]
+                    inputs.append(metadata_filename)
+                args += [arg for opt in metadata_pp._get_metadata_opts(info) for arg in opt]
+                infojson = info.get('infojson_filename')
+                if ext in ('mkv', 'mka') and infojson and os.path.exists(infojson):
+                    args += ['-attach', self._ffmpeg_filename_argument(infojson),
+                             f'-metadata:s:t:{attachments}', 'mimetype=application/json']
+                    attachments += 1
+                embedded.append(f"嵌入章节 {len(chapters)} 个和元数据" if chapters else "嵌入元数据")
+            if ext == 'mp3':
+                args += ['-id3v2_version', '3']
+
+            info['__sidecars_embedded'] = True
+            if not self._merge and not embedded:
+                return sidecars, info
+            if input_args and self._merge:
+                embedded.insert(0, f"剪出 {format_timestamp(section[0])}~"
+                                   f"{format_timestamp(section[1]) if section[1] is not None else '结尾'}")
+            if embedded:
+                log(f"🧩 {'合并并' if self._merge else ''}{'、'.join(embedded)}: {os.path.basename(filename)}")
+            else:
+                self.to_screen(f'Merging formats into "{filename}"')
+            temp_filename = prepend_extension(filename, 'temp')
+            try:
+                self.run_planned([(path, input_args.get(path, [])) for path in inputs], temp_filename, args, plan,
+                                 label=f"合并 {os.path.basename(filename)}" if self._merge else None)
+            finally:
+                if metadata_filename and os.path.exists(metadata_filename):
+                    os.remove(metadata_filename)
+            os.replace(temp_filename, filename)
+            return files_to_delete + sidecars, info
+
+        def _subtitles(self, info):
+            """可以嵌入的字幕 [(语言, 文件)]"""
+            ext = info['ext']
+            if ext not in FFmpegEmbedSubtitlePP.SUPPORTED_EXTS:
+                self.report_warning(f'{ext} 文件不支持嵌入字幕，保留为单独的文件')
+                return []
+            subtitles = []
+            for lang, sub in (info.get('requested_subtitles') or {}).items():
+                path = sub.get('filepath')
+                if not path or not os.path.exists(path) or sub.get('ext') == 'json':
+                    continue
+                if ext == 'webm' and sub.get('ext') != 'vtt':
+                    self.report_warning(f'webm 文件只能嵌入 WebVTT 字幕，跳过 {lang}.{sub.get("ext")}')
+                    continue
+                subtitles.append((lang, path))
+            return subtitles
+
+        @staticmethod
+        def _thumbnail(info):
+            return next((t['filepath'] for t in reversed(info.get('thumbnails') or [])
+                         if t.get('filepath') and os.path.exists(t['filepath'])), None)
+
+        @staticmethod
+        def _chapters(info, section=None):
+            # 合并前最终文件还不存在，最后一章没有结束时间时用视频时长，不用 ffprobe 去量
+            chapters = [dict(c) for c in info.get('chapters') or [] if c.get('start_time') is not None]
+            if chapters and not chapters[-1].get('end_time'):
+                chapters[-1]['end_time'] = info.get('section_end') or info.get('duration')
+            if not chapters or not chapters[-1].get('end_time'):
+                return []
+            if section is None:
+                return chapters
+            # 只下载一段时保留和这段重叠的章节，时间改成相对片段开头
+            start, end = section
+            clipped = []
+            for c in chapters:
+                c_start, c_end = max(c['start_time'], start), min(c['end_time'], end if end is not None else c['end_time'])
+                if c_end > c_start:
+                    clipped.append(dict(c, start_time=c_start - start, end_time=c_end - start))
+            return clipped
+
+    class EngineYoutubeDL(yt_dlp.YoutubeDL):
+        def __init__(self, params=None, auto_init=False):
+            # 默认不注册全部上千个提取器，解析时按链接只加载匹配的那一个（见 extract_info）
+            super().__init__(params, auto_init=auto_init)
+            if self.params.get('format_criteria') is not None:
+                self.format_selector = self._select_by_criteria
+            self._merge_output_format = self.params.get('merge_output_format')  # 配置的合并容器，按编码可能换成 mkv
+            self.stream_timings = []  # 每路流下载及后期处理的耗时明细
+            self._stream_threads = None
+            self._sidecar_threads = None  # 和视频同时下载字幕、封面的后台线程
+            self._streaming_inputs = None  # 流式后期处理：推迟到 post_process 时边下边处理的各路流
+            self._streamed_output = None
+            self._merging = False
+            self._section_offsets = {}  # 只下载一段时：还没剪的文件 -> 文件开头对应的原视频时间
+            self.pending_postprocess = []  # 已下载完、等待后期处理的文件（defer_postprocess 模式）
+            self.finished_outputs = []  # 后期处理完成后的 info（filepath 为最终文件），用于写入本地缓存
+            self._pending_archive = []
+            self._last_warning = None
+            self.ffmpeg_cpu = 0.0  # 本任务 FFmpeg 用掉的 CPU 时间（秒）
+
+        @functools.cached_property
+        def _request_director(self):
+            if not connection_pool:
+                return super()._request_director
+            return self.build_request_director([*_REQUEST_HANDLERS.values(), PooledRH],
+                                               [*_RH_PREFERENCES, pooled_preference])
+
+        def _select_by_criteria(self, ctx):
+            """yt-dlp 的格式选择回调：按 format_criteria 选出确切的 format_id，再交回 yt-dlp 展开"""
+            resume = self.params.get('resume_format')
+            if resume and set(resume.split('+')) <= {f.get('format_id') for f in ctx['formats']}:
+                log(f"♻️ 沿用上次选择的格式 {resume}，继续未完成的下载")
+                self._plan_container(resume, ctx['formats'])
+                yield from self.build_format_selector(resume)(ctx)
+                return
+            selection = select_formats(ctx['formats'], **self.params['format_criteria'])
+            if selection is None:
+                return
+            hook = self.params.get('format_selected_hook')
+            if hook is not None:
+                hook(selection.format_spec)
+            size = selection.filesize
+            log(f"🎯 选择格式 {selection.format_spec}: {selection.describe()}"
+                + (f"，约 {format_bytes(size)}" if size else "")
+                + (f"（{selection.relaxed}）" if selection.relaxed else ""))
+            self._plan_container(selection.format_spec, ctx['formats'])
+            yield from self.build_format_selector(selection.format_spec)(ctx)
+
+        def _plan_container(self, format_spec, formats):
+            """合并多路流时按编码定容器：配置的容器装不下某路流的编码时换成 mkv，避免合并时转码
+
+            yt-dlp 按 merge_output_format 决定最终文件名，要在展开格式之前改
+            """
+            container = self._merge_output_format
+            ids = format_spec.split('+')
+            if container is None or len(ids) < 2:
+                return
+            by_id = {f.get('format_id'): f for f in formats}
+            plan = self._merge_plan([by_id[i] for i in ids if i in by_id], container, fallback=remux.FALLBACK_CONTAINER)
+            if plan.container != container:
+                log(f"📦 {plan.note}")
+            self.params['merge_output_format'] = plan.container
+
+        def urlopen(self, req):
+            # 下载器（包括分段下载和流式处理）都经过这里取数据，在这里统一限速
+            response = super().urlopen(req)
+            limiter = self.params.get('bandwidth_limiter')
+            return limiter.wrap(response) if limiter is not None else response
+
+        def extract_info(self, url, download=True, ie_key=None, *args, **kwargs):
+            if ie_key is None:
+                if kwargs.get('force_generic_extractor'):
+                    ie_key = 'Generic'
+                else:
+                    ie = match_extractor(url)
+                    ie_key = ie and ie.ie_key()
+            if ie_key is not None:
+                self.get_info_extractor(ie_key)  # 按需导入并注册
+            return super().extract_info(url, download, ie_key, *args, **kwargs)
+
+        def report_warning(self, message, *args, **kwargs):
+            self._last_warning = message
+            return super().report_warning(message, *args, **kwargs)
+
+        def _wait_for_video(self, ie_result={}):
+            """设置了 wait_for_video 时 yt-dlp 会在这里 sleep 到开播；改为抛出 LiveNotStarted，由录制任务自己等待
+
+            解析线程不会被一个还没开始的直播占住几个小时，等待期间也可以随时停止
+            """
+            # ie_result 为空是提取器报了 UserNotLive（频道当前没有直播），照常报错
+            if (not ie_result or not self.params.get('wait_for_video')
+                    or ie_result.get('_type', 'video') != 'video'
+                    or ie_result.get('formats') or ie_result.get('url')):
+                return
+            if ie_result.get('live_status') == 'is_upcoming':
+                raise LiveNotStarted(self.sanitize_info(ie_result, remove_private_keys=True))
+            # 不是预告中的直播，只是没有格式：按 wait_for_video 没开时的报错处理
+            raise yt_dlp.utils.ExtractorError(self._last_warning or 'No video formats found!', expected=True)
+
+        def process_info(self, info_dict):
+            self._streaming_inputs = [] if self._can_stream(info_dict) else None
+            self._streamed_output = None
+            self._merging = len(info_dict.get('requested_formats') or []) > 1
+            # 视频+音频两路流时，各路流在后台线程同时下载，合并前统一等待
+            if (self._streaming_inputs is None and self.params.get('parallel_streams')
+                    and len(info_dict.get('requested_formats') or []) > 1):
+                self._stream_threads = []
+            if self.params.get('writesubtitles') or self.params.get('writethumbnail'):
+                self._sidecar_threads = []
+            try:
+                return super().process_info(info_dict)
+            finally:
+                self._join_streams()
+                self._join_sidecars()
+                self._stream_threads = None
+                self._sidecar_threads = None
+                self._streaming_inputs = None
+
+        def _audio_plan(self, f):
+            """仅音频的处理方案（和 build_ydl_opts 里的 FFmpegExtractAudio 配置一致），不提取音频时返回 None"""
+            if not any(pp.get('key') == 'FFmpegExtractAudio' for pp in self.params.get('postprocessors') or []):
+                return None
+            return remux.plan_audio(f.get('acodec'), f.get('ext'), self.params.get('audio_format') or audio_format,
+                                    AUDIO_BITRATE)
+
+        @staticmethod
+        def _merge_plan(formats, container, fallback=None):
+            # 多路流合并时每路只取一种流（见 SidecarMuxPP 和 _stream_postprocess 的 -map）
+            return remux.plan_merge(formats, container, AUDIO_BITRATE, fallback=fallback)
+
+        def _sidecar_embeds(self):
+            """build_ydl_opts 里配置的嵌入项：{'subtitles' / 'thumbnail': 是否同时保留单独的文件, 'metadata': True}"""
+            embeds = {}
+            for pp in self.params.get('postprocessors') or []:
+                if pp.get('key') == 'FFmpegMetadata':
+                    embeds['metadata'] = True
+                elif pp.get('key') == 'FFmpegEmbedSubtitle':
+                    embeds['subtitles'] = bool(pp.get('already_have_subtitle'))
+                elif pp.get('key') == 'EmbedThumbnail':
+                    embeds['thumbnail'] = bool(pp.get('already_have_thumbnail'))
+            return embeds
+
+        @staticmethod
+        def _section(info):
+            """只下载一段时返回 (开始秒数, 结束秒数或 None)，否则返回 None"""
+            if not (info.get('section_start') or info.get('section_end')):
+                return None
+            return info.get('section_start') or 0, info.get('section_end')
+
+        def _can_stream(self, info_dict):
+            if not self.params.get('streaming_postprocess') or not ffmpeg_available or info_dict.get('is_live'):
+                return False
+            if self._section(info_dict) is not None:
+                return False
+            formats = info_dict.get('requested_formats') or [info_dict]
+            for f in formats:
+                # 管道不能回退读取，只有分片 MP4（DASH）和 WebM 能边收边解析
+                if determine_protocol(f) not in ('http', 'https'):
+                    return False
+                if not ((f.get('container') or '').endswith('_dash') or f.get('ext') == 'webm'):
+                    return False
+            if len(formats) > 1:
+                return True
+            if formats[0].get('vcodec') != 'none':
+                return False
+            # 只需要重新封装的音频没有可省的转码，yt-dlp 下载后顺手修复容器即可
+            plan = self._audio_plan(formats[0])
+            return plan is not None and not plan.copy_only
+
+        def post_process(self, filename, info, *args, **kwargs):
+            if self._streaming_inputs:
+                filename = self._stream_postprocess(filename, info)
+            # 所有流下载完成后立即开始合并；任意一路失败则整个任务失败
+            self._join_streams(raise_errors=True)
+            # 字幕、封面下载失败不影响视频本身；下载到的文件和视频一起移到保存目录
+            self._join_sidecars(args[0] if args else kwargs.get('files_to_move'))
+            if self.params.get('defer_postprocess'):
+                # 文件已经全部落盘，合并/转码留给后期处理池，下载线程可以马上去下载下一个任务
+                # process_info 返回后会删掉 info 里的部分字段，这里保存一份副本
+                info['filepath'] = filename
+                self.pending_postprocess.append((filename, dict(info), args, kwargs, self._streamed_output))
+                return info
+            return self._timed_post_process(filename, info, *args, **kwargs)
+
+        def _timed_post_process(self, filename, info, *args, **kwargs):
+            start, cpu = time.time(), self.ffmpeg_cpu
+            try:
+                info = super().post_process(filename, info, *args, **kwargs)
+                self.finished_outputs.append(info)
+                return info
+            finally:
+                self.stream_timings.append({'stage': 'postprocess', 'elapsed': time.time() - start,
+                                            'cpu': self.ffmpeg_cpu - cpu})
+
+        def run_pending_postprocess(self):
+            """后期处理阶段：处理下载阶段留下的文件，全部成功后才写下载记录"""
+            pending, self.pending_postprocess = self.pending_postprocess, []
+            for filename, info, args, kwargs, streamed_output in pending:
+                self._streamed_output = streamed_output
+                try:
+                    self._timed_post_process(filename, info, *args, **kwargs)
+                except yt_dlp.utils.PostProcessingError as e:
+                    raise yt_dlp.utils.DownloadError(f"后期处理失败: {e}")
+                finally:
+                    self._streamed_output = None
+            archive, self._pending_archive = self._pending_archive, []
+            for info in archive:
+                super().record_download_archive(info)
+
+        def record_download_archive(self, info_dict):
+            # 后期处理推迟执行时，下载记录也要等它成功后再写，合并失败的视频下次还能重新下载
+            if self.pending_postprocess:
+                self._pending_archive.append(info_dict)
+                return
+            super().record_download_archive(info_dict)
+
+        def _stream_postprocess(self, filename, info):
+            """边下载边用 FFmpeg 合并/转码，返回最终文件路径"""
+            inputs, self._streaming_inputs = self._streaming_inputs, None
+            if len(inputs) > 1:
+                output = filename
+                args = []
+                for i, (_, f) in enumerate(inputs):
+                    args += ['-map', f"{i}:{'a' if f.get('vcodec') == 'none' else 'v'}:0"]
+                # 带音频的视频流这里只取视频
+                plan = self._merge_plan([f if f.get('vcodec') == 'none' else dict(f, acodec='none') for _, f in inputs],
+                                        info['ext'])
+            else:
+                plan = self._audio_plan(inputs[0][1])
+                output = replace_extension(filename, plan.container)
+                args = ['-vn']
+            log(f"🧮 {os.path.basename(output)}: {plan.describe()}")
+            temp_output = prepend_extension(output, 'temp')
+
+            def progress(index, downloaded, finished):
+                name, f = inputs[index]
+                status = {
+                    'status': 'finished' if finished else 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': f.get('filesize') or f.get('filesize_approx'),
+                    'filename': name,
+                    'info_dict': f,
+                }
+                for ph in self._progress_hooks:
+                    ph(status)
+
+            try:
+                with contextlib.ExitStack() as stack:
+                    threads = None if plan.copy_only else stack.enter_context(transcode_slots.acquire())
+                    muxer = StreamingMuxer(
+                        FFmpegPostProcessor(self).executable, [(f['url'], f['http_headers']) for _, f in inputs],
+                        temp_output, [*args, *plan.codec_args(threads)],
+                        opener=lambda url, headers: self.urlopen(Request(url, headers=headers)),
+                        progress=progress)
+                    stats = muxer.run()
+            except StreamingError as e:
+                if os.path.exists(temp_output):
+                    os.remove(temp_output)
+                raise yt_dlp.utils.DownloadError(f"流式处理失败: {e}")
+            os.replace(temp_output, output)
+            timing = {'stage': 'stream', 'elapsed': stats['elapsed']}
+            if stats.get('cpu') is not None:
+                timing['cpu'] = stats['cpu']
+                self.ffmpeg_cpu += stats['cpu']
+            self.stream_timings.append(timing)
+            log(f"🌊 流式{'合并' if len(inputs) > 1 else '转码'}完成 {stats['elapsed']:.1f}s: "
+                f"下载 {format_bytes(stats['bytes_in'])}，输出 {format_bytes(stats['bytes_out'])}，"
+                f"省去中间文件读写 {format_bytes(stats['io_saved'])}")
+            self._streamed_output = output
+            return output
+
+        def run_pp(self, pp, infodict):
+            # 流式处理已经完成了合并/转码，跳过对应的后期处理和针对中间文件的修复
+            if self._streamed_output and isinstance(pp, (FFmpegMergerPP, FFmpegExtractAudioPP, FFmpegFixupPostProcessor)):
+                if isinstance(pp, FFmpegExtractAudioPP):
+                    infodict['filepath'] = self._streamed_output
+                    infodict['ext'] = os.path.splitext(self._streamed_output)[1][1:]
+                return infodict
+            if type(pp) is MoveFilesAfterDownloadPP:
+                pp = AtomicMoveFilesPP(self, pp._downloaded)
+            elif isinstance(pp, (FFmpegMetadataPP, FFmpegEmbedSubtitlePP, EmbedThumbnailPP)):
+                # 嵌入已经在合并时（或第一个嵌入步骤里）一起完成了
+                if infodict.get('__sidecars_embedded'):
+                    return infodict
+                pp = SidecarMuxPP(self, self._sidecar_embeds(), merge=False)
+            elif type(pp) is FFmpegMergerPP:
+                # 合并时按编码决定复制还是转码；只下载一段时，各路流在合并的同时按同一时间点剪好
+                pp = SidecarMuxPP(self, self._sidecar_embeds(), merge=True)
+            elif type(pp) is FFmpegExtractAudioPP:
+                pp = PlannedAudioPP(self, preferredcodec=pp.mapping, preferredquality=pp._preferredquality)
+            return super().run_pp(pp, infodict)
+
+        def dl(self, name, info, subtitle=False, test=False):
+            if subtitle or test:
+                return self._dl(name, info, subtitle, test)
+            if self._streaming_inputs is not None:
+                # 先只记下来，等 post_process 时一次性启动 FFmpeg
+                new_info = self._copy_infodict(info)
+                if new_info.get('http_headers') is None:
+                    new_info['http_headers'] = self._calc_headers(new_info)
+                self._streaming_inputs.append((name, new_info))
+                return True, True
+            timing = {
+                'stage': 'download',
+                'format_id': info.get('format_id'),
+                'kind': 'audio' if info.get('vcodec') == 'none' else 'video',
+                'start': time.time(),
+            }
+            self.stream_timings.append(timing)
+            if self._stream_threads is None:
+                try:
+                    return self._dl(name, info)
+                finally:
+                    timing['elapsed'] = time.time() - timing['start']
+
+            def run():
+                try:
+                    success, _ = self._dl(name, info)
+                    if not success:
+                        timing['error'] = yt_dlp.utils.DownloadError(f"格式 {timing['format_id']} 下载失败")
+                except BaseException as e:
+                    timing['error'] = e
+                finally:
+                    timing['elapsed'] = time.time() - timing['start']
+
+            thread = threading.Thread(target=run, name=f"stream-{timing['format_id']}", daemon=True)
+            thread.start()
+            self._stream_threads.append((thread, timing))
+            return True, True
+
+        def _join_streams(self, raise_errors=False):
+            threads = self._stream_threads or []
+            if self._stream_threads is not None:
+                self._stream_threads = []
+            for thread, _ in threads:
+                thread.join()
+            errors = [timing['error'] for _, timing in threads if 'error' in timing]
+            if raise_errors and errors:
+                raise errors[0]
+
+        def _write_subtitles(self, info_dict, filename):
+            return self._fetch_sidecar("字幕", super()._write_subtitles, info_dict, filename)
+
+        def _write_thumbnails(self, label, info_dict, filename, thumb_filename_base=None):
+            if label != 'video':
+                return super()._write_thumbnails(label, info_dict, filename, thumb_filename_base)
+            return self._fetch_sidecar("封面", super()._write_thumbnails, label, info_dict, filename, thumb_filename_base)
+
+        def _fetch_sidecar(self, label, write, *args):
+            """yt-dlp 下载完字幕、封面才开始下载视频，这里改成放到后台线程，马上返回；
+            下载到的文件在 post_process 时由 _join_sidecars 加入待移动列表
+            """
+            if self._sidecar_threads is None:
+                return write(*args)
+            result = {'label': label, 'files': []}
+
+            def run():
+                try:
+                    result['files'] = write(*args)
+                except Exception as e:
+                    result['error'] = e
+
+            thread = threading.Thread(target=run, name=f"sidecar-{len(self._sidecar_threads)}", daemon=True)
+            thread.start()
+            self._sidecar_threads.append((thread, result))
+            return []
+
+        def _join_sidecars(self, files_to_move=None):
+            threads = self._sidecar_threads or []
+            if self._sidecar_threads is not None:
+                self._sidecar_threads = []
+            for thread, result in threads:
+                thread.join()
+                if 'error' in result or result['files'] is None:
+                    log(f"⚠️ {result['label']}下载失败，不影响视频: {result.get('error', '')}")
+                elif files_to_move is not None:
+                    files_to_move.update(result['files'])
+
+        def _dl(self, name, info, subtitle=False, test=False):
+            # 字幕、测试下载和输出到标准输出的仍按 yt-dlp 原来的方式下载
+            if subtitle or test or name == '-' or not info.get('url'):
+                return super().dl(name, info, subtitle, test)
+            section = self._section(info)
+            if section is not None:
+                return self._dl_section(name, info, *section)
+            # 分段下载只接管普通 http(s) 直链，分片格式（DASH/HLS）仍走 yt-dlp 自己的下载器
+            if self.params.get('segment_workers', 0) > 1 and determine_protocol(info) in ('http', 'https'):
+                fd = SegmentedFD(self, self.params)
+            else:
+                fd = get_suitable_downloader(info, self.params)(self, self.params)
+                self._wrap_output(fd, info)
+            for ph in self._progress_hooks:
+                fd.add_progress_hook(ph)
+            new_info = self._copy_infodict(info)
+            if new_info.get('http_headers') is None:
+                new_info['http_headers'] = self._calc_headers(new_info)
+            return fd.download(name, new_info, subtitle)
+
+        def _dl_section(self, name, info, start, end):
+            """只下载覆盖 [start, end) 的分片或字节范围；其他协议交给 FFmpegFD 直接读网络地址并剪好"""
+            new_info = self._copy_infodict(info)
+            if new_info.get('http_headers') is None:
+                new_info['http_headers'] = self._calc_headers(new_info)
+            protocol = determine_protocol(info)
+            offset = None
+            if protocol == 'http_dash_segments' and isinstance(info.get('fragments'), list):
+                try:
+                    new_info['fragments'], offset = select_fragments(info['fragments'], start, end)
+                except SectionUnsupported as e:
+                    log(f"⚠️ 格式 {info.get('format_id')} 不能按分片截取 ({e})，改用 FFmpeg 读取")
+            if offset is not None:
+                # 去掉片段信息，yt-dlp 才会用自己的 DASH 分片下载器，而不是交给 FFmpeg
+                for key in ('section_start', 'section_end'):
+                    new_info.pop(key, None)
+                fd = get_suitable_downloader(new_info, self.params)(self, self.params)
+                log(f"✂️ 格式 {info.get('format_id')} 只下载 {len(new_info['fragments'])}/{len(info['fragments'])} 个分片")
+            elif protocol in ('http', 'https'):
+                fd = SectionFD(self, self.params)
+            else:
+                fd = get_suitable_downloader(info, self.params)(self, self.params)
+            for ph in self._progress_hooks:
+                fd.add_progress_hook(ph)
+            success, real_download = fd.download(name, new_info)
+            if success and offset is not None:
+                self._section_offsets[name] = offset
+            # 合并时在同一次 FFmpeg 里剪（见 SidecarMuxPP），单个文件现在就剪
+            if success and not self._merging and name in self._section_offsets:
+                self._cut_section(name, start, end, self._section_offsets.pop(name))
+            return success, real_download
+
+        def _cut_section(self, filename, start, end, offset):
+            """从下载到的分片里剪出 [start, end)，直接复制数据，不重新编码"""
+            temp_filename = prepend_extension(filename, 'temp')
+            size = os.path.getsize(filename)
+            try:
+                ffmpeg = FFmpegPostProcessor(self)
+                ffmpeg.real_run_ffmpeg([(filename, cut_input_args(start, end, offset))],
+                                       [(temp_filename, list(ffmpeg.stream_copy_opts()))])
+            except yt_dlp.utils.PostProcessingError as e:
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+                raise yt_dlp.utils.DownloadError(f"剪切片段失败: {e}")
+            os.replace(temp_filename, filename)
+            log(f"✂️ 剪出 {format_timestamp(start)}~{format_timestamp(end) if end is not None else '结尾'}: "
+                f"{format_bytes(size)} -> {format_bytes(os.path.getsize(filename))}")
+
+        def _wrap_output(self, fd, info):
+            """下载器打开输出文件时套上写缓冲；大小确切已知时先分配好剩下部分的磁盘块"""
+            buffer_size = self.params.get('write_buffer_size')
+            filesize = info.get('filesize') if self.params.get('preallocate') else None
+            if not buffer_size and not filesize:
+                return
+            sanitize_open = fd.sanitize_open
+
+            def open_output(filename, open_mode):
+                stream, filename = sanitize_open(filename, open_mode)
+                if filename != '-' and open_mode in ('wb', 'ab'):
+                    if filesize:
+                        reserve_blocks(stream, filesize - os.fstat(stream.fileno()).st_size)
+                    if buffer_size:
+                        stream = BufferedOutput(stream, buffer_size)
+                return stream, filename
+
+            fd.sanitize_open = open_output
+
+    _engine_ydl_class = EngineYoutubeDL
+    return _engine_ydl_class
+
+def export_metrics():
+    """到时间就导出下载指标；写不进去只记日志（同样的错误只记一次），不能让导出中断下载"""
+    global _metrics_export_error
+    error = metrics.maybe_export(metrics_file, METRICS_EXPORT_INTERVAL)
+    if error is not None and str(error) != _metrics_export_error:
+        _metrics_export_error = str(error)
+        log(f"⚠️ 导出下载指标失败: {error}")
+
+def update_job_progress(job, d, scheduler):
+    """把 yt-dlp 的下载进度记到 job 上，是否/多久刷新界面由调用方决定
+
+    视频、音频两路流分别汇报进度，这里按文件汇总成整个任务的进度
+    """
+    if d['status'] not in ('downloading', 'finished'):
+        return
+    total = d.get('total_bytes') or d.get('total_bytes_estimate')
+    downloaded = d.get('downloaded_bytes') or (total if d['status'] == 'finished' else 0)
+    speed = d.get('speed') if d['status'] == 'downloading' else None
+    with job.lock:
+        job.streams[d.get('filename')] = (downloaded, total, speed, d.get('eta'))
+        streams = list(job.streams.values())
+    job.downloaded_bytes = sum(s[0] for s in streams)
+    totals = [s[1] for s in streams]
+    job.total_bytes = sum(totals) if all(totals) else None
+    job.speed = sum(s[2] for s in streams if s[2]) or None
+    job.eta = max((s[3] for s in streams if s[2] and s[3] is not None), default=None)
+    host = urlparse((d.get('info_dict') or {}).get('url') or '').hostname
+    if metrics.observe(job.id, d.get('filename'), host, downloaded, job.total_bytes, d.get('fragment_index'),
+                       job.limiter.waited if job.limiter is not None else 0.0):
+        log(f"🐢 下载停滞: {job.title} 已连续 {stall_seconds}s 低于 {format_bytes(stall_speed)}/s"
+            f"（{host or '未知节点'}），断开重连")
+        if job.limiter is not None:
+            job.limiter.reconnect()
+    export_metrics()
+    now = time.time()
+    if d['status'] == 'finished' or now - job.journaled_at >= JOURNAL_PROGRESS_INTERVAL:
+        job.journaled_at = now
+        scheduler.journal(job, files={name: s[0] for name, s in job.streams.items() if name},
+                          downloaded_bytes=job.downloaded_bytes, total_bytes=job.total_bytes)
+    if scheduler.on_progress is not None:
+        scheduler.on_progress(job)
+
+def format_bytes(n):
+    if n is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return f"{n:.1f}{unit}" if unit != "B" else f"{n:.0f}B"
+        n /= 1024
+    return f"{n:.1f}TiB"
+
+def format_eta(seconds):
+    if seconds is None:
+        return "-"
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+@functools.lru_cache(maxsize=256)
+def match_extractor(url):
+    """找出处理这个链接的提取器类，和 yt-dlp 一样按顺序取第一个匹配的（最后是 Generic）
+
+    yt-dlp 自带 lazy_extractors 时这里只做正则匹配，不会导入任何提取器模块
+    """
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.suitable(url):
+            return ie
+    return None
+
+def archive_id_for_url(url):
+    """不联网，根据链接算出下载记录里的 ID（"提取器 视频ID"），算不出时返回 None"""
+    ie = match_extractor(url)
+    if ie is None:
+        return None
+    temp_id = ie.get_temp_id(url)
+    return temp_id and yt_dlp.utils.make_archive_id(ie.ie_key(), temp_id)
+
+def is_archived(archive_id):
+    return download_archive is not None and archive_id in download_archive
+
+def run_extract_task(job):
+    """解析阶段：优先使用缓存，结果挂在 job 上交给下载阶段；已下载过的返回 False"""
+    # 先查下载记录，命中就不用联网解析
+    if is_archived(archive_id_for_url(job.url)):
+        log(f"⏭ 已下载过，跳过: {job.url}")
+        return False
+
+    start = time.time()
+    info = job.info or info_cache.get(job.url)
+    if job.info is not None:
+        log(f"♻️ 沿用上次运行时的解析结果: {info.get('title') or job.url}")
+    elif info is not None:
+        log(f"⚡ 命中解析缓存，跳过重复解析 (查找耗时 {(time.time() - start) * 1000:.1f}ms)")
+    else:
+        try:
+            info = probe_url(job.url)
+        except LiveNotStarted as e:
+            info = e.info  # 不写入缓存，开播后要重新解析
+    job.info = info
+    job.title = info.get('title') or job.url
+
+    # 链接里看不出 ID 的站点，解析后再按真实 ID 查一次
+    if info.get('id') and is_archived(yt_dlp.utils.make_archive_id(info.get('extractor_key') or '', info['id'])):
+        log(f"⏭ 已下载过，跳过: {job.title}")
+        return False
+    # 播放列表里翻页时拿不到日期的条目，解析出完整信息后再按日期筛一次
+    if job.date_range and not date_in_range(info.get('upload_date'), job.date_range):
+        log(f"⏭ 不在日期范围内，跳过: {job.title} ({info.get('upload_date')})")
+        return False
+    return True
+
+PROBE_WORKERS = 4
+
+class ProbePool:
+    """几个常驻的 YoutubeDL 实例，解析时借出一个、用完归还
+
+    每个实例复用自己的 cookie 和已加载的提取器，不用每个链接都重新创建（HTTP 连接所有实例共用
+    get_http_pool() 的连接池）；同一个实例同一时间只给一个线程用
+    """
+    def __init__(self, size=PROBE_WORKERS):
+        self.size = size
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle.empty() and self._created < self.size:
+                self._created += 1
+                return engine_ydl_class()({
+                    'noplaylist': True,
+                    'quiet': True,
+                    'logger': MyLogger(),
+                    # 还没开始的直播/首映不报错，返回带开播时间的 info（见 EngineYoutubeDL._wait_for_video）
+                    'wait_for_video': (LIVE_UPCOMING_POLL, None),
+                    # 'cookiesfrombrowser': ('safari',), # 移除复杂鉴权
+                })
+        return self._idle.get()
+
+    def probe(self, url):
+        ydl = self._acquire()
+        try:
+            return extract_info_cached(ydl, url)
+        finally:
+            self._idle.put(ydl)
+
+_probe_pool = None
+_probe_pool_lock = threading.Lock()
+
+def get_probe_pool():
+    global _probe_pool
+    with _probe_pool_lock:
+        if _probe_pool is None:
+            _probe_pool = ProbePool()
+        return _probe_pool
+
+def probe_url(url):
+    """只解析不下载，结果写入缓存供下载阶段复用"""
+    start = time.time()
+    info = get_probe_pool().probe(url)
+    log(f"🔍 解析缓存未命中，解析耗时 {time.time() - start:.2f}s")
+    return info
+
+def estimate_filesize(info):
+    """按 yt-dlp 默认选中的格式（最高画质）估算下载大小，没有大小信息时用码率 × 时长估算"""
+    def size(f):
+        if f.get('filesize') or f.get('filesize_approx'):
+            return f.get('filesize') or f.get('filesize_approx')
+        if f.get('tbr') and info.get('duration'):
+            return f['tbr'] * 1000 / 8 * info['duration']
+        return None
+    sizes = [size(f) for f in info.get('requested_formats') or [info]]
+    return None if None in sizes else sum(sizes)
+
+SECTION_KEYFRAME_MARGIN = 10  # 秒，估算片段大小时按这么长的关键帧间隔留余量
+
+def estimate_disk_usage(job):
+    """估算任务在磁盘上的峰值占用 {目录: 字节数}，选中的格式没有大小信息时返回 None
+
+    下载的各路流和合并/转码的输出会同时存在于临时目录（没设置时就是保存目录）；
+    临时目录和保存目录不在同一块磁盘时，保存目录还要放得下最终文件
+    """
+    criteria = format_criteria(job.quality)
+    if job.format_spec:
+        # 恢复/重试的任务沿用上次选好的格式
+        ids = job.format_spec.split('+')
+        chosen = [f for f in build_formats(job.info) if f.format_id in ids]
+    else:
+        selection = select_formats(job.info, **criteria)
+        chosen = selection.formats if selection is not None else []
+    sizes = [f.filesize for f in chosen]
+    if not sizes or None in sizes:
+        return None
+    downloaded = sum(sizes)
+    duration = job.info.get('duration')
+    if job.section and duration:
+        # 只下载一段时，按时长比例估算，前后各多算一个关键帧间隔的余量
+        start, end = job.section
+        duration = max(0, min(duration, end if end is not None else duration) - start)
+        downloaded = downloaded * min(1.0, (duration + 2 * SECTION_KEYFRAME_MARGIN) / job.info['duration'])
+    if criteria.get('audio_only') and ffmpeg_available and duration:
+        plan = remux.plan_audio(chosen[0].acodec, chosen[0].ext, audio_format, AUDIO_BITRATE)
+        # 直接复制时输出和下载的音频差不多大，转码时按码率估算
+        output = downloaded if plan.copy_only else duration * AUDIO_BITRATE * 1000 / 8
+    elif len(chosen) > 1:
+        output = downloaded * (1 + MERGE_OVERHEAD)
+    else:
+        output = 0  # 不需要合并，下载的文件就是最终文件
+    scratch = temp_dir or job.save_path
+    needs = {scratch: downloaded + output}
+    if temp_dir and not same_device(temp_dir, job.save_path):
+        needs[job.save_path] = output or downloaded
+    return needs
+
+def probe_summary(url, info):
+    """批量解析表格里的一行"""
+    heights = {f['height'] for f in info.get('formats') or [] if f.get('vcodec') != 'none' and f.get('height')}
+    return {
+        'url': url,
+        'title': info.get('title'),
+        'duration': info.get('duration'),
+        'heights': sorted(heights, reverse=True),
+        'filesize': estimate_filesize(info),
+        'error': None,
+    }
+
+def probe_batch(urls, workers=PROBE_WORKERS, on_result=None):
+    """批量解析一组链接，返回和 urls 顺序一致的表格（每行见 probe_summary，失败的行 error 为原因）
+
+    解析结果写入缓存，之后下载这些链接时不用再解析。on_result(row) 在每个链接解析完时回调，
+    方便边解析边显示
+    """
+    pool = get_probe_pool()
+    pool.size = max(pool.size, workers)
+    start = time.time()
+
+    def probe_one(url):
+        try:
+            info = info_cache.get(url) or pool.probe(url)
+            row = probe_summary(url, info)
+        except Exception as e:
+            row = {'url': url, 'title': None, 'duration': None, 'heights': [], 'filesize': None, 'error': str(e)}
+        if on_result is not None:
+            on_result(row)
+        return row
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        rows = list(executor.map(probe_one, urls))
+    failed = sum(1 for row in rows if row['error'])
+    log(f"🔍 批量解析完成: {len(rows)} 个链接，失败 {failed} 个，耗时 {time.time() - start:.1f}s")
+    return rows
+
+def format_probe_row(row):
+    if row['error']:
+        return f"❌ {row['url']}: {row['error']}"
+    heights = "/".join(f"{h}p" for h in row['heights'][:4]) or "-"
+    return f"{row['title']} | {format_eta(row['duration'])} | {heights} | 约 {format_bytes(row['filesize'])}"
+
+def list_quality_options(info):
+    """从 info 中列出可选画质，生成带序号的选项列表，每档附上实际会选中的编码/帧率/大小"""
+    formats = build_formats(info)
+    options = [QUALITY_BEST]
+    for idx, height in enumerate(available_heights(formats), start=2):
+        label = f"{idx}. {height}p (MP4)"
+        selection = select_formats(formats, height=height, max_bitrate=max_bitrate,
+                                   codecs=codec_preference, can_merge=ffmpeg_available)
+        if selection is not None and selection.height == height:
+            details = " ".join(selection.describe().split()[1:])  # 高度已经在前面了
+            if selection.filesize:
+                details += f" 约{format_bytes(selection.filesize)}"
+            label += f" · {details}" if details.strip() else ""
+        options.append(label)
+    options.append(f"{len(options) + 1}. {audio_quality_label()}")
+    return options
+
+def extract_info_cached(ydl, url):
+    """解析视频信息并写入缓存，返回可直接交给 process_ie_result 的 info"""
+    info = ydl.sanitize_info(ydl.extract_info(url, download=False), remove_private_keys=True)
+    info_cache.put(url, info)
+    return copy.deepcopy(info)
+
+# --- 播放列表 / 频道 ---
+PLAYLIST_PAGE_SIZE = 50  # PagedList 类型的列表每次取这么多条
+PLAYLIST_BACKLOG = 10  # 排队等待解析/下载的任务达到这个数时暂停翻页，频道再大内存也不会涨
+PLAYLIST_PROGRESS_EVERY = 50  # 每翻过这么多条汇报一次进度
+
+def is_playlist_url(url):
+    """不联网粗略判断链接是不是播放列表/频道（如 /playlist?list=、/@用户名、/channel/...）"""
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    if query.get('list') and not query.get('v'):
+        return True
+    return re.match(r'/(@[^/]+|channel/[^/]+|c/[^/]+|user/[^/]+|playlist)(/|$)', parsed.path) is not None
+
+def parse_playlist_items(spec):
+    """解析 "1-10,15,20-" 形式的序号范围（从 1 开始，闭区间），返回 [(起, 止)]，止为 None 表示到末尾"""
+    if not spec or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.replace(" ", "").split(","):
+        match = re.fullmatch(r'(\d+)(-(\d*))?', part)
+        if not match or int(match.group(1)) == 0:
+            raise ValueError(f"无法识别的范围: {part}")
+        start = int(match.group(1))
+        end = (int(match.group(3)) if match.group(3) else None) if match.group(2) else start
+        if end is not None and end < start:
+            raise ValueError(f"无法识别的范围: {part}")
+        ranges.append((start, end))
+    return ranges
+
+def parse_date_range(after=None, before=None):
+    """日期筛选条件，日期格式 YYYYMMDD（含当天），都为空时返回 None"""
+    for date in (after, before):
+        if date and not re.fullmatch(r'\d{8}', date):
+            raise ValueError(f"日期格式应为 YYYYMMDD: {date}")
+    if not after and not before:
+        return None
+    return (after or None, before or None)
+
+def date_in_range(upload_date, date_range):
+    """不知道日期时不筛掉，留给后面拿到完整信息时再判断"""
+    if not date_range or not upload_date:
+        return True
+    after, before = date_range
+    return (after is None or upload_date >= after) and (before is None or upload_date <= before)
+
+def entry_upload_date(entry):
+    if entry.get('upload_date'):
+        return entry['upload_date']
+    timestamp = entry.get('timestamp') or entry.get('release_timestamp')
+    return timestamp and time.strftime('%Y%m%d', time.gmtime(timestamp))
+
+class PlaylistExpansion:
+    """一次播放列表/频道展开的参数和进度"""
+    _ids = itertools.count(1)
+
+    def __init__(self, url, quality, save_path, items=None, date_range=None):
+        self.id = f"playlist{next(PlaylistExpansion._ids)}"
+        self.url = url
+        self.quality = quality
+        self.save_path = save_path
+        self.items = items  # parse_playlist_items 的结果，None 表示全部
+        self.date_range = date_range
+        self.title = url
+        self.found = 0  # 已翻过的条目数
+        self.queued = 0  # 已加入下载队列
+        self.skipped = 0  # 已下载过 / 不在日期范围内 / 没有链接
+        self.finished = False
+        self.error = ""
+
+    def wants(self, index):
+        return self.items is None or any(start <= index and (end is None or index <= end)
+                                         for start, end in self.items)
+
+    @property
+    def last_index(self):
+        """范围都有终点时，翻到这里就可以停了"""
+        if self.items is None or any(end is None for _, end in self.items):
+            return None
+        return max(end for _, end in self.items)
+
+def _lazy_entries(entries):
+    """逐条取出 entries，生成器直接迭代（翻页由提取器按需进行），不像 LazyList 那样留着已取出的条目"""
+    if isinstance(entries, yt_dlp.utils.PagedList):
+        start = 0
+        while True:
+            page = entries.getslice(start, start + PLAYLIST_PAGE_SIZE)
+            if not page:
+                return
+            yield from page
+            start += len(page)
+    else:
+        yield from entries or []
+
+def _resolve_flat(ydl, result):
+    while result.get('_type') in ('url', 'url_transparent'):
+        result = ydl.extract_info(result['url'], download=False, ie_key=result.get('ie_key'), process=False)
+    return result
+
+def iter_playlist_entries(ydl, url, playlist=None):
+    """按顺序产出播放列表/频道里的视频条目（extract_flat 的精简信息）
+
+    频道首页这类"列表的列表"（条目和自身是同一个提取器，如 YouTube 频道的各个标签页）会递归展开
+    """
+    result = _resolve_flat(ydl, ydl.extract_info(url, download=False, process=False))
+    if result.get('_type') not in ('playlist', 'multi_video'):
+        # 不是列表，就是单个视频
+        yield {'url': result.get('webpage_url') or url, 'id': result.get('id'),
+               'ie_key': result.get('extractor_key'), 'title': result.get('title'),
+               'upload_date': result.get('upload_date')}
+        return
+    if playlist is not None and playlist.title == playlist.url:
+        playlist.title = result.get('title') or url
+    for entry in _lazy_entries(result.get('entries')):
+        if not entry:
+            continue
+        if entry.get('_type') == 'playlist':
+            yield from _lazy_entries(entry.get('entries'))
+        elif entry.get('ie_key') and entry.get('ie_key') == result.get('extractor_key') and entry.get('url'):
+            yield from iter_playlist_entries(ydl, entry['url'])
+        else:
+            yield entry
+
+def run_playlist_expansion(playlist, scheduler):
+    """展开播放列表/频道，边翻页边把条目加入下载队列，不等整个列表取完"""
+    ydl_opts = {
+        'extract_flat': 'in_playlist',
+        'quiet': True,
+        'logger': MyLogger(),
+    }
+    last_index = playlist.last_index
+    with engine_ydl_class()(ydl_opts) as ydl:
+        for index, entry in enumerate(iter_playlist_entries(ydl, playlist.url, playlist), 1):
+            if last_index is not None and index > last_index:
+                break
+            playlist.found = index
+            if playlist.wants(index):
+                url = entry.get('url') or entry.get('webpage_url')
+                archive_id = (entry.get('id') and entry.get('ie_key')
+                              and yt_dlp.utils.make_archive_id(entry['ie_key'], entry['id']))
+                if not url or is_archived(archive_id) or not date_in_range(entry_upload_date(entry), playlist.date_range):
+                    playlist.skipped += 1
+                else:
+                    # 队列里积压的任务多了就先停下，等前面的任务开始下载再继续翻页
+                    scheduler.wait_for_backlog()
+                    scheduler.submit(url, playlist.quality, playlist.save_path, date_range=playlist.date_range)
+                    playlist.queued += 1
+            if index % PLAYLIST_PROGRESS_EVERY == 0:
+                scheduler.notify_playlist(playlist)
+                log(f"📃 {playlist.title}: 已翻过 {playlist.found} 条，加入队列 {playlist.queued} 个，"
+                    f"跳过 {playlist.skipped} 个")
+
+# --- 下载队列 ---
+JOB_QUEUED = "queued"
+JOB_EXTRACTING = "extracting"
+JOB_DOWNLOADING = "downloading"
+JOB_POSTPROCESSING = "post-processing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+JOB_STATE_LABELS = {
+    JOB_QUEUED: "排队中",
+    JOB_EXTRACTING: "解析中",
+    JOB_DOWNLOADING: "下载中",
+    JOB_POSTPROCESSING: "后期处理",
+    JOB_DONE: "✅ 完成",
+    JOB_FAILED: "❌ 失败",
+}
+
+# 合法的状态迁移，任何状态都可以直接失败
+JOB_TRANSITIONS = {
+    JOB_QUEUED: {JOB_EXTRACTING, JOB_FAILED},
+    JOB_EXTRACTING: {JOB_DOWNLOADING, JOB_DONE, JOB_FAILED}, # 已下载过的直接完成
+    JOB_DOWNLOADING: {JOB_POSTPROCESSING, JOB_DONE, JOB_FAILED},
+    JOB_POSTPROCESSING: {JOB_DONE, JOB_FAILED},
+    JOB_DONE: set(),
+    JOB_FAILED: set(),
+}
+
+MAX_PARALLEL_DOWNLOADS = 3
+MAX_PARALLEL_EXTRACTIONS = 2
+# 合并/转码主要吃 CPU，默认每个核一个；等待处理的任务数有上限，避免中间文件堆满磁盘
+MAX_PARALLEL_POSTPROCESS = os.cpu_count() or 2
+MAX_PENDING_POSTPROCESS = 2 * MAX_PARALLEL_POSTPROCESS
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, url, quality, save_path, date_range=None, rate_limit=None, journal_id=None, section=None):
+        self.id = f"job{next(Job._ids)}"
+        # 任务日志里的 ID，跨重启不变（self.id 每次启动都从 1 开始）
+        self.journal_id = journal_id or uuid.uuid4().hex[:12]
+        self.journaled_at = 0
+        self.format_spec = None  # 选定的格式，如 '137+140'
+        self.url = url
+        self.quality = quality
+        self.save_path = save_path
+        self.date_range = date_range  # 来自播放列表的日期筛选，解析后再检查一次
+        self.rate_limit = rate_limit  # 单任务速率上限（字节/秒），None 时用 job_rate_limit
+        self.section = section  # 只下载的时间段 (开始秒数, 结束秒数或 None)，None 表示整个视频
+        self.state = JOB_QUEUED
+        self.title = url
+        self.error = ""
+        self.info = None
+        # 下载进度，由 progress hook 更新
+        self.lock = threading.Lock()
+        self.streams = {}  # 文件名 -> (已下载, 总大小, 速度, 剩余时间)
+        self.stream_timings = []
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.speed = None
+        self.eta = None
+        # 重试统计
+        self.retries = {}  # 错误类型 -> 重试次数（含连接级、分片级、分段级重试）
+        self.transferred_bytes = 0  # 实际传输的字节数，各次尝试合计
+        self.resume_base = 0  # 开始前已经下载好的字节数（上次运行留下的 .part）
+        self.limiter = None  # 当前这次下载的限速器，也用来断开停滞的连接
+        self.metrics = None  # metrics.JobMetrics，开始下载后才有
+        # 直播录制：live 为 True 时由录制线程处理，stop_event 被设置后录完当前分片就结束
+        self.live = False
+        self.live_seconds = 0.0  # 已录时长
+        self.stop_event = threading.Event()
+
+    def record_retry(self, kind):
+        with self.lock:
+            self.retries[kind] = self.retries.get(kind, 0) + 1
+
+    def add_transferred(self, n):
+        with self.lock:
+            self.transferred_bytes += n
+
+    @property
+    def wasted_bytes(self):
+        """估算重试浪费的流量：实际传输的字节数减去最终留下的有效进度（含重新解析的请求）"""
+        return max(0, self.transferred_bytes - max(0, self.downloaded_bytes - self.resume_base))
+
+    @property
+    def percent(self):
+        if not self.total_bytes:
+            return None
+        return min(100.0, self.downloaded_bytes * 100.0 / self.total_bytes)
+
+    @property
+    def finished(self):
+        return self.state in (JOB_DONE, JOB_FAILED)
+
+class StagePool:
+    """固定数量的 worker 线程消费任务队列，数量可在运行时调整"""
+    def __init__(self, name, size):
+        self.name = name
+        self.size = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self.resize(size)
+
+    def resize(self, size):
+        with self._lock:
+            self.size = max(1, int(size))
+            while self._workers < self.size:
+                self._workers += 1
+                threading.Thread(target=self._run, name=f"{self.name}-{self._workers}", daemon=True).start()
+
+    def submit(self, fn, *args):
+        self._queue.put((fn, args))
+
+    def _run(self):
+        while True:
+            # 缩容时多出来的 worker 在空闲时自行退出
+            with self._lock:
+                if self._workers > self.size:
+                    self._workers -= 1
+                    return
+            try:
+                fn, args = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                fn(*args)
+            except Exception as e:
+                # 阶段函数应当自己处理任务的失败；漏出来的异常只记日志，worker 不能因此退出，否则池会少一个线程
+                log(f"❌ {self.name} 线程出现未处理的异常: {type(e).__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+class DownloadScheduler:
+    """三级流水线：解析、下载、后期处理各用一个池
+
+    下载完的文件交给后期处理池后，下载名额立即释放；合并慢不会卡住新的解析和下载。
+    已占用的后期处理名额（正在下载 + 等待/正在处理）达到 max_pending_postprocess 时，
+    新的下载会先等待，避免待合并的中间文件越积越多
+    """
+    def __init__(self, on_update, max_downloads=MAX_PARALLEL_DOWNLOADS, max_extractions=MAX_PARALLEL_EXTRACTIONS,
+                 on_progress=None, max_postprocess=MAX_PARALLEL_POSTPROCESS,
+                 max_pending_postprocess=MAX_PENDING_POSTPROCESS, on_playlist=None):
+        self.on_update = on_update
+        self.on_progress = on_progress  # 下载进度回调，每个进度 tick 都会调用，需自行节流
+        self.on_playlist = on_playlist  # 播放列表展开进度回调
+        self.jobs = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._backlog = 0  # 还没开始下载的任务数（排队中 + 解析中）
+        self._done_count = 0  # 完成的任务只计数，不留在 jobs 里，频道有上万个视频时内存也不会涨
+        self._expanding = 0  # 正在展开的播放列表数
+        self.extract_pool = StagePool("extract", max_extractions)
+        self.download_pool = StagePool("download", max_downloads)
+        self.postprocess_pool = StagePool("postprocess", max_postprocess)
+        transcode_slots.concurrency = max(1, int(max_postprocess))
+        self.max_pending_postprocess = max(1, max_pending_postprocess)
+        self._pending_postprocess = 0
+        self._postprocess_slots = threading.Condition()
+
+    def set_max_downloads(self, n):
+        self.download_pool.resize(n)
+
+    def set_max_postprocess(self, n):
+        self.postprocess_pool.resize(n)
+        transcode_slots.concurrency = max(1, int(n))
+
+    def submit(self, url, quality, save_path, date_range=None, rate_limit=None, section=None):
+        job = Job(url, quality, save_path, date_range, rate_limit, section=section)
+        self.journal(job, url=url, quality=quality, save_path=save_path, date_range=date_range,
+                     rate_limit=rate_limit, section=section, state=job.state)
+        return self._enqueue(job)
+
+    def _enqueue(self, job):
+        with self._lock:
+            self.jobs.append(job)
+            self._backlog += 1
+        self.on_update(job)
+        self.extract_pool.submit(self._extract, job)
+        return job
+
+    def journal(self, job, **fields):
+        if job_journal is not None:
+            job_journal.append(job.journal_id, **fields)
+
+    def resume_journal(self):
+        """把任务日志里上次没有结束的任务重新加入队列，返回恢复的任务列表
+
+        解析结果还没过期的直接用保存下来的 info，不再联网解析；下载时沿用上次的格式和
+        输出文件名，yt-dlp（或分段下载）会接着已有的 .part 文件续传
+        """
+        if job_journal is None:
+            return []
+        jobs = []
+        for record in job_journal.replay():
+            if not record.get('url'):
+                continue
+            date_range = tuple(record['date_range']) if record.get('date_range') else None
+            section = tuple(record['section']) if record.get('section') else None
+            job = Job(record['url'], record['quality'], record['save_path'], date_range,
+                      record.get('rate_limit'), journal_id=record['id'], section=section)
+            job.title = record.get('title') or job.url
+            job.format_spec = record.get('format')
+            job.downloaded_bytes = job.resume_base = record.get('downloaded_bytes') or 0
+            job.total_bytes = record.get('total_bytes')
+            if (record.get('info_expires') or 0) > time.time():
+                job.info = job_journal.load_info(job.journal_id)
+            jobs.append(self._enqueue(job))
+        if jobs:
+            resumed = sum(1 for j in jobs if j.downloaded_bytes)
+            log(f"♻️ 恢复上次未完成的任务 {len(jobs)} 个（其中 {resumed} 个已下载部分数据，将继续下载）")
+        return jobs
+
+    def submit_playlist(self, url, quality, save_path, items=None, date_range=None):
+        """展开播放列表/频道，条目边发现边加入队列；返回 PlaylistExpansion 用于查看进度"""
+        playlist = PlaylistExpansion(url, quality, save_path, items, date_range)
+        with self._lock:
+            self._expanding += 1
+        # 展开过程会因为积压而长时间等待，单独开线程，不占用解析池
+        threading.Thread(target=self._expand, args=(playlist,), name=playlist.id, daemon=True).start()
+        return playlist
+
+    def wait_for_backlog(self, limit=PLAYLIST_BACKLOG):
+        with self._idle:
+            self._idle.wait_for(lambda: self._backlog < limit)
+
+    def notify_playlist(self, playlist):
+        if self.on_playlist is not None:
+            self.on_playlist(playlist)
+
+    def set_state(self, job, state, error=""):
+        # 状态、计数和 jobs 列表在同一把锁下一起改：界面线程随时可能调用 take_finished 取走已结束的任务
+        with self._lock:
+            if state not in JOB_TRANSITIONS[job.state]:
+                raise ValueError(f"非法的任务状态迁移: {job.state} -> {state}")
+            left_backlog = job.state in (JOB_QUEUED, JOB_EXTRACTING) and state not in (JOB_QUEUED, JOB_EXTRACTING)
+            job.state = state
+            job.error = error
+            if left_backlog:
+                self._backlog -= 1
+            if state == JOB_DONE:
+                self._done_count += 1
+                self.jobs.remove(job)
+        if job.finished:
+            metrics.finish(job.id)
+            if job_journal is not None:
+                job_journal.remove(job.journal_id)
+        else:
+            self.journal(job, state=state)
+        try:
+            self.on_update(job)
+        finally:
+            if left_backlog or job.finished:
+                with self._idle:
+                    self._idle.notify_all()
+
+    def wait(self):
+        """阻塞直到队列中所有任务结束（命令行模式使用）"""
+        with self._idle:
+            self._idle.wait_for(lambda: self._expanding == 0 and all(j.finished for j in self.jobs))
+
+    def take_finished(self):
+        """取走已结束任务的汇总 (完成数, 失败的任务列表)，失败的任务同时从 jobs 中移除"""
+        with self._lock:
+            done, self._done_count = self._done_count, 0
+            failed = [j for j in self.jobs if j.state == JOB_FAILED]
+            self.jobs = [j for j in self.jobs if not j.finished]
+        return done, failed
+
+    def active_count(self):
+        """未结束的任务数，正在展开的播放列表也算在内（后面可能还有任务加进来）"""
+        with self._lock:
+            return self._expanding + sum(1 for j in self.jobs if not j.finished)
+
+    def pending_postprocess(self):
+        with self._postprocess_slots:
+            return self._pending_postprocess
+
+    def _acquire_postprocess_slot(self, job):
+        with self._postprocess_slots:
+            if self._pending_postprocess >= self.max_pending_postprocess:
+                log(f"⏳ 等待后期处理的任务较多，暂缓下载: {job.title}")
+                self._postprocess_slots.wait_for(lambda: self._pending_postprocess < self.max_pending_postprocess)
+            self._pending_postprocess += 1
+
+    def _release_postprocess_slot(self):
+        with self._postprocess_slots:
+            self._pending_postprocess -= 1
+            self._postprocess_slots.notify()
+
+    def _reserve_disk_space(self, job):
+        """按估算的占用预留磁盘空间，放不下时等其他任务结束；估算不出大小时不检查"""
+        needs = estimate_disk_usage(job) if disk_space is not None else None
+        if needs is None:
+            return
+
+        def on_wait(path, size, available):
+            log(f"⏳ 磁盘空间不足（{path} 需要约 {format_bytes(size)}，可用 {format_bytes(available)}），"
+                f"等待其他任务完成: {job.title}")
+
+        # 已经下载的部分不再算在预留里（已经体现在磁盘剩余空间中）
+        disk_space.reserve(job.id, needs, download_dir=temp_dir or job.save_path,
+                           written=lambda: job.downloaded_bytes, on_wait=on_wait)
+
+    def _release_disk_space(self, job):
+        if disk_space is not None:
+            disk_space.release(job.id)
+
+    def _expand(self, playlist):
+        try:
+            if not wait_for_components():
+                raise RuntimeError("核心组件 yt-dlp 加载失败")
+            run_playlist_expansion(playlist, self)
+        except Exception as e:
+            playlist.error = str(e)
+            log(f"❌ 播放列表展开失败: {playlist.url}: {e}")
+        else:
+            log(f"📃 {playlist.title}: 展开完成，共 {playlist.found} 条，加入队列 {playlist.queued} 个，"
+                f"跳过 {playlist.skipped} 个")
+        finally:
+            playlist.finished = True
+            with self._idle:
+                self._expanding -= 1
+                self._idle.notify_all()
+            self.notify_playlist(playlist)
+
+    def _fail_unexpected(self, job, stage, e):
+        """阶段函数里没有预料到的异常：任务记为失败（已经结束的不再改），名额和预留由调用方释放"""
+        log(f"❌ {stage}时发生意外错误: {job.title}: {type(e).__name__}: {e}")
+        if not job.finished:
+            self.set_state(job, JOB_FAILED, str(e))
+
+    def _extract(self, job):
+        try:
+            self.set_state(job, JOB_EXTRACTING)
+            # 界面启动后就能加入任务，组件还在后台初始化时先在这里等着
+            if not wait_for_components():
+                self.set_state(job, JOB_FAILED, "核心组件 yt-dlp 加载失败")
+                return
+            try:
+                need_download = run_with_retry(job, run_extract_task)
+            except Exception as e:
+                log(f"❌ 解析失败: {job.url}: {e}")
+                self.set_state(job, JOB_FAILED, str(e))
+                return
+            if need_download:
+                if job_journal is not None:
+                    job_journal.save_info(job.journal_id, job.info)
+                    self.journal(job, title=job.title, info_expires=info_cache._expires_at(job.info))
+                if wants_recording(job.info):
+                    # 直播一录就是几个小时，不占下载池的名额，也不需要后期处理
+                    job.live = True
+                    threading.Thread(target=self._record, args=(job,), name=f"live-{job.id}", daemon=True).start()
+                else:
+                    self.download_pool.submit(self._download, job)
+            else:
+                job.info = None
+                self.set_state(job, JOB_DONE)
+        except Exception as e:
+            job.info = None
+            self._fail_unexpected(job, "解析", e)
+
+    def _download(self, job):
+        # 先占一个后期处理名额再开始下载，下载完成后就一定有地方处理
+        self._acquire_postprocess_slot(job)
+        handed_off = False  # 交给后期处理池之后，名额和磁盘预留由 _postprocess 释放
+        try:
+            try:
+                # 再预留磁盘空间，放不下时排队等待；无论如何都放不下的直接失败，不用下到一半才发现磁盘满
+                self._reserve_disk_space(job)
+            except InsufficientSpace as e:
+                log(f"❌ {e}: {job.title}")
+                self.set_state(job, JOB_FAILED, str(e))
+                return
+            self.set_state(job, JOB_DOWNLOADING)
+            try:
+                ydl = run_with_retry(job, run_download_task, self)
+            except Exception as e:
+                log(f"❌ 下载发生异常: {str(e)}" + (f"（{format_retries(job)}）" if job.retries else ""))
+                self.set_state(job, JOB_FAILED, str(e))
+                return
+            if job.retries:
+                log(f"🔁 {job.title}: {format_retries(job)}")
+            if ydl is None:
+                self.set_state(job, JOB_DONE)
+            else:
+                if job.state == JOB_DOWNLOADING:
+                    self.set_state(job, JOB_POSTPROCESSING)
+                self.postprocess_pool.submit(self._postprocess, job, ydl)
+                handed_off = True
+        except Exception as e:
+            self._fail_unexpected(job, "下载", e)
+        finally:
+            job.info = None # 释放 info dict，队列很长时避免占用内存
+            if not handed_off:
+                self._release_postprocess_slot()
+                self._release_disk_space(job)
+
+    def _record(self, job):
+        self.set_state(job, JOB_DOWNLOADING)
+        try:
+            run_with_retry(job, run_live_recording, self)
+        except Exception as e:
+            log(f"❌ 录制发生异常: {job.title}: {e}" + (f"（{format_retries(job)}）" if job.retries else ""))
+            self.set_state(job, JOB_FAILED, str(e))
+        else:
+            self.set_state(job, JOB_DONE)
+        finally:
+            job.info = None
+
+    def stop_recording(self, job):
+        """停止录制直播（录完当前分片就结束，已经录好的文件都保留），不是录制任务时返回 False"""
+        if not job.live or job.finished or job.stop_event.is_set():
+            return False
+        job.stop_event.set()
+        log(f"⏹ 正在停止录制: {job.title}")
+        return True
+
+    def _postprocess(self, job, ydl):
+        try:
+            try:
+                run_postprocess_task(job, ydl)
+            except Exception as e:
+                log(f"❌ 后期处理发生异常: {str(e)}")
+                self.set_state(job, JOB_FAILED, str(e))
+            else:
+                self.set_state(job, JOB_DONE)
+        except Exception as e:
+            self._fail_unexpected(job, "后期处理", e)
+        finally:
+            self._release_postprocess_slot()
+            self._release_disk_space(job)
+
+class MyLogger:
+    def debug(self, msg):
+        if not msg.startswith('[debug] '):
+            # log(f"[内部] {msg}")
+            pass
+    def warning(self, msg):
+        # 过滤掉一些不影响使用的警告
+        if "challenge" in msg or "AppSupport" in msg:
+            return 
+        log(f"⚠️ {msg}")
+    def error(self, msg):
+        log(f"❌ {msg}")
@@ -0,0 +1,189 @@
+"""格式模型与选择：把 info dict 里的 formats 整理成结构化数据，按条件选出确切的 format_id
+
+选择条件：目标高度、文件大小上限、编码偏好（解码开销 avc1 < vp9 < av1）、码率上限（带宽预算）。
+只依赖标准库，输入就是 info dict / formats 列表，可以直接用保存下来的 info dict 测试。
+"""
+
+# 按解码开销从低到高，老机器/无硬解时 av1 很吃 CPU
+DEFAULT_CODEC_PREFERENCE = ("avc1", "vp9", "av1")
+
+_CODEC_FAMILIES = {
+    "avc1": "avc1", "avc3": "avc1", "h264": "avc1",
+    "vp9": "vp9", "vp09": "vp9",
+    "av01": "av1", "av1": "av1",
+    "hev1": "hevc", "hvc1": "hevc", "h265": "hevc",
+    "mp4a": "aac", "aac": "aac",
+}
+
+
+def codec_family(codec):
+    """'avc1.640028' -> 'avc1'，'vp09.00.40.08' -> 'vp9'；没有该路流时返回 None"""
+    if not codec or codec == "none":
+        return None
+    name = codec.split(".")[0].lower()
+    return _CODEC_FAMILIES.get(name, name)
+
+
+class Format:
+    """info dict 中一个格式的结构化视图"""
+    def __init__(self, f, duration=None):
+        self.format_id = f.get("format_id")
+        self.ext = f.get("ext")
+        self.height = f.get("height")
+        self.fps = f.get("fps")
+        # yt-dlp 用 'none' 表示没有这路流，None 表示不知道（按有处理）
+        self.has_video = f.get("vcodec") != "none"
+        self.has_audio = f.get("acodec") != "none"
+        self.vcodec = codec_family(f.get("vcodec"))
+        self.acodec = codec_family(f.get("acodec"))
+        self.abr = f.get("abr")
+        self.tbr = f.get("tbr") or ((f.get("vbr") or 0) + (f.get("abr") or 0)) or None
+        self.filesize = f.get("filesize") or f.get("filesize_approx")
+        if not self.filesize and self.tbr and duration:
+            self.filesize = int(self.tbr * 1000 / 8 * duration)
+
+    def __repr__(self):
+        return f"<Format {self.format_id} {self.height}p {self.vcodec}/{self.acodec} {self.tbr}k>"
+
+
+def build_formats(info_or_formats):
+    """从 info dict（或 formats 列表）构造 Format 列表，去掉既没有视频也没有音频的（如故事板）"""
+    if isinstance(info_or_formats, dict):
+        formats = info_or_formats.get("formats") or [info_or_formats]
+        duration = info_or_formats.get("duration")
+    else:
+        formats, duration = info_or_formats, None
+    result = []
+    for f in formats:
+        fmt = f if isinstance(f, Format) else Format(f, duration)
+        if fmt.format_id and (fmt.has_video or fmt.has_audio):
+            result.append(fmt)
+    return result
+
+
+def available_heights(formats):
+    return sorted({f.height for f in formats if f.has_video and f.height}, reverse=True)
+
+
+class Selection:
+    """选择结果：视频 + 音频两个格式（合并下载），或单个格式"""
+    def __init__(self, video=None, audio=None):
+        self.video = video
+        self.audio = audio
+        self.relaxed = None  # 条件无法满足、放宽后才选出时记录原因
+
+    @property
+    def formats(self):
+        return [f for f in (self.video, self.audio) if f is not None]
+
+    @property
+    def format_spec(self):
+        """交给 yt-dlp 的确切格式，如 '137+140' 或 '18'"""
+        return "+".join(f.format_id for f in self.formats)
+
+    @property
+    def height(self):
+        return self.video.height if self.video is not None else None
+
+    @property
+    def filesize(self):
+        sizes = [f.filesize for f in self.formats]
+        return None if None in sizes else sum(sizes)
+
+    @property
+    def tbr(self):
+        rates = [f.tbr for f in self.formats]
+        return None if None in rates else sum(rates)
+
+    def describe(self):
+        parts = []
+        if self.video is not None:
+            if self.video.height:
+                parts.append(f"{self.video.height}p")
+            if self.video.vcodec:
+                parts.append(self.video.vcodec)
+            if self.video.fps:
+                parts.append(f"{self.video.fps:g}fps")
+        audio = self.audio or (self.video if self.video is not None and self.video.has_audio else None)
+        if audio is not None and audio.acodec:
+            parts.append(audio.acodec + (f" {audio.abr:.0f}k" if audio.abr else ""))
+        return " ".join(parts)
+
+    def __repr__(self):
+        return f"<Selection {self.format_spec} {self.describe()}>"
+
+
+def _codec_rank(codec, codecs):
+    return codecs.index(codec) if codec in codecs else len(codecs)
+
+
+def _candidates(formats, audio_only, can_merge):
+    muxed = [f for f in formats if f.has_video and f.has_audio]
+    audios = [f for f in formats if f.has_audio and not f.has_video]
+    if audio_only:
+        # 没有纯音频格式时退回带音频的完整格式，之后再提取音频
+        return [Selection(audio=a) for a in audios] or [Selection(video=f) for f in muxed]
+    candidates = [Selection(video=f) for f in muxed]
+    if can_merge:
+        videos = [f for f in formats if f.has_video and not f.has_audio]
+        candidates += [Selection(video=v, audio=a) for v in videos for a in audios]
+    return candidates
+
+
+def select_formats(info_or_formats, height=None, audio_only=False, max_filesize=None, max_bitrate=None,
+                   codecs=DEFAULT_CODEC_PREFERENCE, can_merge=True, audio_codecs=()):
+    """按条件选出要下载的格式，返回 Selection；没有任何可用格式时返回 None
+
+    height        目标高度，选不超过它的最高画质
+    max_filesize  文件大小上限（字节），大小未知的格式视为不满足
+    max_bitrate   总码率上限（kbps），即带宽预算
+    codecs        视频编码偏好，靠前的优先（同一高度下比帧率、码率更优先）
+    can_merge     能否合并视频+音频（需要 FFmpeg），不能时只选自带音频的格式
+    audio_codecs  仅音频时优先的音频编码（如 ('aac',)：目标是 m4a 时可以直接复制，不用转码），比码率更优先
+
+    条件无法同时满足时依次放宽：先放宽高度（取最低的），再放宽大小/码率（取最小的），
+    原因记在 Selection.relaxed 里
+    """
+    formats = build_formats(info_or_formats)
+    candidates = _candidates(formats, audio_only, can_merge)
+    if not candidates:
+        return None
+    relaxed = None
+
+    if height and not audio_only:
+        within = [c for c in candidates if (c.height or 0) <= height]
+        if not within:
+            lowest = min(c.height or 0 for c in candidates)
+            within = [c for c in candidates if (c.height or 0) == lowest]
+            relaxed = f"没有不高于 {height}p 的格式，改用 {lowest}p"
+        candidates = within
+
+    def fits(c):
+        if max_filesize is not None and (c.filesize is None or c.filesize > max_filesize):
+            return False
+        return max_bitrate is None or c.tbr is None or c.tbr <= max_bitrate
+
+    fitting = [c for c in candidates if fits(c)]
+    if not fitting:
+        # 都超出预算时选最小的：先看大小，没有大小的看码率
+        best = min(candidates, key=lambda c: (c.filesize is None, c.filesize or 0, c.tbr or 0))
+        best.relaxed = "；".join(filter(None, [relaxed, "没有满足大小/码率限制的格式，改用最小的"]))
+        return best
+
+    def rank(c):
+        video, audio = c.video, c.audio or c.video
+        if audio_only:
+            return (-_codec_rank(audio.acodec, audio_codecs), audio.abr or audio.tbr or 0)
+        return (
+            video.height or 0,
+            -_codec_rank(video.vcodec, codecs),
+            video.fps or 0,
+            # 合并成 mp4 时 mp4 视频配 m4a 音频兼容性最好
+            c.audio is None or (video.ext == "mp4") == (c.audio.ext == "m4a"),
+            (audio.abr or 0) if audio.has_audio else 0,
+            c.tbr or 0,
+        )
+
+    best = max(fitting, key=rank)
+    best.relaxed = relaxed
+    return best
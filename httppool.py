@@ -0,0 +1,283 @@
+"""进程内共享的 HTTP 连接池：按主机保持长连接、复用 TLS 会话、缓存 DNS 解析结果
+
+yt-dlp 每个 YoutubeDL 实例各建各的连接（没装 requests 时每个请求都是新连接），任务多而短时，
+DNS 查询和 TLS 握手占了不少时间。解析、下载、检查更新都从这里取连接：同一主机的空闲连接
+留在池里给下一个请求用；新建 TLS 连接时带上该主机上次的会话，服务器支持时省掉完整握手。
+只依赖标准库，可以直接对本地 HTTP 服务测试。
+"""
+import http.client
+import socket
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+DNS_CACHE_TTL = 120
+POOL_IDLE_TIMEOUT = 30  # 空闲连接保留多久，服务器一般 60s 左右关闭空闲连接，留点余量
+POOL_MAX_IDLE_PER_HOST = 16  # 分段下载加上多任务并发，同一个 CDN 节点会有十几条连接
+MAX_REDIRECTS = 5
+DEFAULT_USER_AGENT = "Mozilla/5.0"
+# 池里的连接可能已经被服务器关掉，发请求时才发现；复用的连接上出现这些错误时换新连接重发一次
+_STALE_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class DnsCache:
+    """getaddrinfo 的结果缓存 ttl 秒；所有地址都连不上时作废，下次重新解析"""
+    def __init__(self, ttl=DNS_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # (主机, 端口) -> (过期时间, 地址列表)
+        self.stats = {"hits": 0, "misses": 0}
+
+    def getaddrinfo(self, host, port):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry is not None and entry[0] > now:
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+        addrs = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with self._lock:
+            self._entries[(host, port)] = (now + self.ttl, addrs)
+        return addrs
+
+    def invalidate(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def create_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+        """和 socket.create_connection 一样依次尝试解析出的地址；指定源地址时只用同一协议族的地址"""
+        host, port = address
+        addrs = self.getaddrinfo(host, port)
+        if source_address is not None:
+            family = socket.AF_INET6 if ":" in source_address[0] else socket.AF_INET
+            addrs = [a for a in addrs if a[0] == family]
+        error = OSError(f"没有可用的地址: {host}")
+        for family, sock_type, proto, _, sockaddr in addrs:
+            sock = socket.socket(family, sock_type, proto)
+            try:
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except OSError as e:
+                sock.close()
+                error = e
+        self.invalidate(host, port)
+        raise error
+
+
+class PooledResponse(http.client.HTTPResponse):
+    """响应体读完后把连接还给连接池；没读完就关闭的，连接上还有残留数据，不能再用"""
+    _on_done = None
+    _reusable = True
+
+    def close(self):
+        if self.fp is not None:
+            self._reusable = False
+        super().close()
+
+    def _close_conn(self):
+        super()._close_conn()
+        on_done, self._on_done = self._on_done, None
+        if on_done is not None:
+            on_done(self._reusable and not self.will_close)
+
+
+class PooledHTTPConnection(http.client.HTTPConnection):
+    response_class = PooledResponse
+
+    def __init__(self, pool, host, port, timeout=None, source_address=None):
+        super().__init__(host, port, timeout=timeout, source_address=source_address)
+        self._create_connection = pool.dns.create_connection
+        self.pool = pool
+        self.idle_since = None
+
+
+class PooledHTTPSConnection(http.client.HTTPSConnection):
+    response_class = PooledResponse
+
+    def __init__(self, pool, host, port, timeout=None, source_address=None, context=None):
+        super().__init__(host, port, timeout=timeout, source_address=source_address, context=context)
+        self._create_connection = pool.dns.create_connection
+        self.pool = pool
+        self.idle_since = None
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        # 会话只能在创建它的 SSLContext 上恢复，所以按 context 分开记
+        key = (self.host, self.port, self._context)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host,
+                                              session=self.pool._tls_session(key))
+        self.pool._count("tls_resumed" if self.sock.session_reused else "tls_handshakes")
+        self.pool._save_tls_session(key, self.sock)
+
+
+class ConnectionPool:
+    def __init__(self, dns=None, max_idle_per_host=POOL_MAX_IDLE_PER_HOST, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.dns = dns or DnsCache()
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle = {}  # (协议, 主机, 端口, SSLContext, 源地址) -> [空闲连接]
+        self._sessions = {}  # (主机, 端口, SSLContext) -> 最近一次的 TLS 会话
+        self._contexts = {}
+        self._swept = time.monotonic()
+        self.stats = {"requests": 0, "connections": 0, "reused": 0, "stale_retries": 0,
+                      "tls_handshakes": 0, "tls_resumed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _tls_session(self, key):
+        with self._lock:
+            return self._sessions.get(key)
+
+    def _save_tls_session(self, key, sock):
+        # TLS 1.3 的会话票据在握手之后才到，归还连接时会再记一次
+        session = getattr(sock, "session", None)
+        if session is not None:
+            with self._lock:
+                self._sessions[key] = session
+
+    def ssl_context(self, verify=True):
+        """不经过 yt-dlp 的调用方（检查更新、下载 FFmpeg）共用的 SSLContext，共用才能复用 TLS 会话"""
+        import ssl
+        with self._lock:
+            context = self._contexts.get(verify)
+            if context is None:
+                context = self._contexts[verify] = ssl.create_default_context()
+                if not verify:
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+            return context
+
+    def _acquire(self, key):
+        now = time.monotonic()
+        expired = []
+        conn = None
+        with self._lock:
+            idle = self._idle.get(key) or []
+            while idle:
+                candidate = idle.pop()
+                if now - candidate.idle_since < self.idle_timeout:
+                    conn = candidate
+                    break
+                expired.append(candidate)
+        for c in expired:
+            c.close()
+        return conn
+
+    def _release(self, key, conn, reusable):
+        expired = []
+        if reusable and conn.sock is not None:
+            if isinstance(conn, PooledHTTPSConnection):
+                self._save_tls_session((conn.host, conn.port, conn._context), conn.sock)
+            now = conn.idle_since = time.monotonic()
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(conn)
+                    conn = None
+                # 顺便清理其他主机上过期的空闲连接，访问过很多主机时池也不会一直涨
+                if now - self._swept >= self.idle_timeout:
+                    self._swept = now
+                    for k, conns in list(self._idle.items()):
+                        expired += [c for c in conns if now - c.idle_since >= self.idle_timeout]
+                        conns[:] = [c for c in conns if now - c.idle_since < self.idle_timeout]
+                        if not conns:
+                            del self._idle[k]
+        if conn is not None:
+            conn.close()
+        for c in expired:
+            c.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=None, context=None, source_address=None,
+                encode_chunked=False):
+        """发一个请求（不跟随跳转），返回 PooledResponse；响应体读完后连接自动回到池里"""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        host, port = parts.hostname, parts.port or (443 if scheme == "https" else 80)
+        selector = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        if scheme == "https" and context is None:
+            context = self.ssl_context()
+        key = (scheme, host, port, context if scheme == "https" else None, source_address)
+        retried = False
+        while True:
+            conn = self._acquire(key)
+            reused = conn is not None
+            if conn is None:
+                self._count("connections")
+                if scheme == "https":
+                    conn = PooledHTTPSConnection(self, host, port, timeout, source_address, context)
+                else:
+                    conn = PooledHTTPConnection(self, host, port, timeout, source_address)
+            else:
+                conn.timeout = timeout
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, selector, body, headers or {}, encode_chunked=encode_chunked)
+                response = conn.getresponse()
+            except _STALE_ERRORS:
+                conn.close()
+                if (reused and not retried and method in _IDEMPOTENT_METHODS
+                        and (body is None or isinstance(body, bytes))):
+                    retried = True
+                    self._count("stale_retries")
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["reused"] += reused
+        response._on_done = lambda reusable: self._release(key, conn, reusable)
+        if response.length == 0 and not response.chunked:
+            response._close_conn()  # HEAD、204、304 等没有响应体，马上归还
+        return response
+
+    def urlopen(self, url, headers=None, timeout=None, verify=True, method="GET", data=None):
+        """发请求并跟随跳转，状态码不是 2xx 时抛 urllib.error.HTTPError；返回的响应可以用 with"""
+        headers = dict({"User-Agent": DEFAULT_USER_AGENT}, **(headers or {}))
+        for _ in range(MAX_REDIRECTS + 1):
+            context = self.ssl_context(verify) if url.lower().startswith("https:") else None
+            response = self.request(method, url, data, headers, timeout, context)
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()  # 读完才能归还连接
+                url = urljoin(url, location)
+                if response.status == 303:
+                    method, data = "GET", None
+                continue
+            if response.status >= 400:
+                import urllib.error
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, response)
+            response.url = url
+            return response
+        raise http.client.HTTPException(f"跳转次数过多: {url}")
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, idle_connections=sum(len(c) for c in self._idle.values()))
+        stats["dns_hits"] = self.dns.stats["hits"]
+        stats["dns_misses"] = self.dns.stats["misses"]
+        return stats
+
+    def describe(self):
+        s = self.snapshot()
+        return (f"请求 {s['requests']} 次，新建连接 {s['connections']} 个，复用 {s['reused']} 次；"
+                f"TLS 会话恢复 {s['tls_resumed']}/{s['tls_resumed'] + s['tls_handshakes']}；"
+                f"DNS 缓存命中 {s['dns_hits']}/{s['dns_hits'] + s['dns_misses']}")
+
+    def close(self):
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for c in conns:
+            c.close()
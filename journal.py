@@ -0,0 +1,190 @@
+"""任务日志（journal）：只追加的 JSON Lines 文件，程序崩溃或被关闭后重启时恢复未完成的任务
+
+每行一条记录 {"id": ..., 字段...}，同一个 id 的记录按顺序合并，{"id": ..., "removed": true}
+表示任务已结束。写入先放进缓冲区，由后台线程每隔 FSYNC_INTERVAL 秒批量写入并 fsync 一次，
+崩溃时最多丢失这一小段时间内的进度。末尾写了一半的行在回放时忽略。
+解析结果（info dict）比较大，单独存成 info/<id>.json，不写进日志。
+日志只是尽力而为的保险：读写出错（磁盘满、目录被删、没有权限）时通过 on_error 报告一次，
+之后本次运行不再记录，错误不会传给调用方，下载照常进行。
+同一时间只应有一个进程使用同一个目录。只依赖标准库。
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+FSYNC_INTERVAL = 0.5
+# 追加的行数超过存活任务数的这么多倍时重写一次文件，只保留存活任务的最新状态
+COMPACT_RATIO = 4
+COMPACT_MIN_RECORDS = 1000
+
+
+class JobJournal:
+    def __init__(self, directory, fsync_interval=FSYNC_INTERVAL, on_error=None):
+        self.directory = directory
+        self.on_error = on_error
+        self.path = os.path.join(directory, "journal.jsonl")
+        self.info_dir = os.path.join(directory, "info")
+        self.fsync_interval = fsync_interval
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # 文件写入和 fsync 不占用 _cond，追加记录不会被磁盘卡住
+        self._pending = []
+        self._live = None  # id -> 合并后的记录，首次使用时从文件加载
+        self._recovered = []
+        self._records = 0  # 上次重写后追加的行数
+        self._file = None
+        self._thread = None
+        self.error = None  # 出错后停用，不再读写
+        self.stats = {"records": 0, "fsyncs": 0, "torn_lines": 0}
+
+    def _disable(self, error):
+        """读写出错：丢掉缓冲的记录，停用日志；只报告第一次的错误"""
+        with self._cond:
+            if self.error is not None:
+                return
+            self.error = error
+            self._pending = []
+            if self._live is None:
+                self._live = {}
+            self._cond.notify_all()
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def _load(self):
+        """回放日志文件，然后重写成只含存活任务的干净文件（调用方持有 _cond）"""
+        if self._live is not None:
+            return
+        try:
+            self._replay_file()
+        except OSError as e:
+            self._disable(e)
+
+    def _replay_file(self):
+        os.makedirs(self.info_dir, exist_ok=True)
+        live = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        job_id = record["id"]
+                    except (ValueError, KeyError, TypeError):
+                        self.stats["torn_lines"] += 1
+                        continue
+                    if record.get("removed"):
+                        live.pop(job_id, None)
+                    else:
+                        live.setdefault(job_id, {}).update(record)
+        except FileNotFoundError:
+            pass
+        self._live = live
+        self._recovered = [dict(r) for r in live.values()]
+        self._rewrite(live.values())
+        # 清理已结束任务留下的 info 文件
+        for name in os.listdir(self.info_dir):
+            if name.endswith(".json") and name[:-5] not in live:
+                try:
+                    os.remove(os.path.join(self.info_dir, name))
+                except OSError:
+                    pass
+
+    def _rewrite(self, records):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._records = 0
+
+    def replay(self):
+        """返回上次运行时没有结束的任务记录列表（按加入顺序）"""
+        with self._cond:
+            self._load()
+            recovered, self._recovered = self._recovered, []
+        return recovered
+
+    def append(self, job_id, **fields):
+        record = dict(fields, id=job_id)
+        with self._cond:
+            self._load()
+            if self.error is not None:
+                return
+            if record.get("removed"):
+                self._live.pop(job_id, None)
+            else:
+                self._live.setdefault(job_id, {}).update(record)
+            self._pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+            self._cond.notify()
+
+    def remove(self, job_id):
+        self.append(job_id, removed=True)
+        try:
+            os.remove(self._info_path(job_id))
+        except OSError:
+            pass
+
+    def _info_path(self, job_id):
+        return os.path.join(self.info_dir, f"{job_id}.json")
+
+    def save_info(self, job_id, info):
+        with self._cond:
+            self._load()
+            if self.error is not None:
+                return
+        path = self._info_path(job_id)
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(info, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            self._disable(e)
+
+    def load_info(self, job_id):
+        try:
+            with open(self._info_path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self.error is not None)
+                if self.error is not None:
+                    return
+            # 攒一小段时间的记录，一次 fsync
+            time.sleep(self.fsync_interval)
+            self.flush()
+
+    def flush(self):
+        """把缓冲区里的记录写入文件并 fsync"""
+        with self._write_lock:
+            with self._cond:
+                if not self._pending:
+                    return
+                lines, self._pending = self._pending, []
+                self._records += len(lines)
+                # 取走的记录和快照一致，之后追加的记录会写到重写后的新文件里
+                snapshot = None
+                if self._records >= max(COMPACT_MIN_RECORDS, COMPACT_RATIO * len(self._live)):
+                    snapshot = [dict(r) for r in self._live.values()]
+            try:
+                self._file.write("".join(lines))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self.stats["records"] += len(lines)
+                self.stats["fsyncs"] += 1
+                if snapshot is not None:
+                    self._rewrite(snapshot)
+            except OSError as e:
+                self._disable(e)
@@ -0,0 +1,333 @@
+"""直播录制：跟着 HLS 直播的播放列表下载新出现的分片，按时长滚动写成多个文件
+
+每次刷新播放列表只看媒体序号比上次大的分片，逐块写进当前文件，内存里只有当前这一份播放列表和
+一块读缓冲，直播录多久内存都不会涨。当前文件录够 roll_seconds 秒就换下一个文件，写完的文件
+改成正式文件名，录制中途停止或程序退出也只丢最后一个文件里的几个分片。
+
+播放列表刷新失败时按退避重试，地址过期（403）时调用 refresh_url 重新解析拿新地址；刷新间隔里
+直播已经滑出窗口的分片记为漏掉的分片，之后的内容换一个新文件，每个文件内部都是连续的。
+连续 gone_timeout 秒刷新不到，或者播放列表出现 #EXT-X-ENDLIST 时录制结束。
+只依赖标准库。
+"""
+import os
+import re
+import shutil
+import time
+from urllib.parse import urljoin
+
+from retry import ERR_EXPIRED, ERR_FATAL, ERR_NETWORK, ERR_THROTTLED, RetryPolicy, classify_error
+from storage import DEFAULT_WRITE_BUFFER, InsufficientSpace
+
+READ_CHUNK_SIZE = 256 * 1024
+DEFAULT_ROLL_SECONDS = 600  # 每个文件录多长时间
+DEFAULT_GONE_TIMEOUT = 60  # 播放列表连续这么多秒刷新不到就认为直播已经结束
+LIVE_EDGE_SEGMENTS = 3  # 开始录制时从倒数第几个分片开始（HLS 规范建议离直播末端至少 3 个分片）
+SEGMENT_RETRIES = 3
+
+
+class LiveUnsupported(Exception):
+    """这个直播流没法录制（加密、字节范围分片等）"""
+
+
+class Segment:
+    __slots__ = ("uri", "duration", "seq", "discontinuity", "init")
+
+    def __init__(self, uri, duration, seq, discontinuity, init):
+        self.uri = uri
+        self.duration = duration
+        self.seq = seq
+        self.discontinuity = discontinuity
+        self.init = init  # #EXT-X-MAP 初始化段地址（分片 MP4），TS 分片为 None
+
+
+class Playlist:
+    def __init__(self):
+        self.target_duration = 6.0
+        self.media_sequence = 0
+        self.segments = []
+        self.ended = False
+        self.variants = []  # 主播放列表：[(带宽, 地址)]
+
+
+def _attributes(text):
+    return dict((k, v.strip('"')) for k, v in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', text))
+
+
+def parse_playlist(text, base_url):
+    """解析 HLS 播放列表（主播放列表只取各码率的地址），分片地址都换成绝对地址"""
+    if not text.lstrip().startswith("#EXTM3U"):
+        raise LiveUnsupported("不是 HLS 播放列表")
+    playlist = Playlist()
+    duration, discontinuity, init, stream_inf = None, False, None, None
+    seq = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            playlist.target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            playlist.media_sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",", 1)[0])
+        elif line.startswith("#EXT-X-DISCONTINUITY") and not line.startswith("#EXT-X-DISCONTINUITY-"):
+            discontinuity = True
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = _attributes(line.split(":", 1)[1])
+            if "BYTERANGE" in attrs:
+                raise LiveUnsupported("按字节范围划分的初始化段")
+            init = urljoin(base_url, attrs["URI"])
+        elif line.startswith("#EXT-X-KEY:"):
+            if _attributes(line.split(":", 1)[1]).get("METHOD", "NONE") != "NONE":
+                raise LiveUnsupported("加密的直播流")
+        elif line.startswith("#EXT-X-BYTERANGE"):
+            raise LiveUnsupported("按字节范围划分的分片")
+        elif line.startswith("#EXT-X-ENDLIST"):
+            playlist.ended = True
+        elif line.startswith("#EXT-X-STREAM-INF:"):
+            stream_inf = _attributes(line.split(":", 1)[1])
+        elif not line.startswith("#"):
+            if stream_inf is not None:
+                playlist.variants.append((int(stream_inf.get("BANDWIDTH") or 0), urljoin(base_url, line)))
+                stream_inf = None
+                continue
+            if seq is None:
+                seq = playlist.media_sequence
+            playlist.segments.append(Segment(urljoin(base_url, line), duration or 0.0, seq, discontinuity, init))
+            seq += 1
+            duration, discontinuity = None, False
+    return playlist
+
+
+def next_index(basename, *directories):
+    """接着目录里已有的文件编号（重启后继续录同一个直播时不覆盖之前录好的文件）"""
+    pattern = re.compile(re.escape(basename) + r"\.(\d{3,})\.\w+$")
+    last = 0
+    for directory in directories:
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            continue
+        last = max([last] + [int(m.group(1)) for m in map(pattern.match, names) if m])
+    return last + 1
+
+
+def urllib_opener(url, headers):
+    import urllib.request  # 正常运行时用的是 yt-dlp 的连接，这里只是测试用的默认值，不在启动时导入
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30)
+
+
+class LiveRecorder:
+    """把 url 指向的 HLS 直播录成 directory 下的 basename.001.ts、basename.002.ts ...
+
+    stop_event（threading.Event）被设置后录完当前分片就结束。回调都在录制线程中执行：
+    progress(文件名, 已录字节数, 已录秒数, 速度)、on_file(文件名, 秒数)（一个文件写完）、
+    on_gap(漏掉的分片数, 秒数)、on_retry(错误类型)；refresh_url() 返回新的播放列表地址，
+    直播已经结束时返回 None。first_index 为第一个文件的编号，默认接着 directory 里已有的文件
+    """
+    def __init__(self, url, directory, basename, roll_seconds=DEFAULT_ROLL_SECONDS, headers=None,
+                 opener=urllib_opener, stop_event=None, progress=None, on_file=None, on_gap=None, on_retry=None,
+                 refresh_url=None, retry_policy=None, gone_timeout=DEFAULT_GONE_TIMEOUT, min_free=None,
+                 write_buffer=DEFAULT_WRITE_BUFFER, first_index=None):
+        self.url = url
+        self.directory = directory
+        self.basename = basename
+        self.roll_seconds = roll_seconds
+        self.headers = dict(headers or {})
+        self.opener = opener
+        self.stop_event = stop_event
+        self.progress = progress
+        self.on_file = on_file
+        self.on_gap = on_gap
+        self.on_retry = on_retry
+        self.refresh_url = refresh_url
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.gone_timeout = gone_timeout
+        self.min_free = min_free
+        self.write_buffer = write_buffer
+        self.stats = {"files": 0, "segments": 0, "bytes": 0, "seconds": 0.0, "gaps": 0, "missed_segments": 0,
+                      "missed_seconds": 0.0, "refreshes": 0, "retries": 0, "ended": False, "elapsed": 0.0}
+        self._file = None
+        self._path = None
+        self._file_seconds = 0.0
+        self._init = None  # (地址, 数据)，分片 MP4 的初始化段，每个文件开头都要写一份
+        self._index = first_index or next_index(basename, directory)
+        self._ext = None
+        self._started = None
+
+    def _stopped(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def _wait(self, seconds):
+        if seconds <= 0:
+            return
+        if self.stop_event is not None:
+            self.stop_event.wait(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _read(self, url):
+        with self.opener(url, self.headers) as resp:
+            return resp.read()
+
+    def _load(self):
+        """取一次播放列表；拿到的是主播放列表时换成码率最高的那一路"""
+        text = self._read(self.url).decode("utf-8", "replace")
+        playlist = parse_playlist(text, self.url)
+        if playlist.variants:
+            self.url = max(playlist.variants)[1]
+            playlist = parse_playlist(self._read(self.url).decode("utf-8", "replace"), self.url)
+        self.stats["refreshes"] += 1
+        return playlist
+
+    def record(self):
+        """一直录到直播结束、被要求停止或 gone_timeout 秒刷新不到播放列表，返回统计信息"""
+        self._started = time.time()
+        last_seq = None
+        last_ok = time.time()
+        retry = 0
+        try:
+            while not self._stopped():
+                loaded_at = time.time()
+                try:
+                    playlist = self._load()
+                except LiveUnsupported:
+                    raise
+                except Exception as e:
+                    kind = classify_error(e)
+                    if time.time() - last_ok > self.gone_timeout:
+                        # 直播结束后播放列表通常直接 404，不会补上 #EXT-X-ENDLIST
+                        self.stats["ended"] = True
+                        break
+                    retry += 1
+                    self.stats["retries"] += 1
+                    if self.on_retry is not None:
+                        self.on_retry(kind)
+                    if kind == ERR_EXPIRED and self.refresh_url is not None:
+                        url = self.refresh_url()
+                        if url is None:
+                            self.stats["ended"] = True
+                            break
+                        self.url = url
+                        continue
+                    self._wait(self.retry_policy.delay(min(retry, 6), kind if kind != ERR_FATAL else ERR_NETWORK, e))
+                    continue
+                retry = 0
+                last_ok = time.time()
+                segments = playlist.segments
+                if last_seq is None:
+                    # 直播从接近末端的地方开始录；已经结束的（整个回放）从头录
+                    segments = segments if playlist.ended else segments[-LIVE_EDGE_SEGMENTS:]
+                elif segments and segments[-1].seq < last_seq:
+                    # 媒体序号变小了：推流中断后重新开始，从新的窗口开头接着录
+                    self._roll()
+                else:
+                    segments = [s for s in segments if s.seq > last_seq]
+                    if segments and segments[0].seq > last_seq + 1:
+                        missed = segments[0].seq - last_seq - 1
+                        self._gap(missed, missed * playlist.target_duration)
+                new = False
+                for segment in segments:
+                    if self._stopped():
+                        break
+                    self._record_segment(segment)
+                    last_seq = segment.seq
+                    new = True
+                if playlist.ended:
+                    self.stats["ended"] = True
+                    break
+                # HLS 规范：有新分片时隔一个目标时长再刷新，没有时隔半个
+                interval = playlist.target_duration if new else playlist.target_duration / 2
+                self._wait(interval - (time.time() - loaded_at))
+        finally:
+            self._roll()
+            self.stats["elapsed"] = time.time() - self._started
+        return dict(self.stats)
+
+    def _gap(self, segments, seconds):
+        self.stats["gaps"] += 1
+        self.stats["missed_segments"] += segments
+        self.stats["missed_seconds"] += seconds
+        if self.on_gap is not None:
+            self.on_gap(segments, seconds)
+        self._roll()  # 漏掉的地方时间戳不连续，后面的内容放到新文件里
+
+    def _record_segment(self, segment):
+        if segment.discontinuity or (self._init is not None and segment.init != self._init[0]):
+            self._roll()  # 编码参数可能变了，换一个文件
+        if segment.init is not None and (self._init is None or self._init[0] != segment.init):
+            self._init = (segment.init, self._read(segment.init))
+        for attempt in range(SEGMENT_RETRIES + 1):
+            f = self._open(segment)
+            start = f.tell()
+            try:
+                n = self._copy(segment.uri, f)
+                break
+            except Exception as e:
+                # 写了一半的分片从文件里去掉，保证文件里只有完整的分片
+                f.flush()
+                f.seek(start)
+                f.truncate()
+                kind = classify_error(e)
+                if attempt == SEGMENT_RETRIES or kind not in (ERR_NETWORK, ERR_THROTTLED, ERR_EXPIRED):
+                    # 分片已经滑出窗口（404）或一直下载不了：记为漏掉，直播还在继续
+                    self._gap(1, segment.duration)
+                    return
+                self.stats["retries"] += 1
+                if self.on_retry is not None:
+                    self.on_retry(kind)
+                self._wait(self.retry_policy.delay(attempt + 1, kind, e))
+        self.stats["segments"] += 1
+        self.stats["bytes"] += n
+        self.stats["seconds"] += segment.duration
+        self._file_seconds += segment.duration
+        if self._file_seconds >= self.roll_seconds:
+            self._roll()
+
+    def _copy(self, url, f):
+        n = 0
+        with self.opener(url, self.headers) as resp:
+            while True:
+                chunk = resp.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                n += len(chunk)
+                if self.progress is not None:
+                    elapsed = max(time.time() - self._started, 1e-6)
+                    self.progress(self._path, self.stats["bytes"] + n, self.stats["seconds"],
+                                  (self.stats["bytes"] + n) / elapsed)
+        return n
+
+    def _open(self, segment):
+        if self._file is not None:
+            return self._file
+        if self.min_free is not None:
+            free = shutil.disk_usage(self.directory).free
+            if free < self.min_free:
+                raise InsufficientSpace(f"磁盘剩余空间 {free // 1024 // 1024}MB，低于保留空间，停止录制")
+        if self._ext is None:
+            path = segment.uri.split("?", 1)[0]
+            ext = os.path.splitext(path)[1].lstrip(".").lower()
+            self._ext = "mp4" if segment.init is not None or ext in ("m4s", "mp4") else ext if ext in ("aac", "ts") else "ts"
+        self._path = os.path.join(self.directory, f"{self.basename}.{self._index:03d}.{self._ext}")
+        self._file = open(self._path + ".part", "wb", buffering=self.write_buffer)
+        self._file_seconds = 0.0
+        if self._init is not None:
+            self._file.write(self._init[1])
+        return self._file
+
+    def _roll(self):
+        """结束当前文件：改成正式文件名，下一个分片写到新文件里"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if not self._file_seconds:
+            os.remove(self._path + ".part")
+            return
+        os.replace(self._path + ".part", self._path)
+        self._index += 1
+        self.stats["files"] += 1
+        if self.on_file is not None:
+            self.on_file(self._path, self._file_seconds)
@@ -0,0 +1,36 @@
+"""日志 / 进度通道：工作线程只往缓冲区里写，界面线程按固定帧率一次性取走
+
+日志行放在有上限的环形缓冲区里，写得太快时丢弃最旧的行并计数；
+进度更新按 key 合并，一帧内同一个任务只刷新一次。
+"""
+import threading
+from collections import deque
+
+
+class LogChannel:
+    def __init__(self, max_lines=2000):
+        self._lock = threading.Lock()
+        self._lines = deque(maxlen=max_lines)
+        self._dropped = 0
+        self._dirty = {}
+
+    def write(self, line):
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self._dropped += 1
+            self._lines.append(line)
+
+    def touch(self, key, item):
+        """标记某个对象（如下载任务）需要刷新，同一帧内多次标记只保留一次"""
+        with self._lock:
+            self._dirty[key] = item
+
+    def drain(self):
+        """取走缓冲区内容，返回 (日志行列表, 丢弃的行数, 待刷新对象列表)"""
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+            dropped, self._dropped = self._dropped, 0
+            dirty = list(self._dirty.values())
+            self._dirty.clear()
+        return lines, dropped, dirty
@@ -0,0 +1,260 @@
+"""本地媒体缓存：同一台机器上几个人下载同一个视频的同一个格式时，直接从缓存取文件，不再联网下载
+
+按 (提取器, 视频ID, 格式, 输出类型) 查找；文件按内容的 SHA-256 存放在 objects/<前两位>/<摘要>，
+同样的内容只存一份。命中时优先硬链接，其次 reflink（写时复制，APFS / Btrfs / XFS），都不行再复制。
+缓存总大小有上限，超出时按最近使用时间淘汰。取用前检查大小和修改时间，对不上时重新算摘要，
+内容被改过的条目直接作废。索引用 SQLite（WAL 模式），多个进程同时使用是安全的；
+多个用户共用时，缓存目录要对所有人可写（如 macOS 的 /Users/Shared）。
+只依赖标准库。
+"""
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_MAX_SIZE = 20 * 1024 ** 3
+HASH_CHUNK = 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl，Btrfs / XFS 上的 reflink
+
+
+class CacheEntry:
+    def __init__(self, key, digest, ext, size, path):
+        self.key = key
+        self.digest = digest
+        self.ext = ext
+        self.size = size
+        self.path = path
+
+
+def cache_key(extractor, video_id, format_id, variant=""):
+    """variant 区分同一格式的不同输出（如转码成 mp3），直接保存的为空"""
+    return f"{extractor}:{video_id}:{format_id}:{variant}"
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _reflink(src, dst):
+    if sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    elif sys.platform.startswith("linux"):
+        import fcntl
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+    else:
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+
+
+def _copy_verified(src, dst, digest):
+    """复制的同时计算摘要，和 digest 不一致时抛 ValueError（缓存文件已损坏）"""
+    h = hashlib.sha256()
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for chunk in iter(lambda: fin.read(HASH_CHUNK), b""):
+            h.update(chunk)
+            fout.write(chunk)
+    if h.hexdigest() != digest:
+        raise ValueError(f"摘要不一致: {src}")
+
+
+def _place(src, dst, verify_digest=None):
+    """把 src 放到 dst（先写临时名再改名），返回用的方式：hardlink / reflink / copy"""
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        for method, place in (("hardlink", os.link), ("reflink", _reflink)):
+            try:
+                place(src, tmp)
+                break
+            except OSError:
+                # 跨磁盘、文件系统不支持、别的用户的文件不允许硬链接（protected_hardlinks）等
+                if os.path.lexists(tmp):
+                    os.remove(tmp)
+        else:
+            method = "copy"
+            if verify_digest:
+                _copy_verified(src, tmp, verify_digest)
+            else:
+                shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+        return method
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class MediaCache:
+    key = staticmethod(cache_key)
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.objects_dir = os.path.join(directory, "objects")
+        self._local = threading.local()  # sqlite 连接不能跨线程共用，每个线程一个
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "corrupt": 0,
+                      "bytes_served": 0, "hardlink": 0, "reflink": 0, "copy": 0}
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                key TEXT PRIMARY KEY,
+                                digest TEXT NOT NULL,
+                                ext TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                mtime_ns INTEGER NOT NULL,
+                                last_used REAL NOT NULL
+                            ) WITHOUT ROWID""")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _check(self, row):
+        """缓存文件还在且内容没变返回 True；大小或修改时间对不上时重新算摘要确认"""
+        key, digest, ext, size, mtime_ns = row
+        path = self.object_path(digest)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if st.st_size == size and st.st_mtime_ns == mtime_ns:
+            return True
+        # 硬链接出去的文件被原地修改过，或者只是被 touch 了一下
+        if st.st_size == size and file_digest(path) == digest:
+            self._conn().execute("UPDATE entries SET mtime_ns = ? WHERE digest = ?", (st.st_mtime_ns, digest))
+            return True
+        return False
+
+    def lookup(self, key):
+        """返回 CacheEntry，没有或文件已损坏时返回 None（损坏的条目顺便删掉）"""
+        row = self._conn().execute("SELECT key, digest, ext, size, mtime_ns FROM entries WHERE key = ?",
+                                   (key,)).fetchone()
+        if row is not None and not self._check(row):
+            self._count("corrupt")
+            self._drop_digest(row[1])
+            row = None
+        if row is None:
+            self._count("misses")
+            return None
+        self._conn().execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return CacheEntry(key, row[1], row[2], row[3], self.object_path(row[1]))
+
+    def materialize(self, entry, dest):
+        """把缓存文件放到 dest，返回用的方式；缓存文件在这期间被删掉或损坏时返回 None"""
+        try:
+            method = _place(entry.path, dest, verify_digest=entry.digest)
+        except FileNotFoundError:
+            method = None  # 正好被其他进程淘汰了
+        except ValueError:
+            self._count("corrupt")
+            self._drop_digest(entry.digest)
+            method = None
+        if method is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        self._count(method)
+        self._count("bytes_served", entry.size)
+        return method
+
+    def store(self, key, path):
+        """把下载好的文件 path 加入缓存，返回摘要；同样内容的文件已经在缓存里时只加索引"""
+        digest = file_digest(path)
+        obj = self.object_path(digest)
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            _place(path, obj)
+        st = os.stat(obj)
+        ext = os.path.splitext(path)[1].lstrip(".")
+        self._conn().execute(
+            "INSERT OR REPLACE INTO entries (key, digest, ext, size, mtime_ns, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, digest, ext, st.st_size, st.st_mtime_ns, time.time()))
+        self._count("stores")
+        self.evict()
+        return digest
+
+    def _drop_digest(self, digest):
+        self._conn().execute("DELETE FROM entries WHERE digest = ?", (digest,))
+        try:
+            os.remove(self.object_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def total_size(self):
+        return self._conn().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)").fetchone()[0]
+
+    def evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新删除，直到不超过上限"""
+        conn = self._conn()
+        total = self.total_size()
+        if total <= self.max_size:
+            return
+        rows = conn.execute("SELECT key, digest, size FROM entries ORDER BY last_used").fetchall()
+        for key, digest, size in rows:
+            if total <= self.max_size:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count("evictions")
+            # 同一份内容还被其他条目引用时只删索引
+            if conn.execute("SELECT 1 FROM entries WHERE digest = ?", (digest,)).fetchone() is None:
+                try:
+                    os.remove(self.object_path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def verify(self):
+        """重新计算所有缓存文件的摘要，删掉损坏和丢失的，返回删掉的条目数"""
+        rows = self._conn().execute("SELECT DISTINCT digest FROM entries").fetchall()
+        bad = 0
+        for (digest,) in rows:
+            path = self.object_path(digest)
+            if not os.path.exists(path) or file_digest(path) != digest:
+                bad += self._conn().execute("SELECT COUNT(*) FROM entries WHERE digest = ?", (digest,)).fetchone()[0]
+                self._count("corrupt")
+                self._drop_digest(digest)
+        return bad
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def describe(self):
+        s = self.snapshot()
+        lookups = s["hits"] + s["misses"]
+        rate = f"{s['hits'] * 100 / lookups:.0f}%" if lookups else "-"
+        return (f"命中 {s['hits']}/{lookups} ({rate})，省下下载 {s['bytes_served'] / 1024 / 1024:.1f}MB"
+                f"（硬链接 {s['hardlink']} / reflink {s['reflink']} / 复制 {s['copy']}），"
+                f"新增 {s['stores']}，淘汰 {s['evictions']}，损坏 {s['corrupt']}")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,259 @@
+"""下载指标：每个任务的速度 / 剩余时间 / 分片速率时间序列、停滞检测，按 CDN 节点汇总并导出
+
+数据来自 yt-dlp 的进度回调（每读一块数据回调一次）。导出 JSON 和 Prometheus 文本格式两份文件，
+可以直接交给 node_exporter 的 textfile collector，也可以用脚本对比各个 CDN 节点的速度。
+只依赖标准库。
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+SAMPLE_INTERVAL = 1.0  # 时间序列每秒最多记一个点
+HISTORY = 600  # 每个任务保留最近这么多个点（约 10 分钟），任务再长内存也不涨
+SMOOTHING = 5.0  # 平滑速度的时间常数（秒），指数加权平均
+FINISHED_HISTORY = 200  # 保留最近结束的任务汇总
+# 停滞：速度连续这么多秒低于阈值（排除自己限速造成的慢）
+DEFAULT_STALL_SPEED = 10 * 1024
+DEFAULT_STALL_SECONDS = 20
+
+
+class JobMetrics:
+    def __init__(self, job_id, title="", stall_speed=DEFAULT_STALL_SPEED, stall_seconds=DEFAULT_STALL_SECONDS):
+        self.job_id = job_id
+        self.title = title
+        self.stall_speed = stall_speed
+        self.stall_seconds = stall_seconds
+        self.started = time.time()
+        self.samples = deque(maxlen=HISTORY)
+        self._streams = {}  # 文件名 -> [已下载, 已完成分片数]
+        self.downloaded = 0
+        self.total = None
+        self.fragments = 0
+        self.speed = None  # 最近一个采样间隔的瞬时速度
+        self.smoothed = None
+        self.eta = None
+        self.fragment_rate = None
+        self.stalls = 0
+        self.stalled = False
+        self._last = None  # (时间, 已下载, 分片数, 已限速等待秒数)
+        self._slow_since = None
+
+    def observe(self, key, downloaded, total=None, fragment_index=None, throttled_seconds=0.0, now=None):
+        """记录一次进度，返回 (本次新增字节数, 是否刚检测到停滞)"""
+        now = time.time() if now is None else now
+        stream = self._streams.setdefault(key, [0, 0])
+        delta = max(0, downloaded - stream[0])
+        stream[0] = downloaded
+        if fragment_index is not None:
+            stream[1] = fragment_index
+        self.downloaded = sum(s[0] for s in self._streams.values())
+        self.fragments = sum(s[1] for s in self._streams.values())
+        self.total = total
+        if self._last is None:
+            self._last = (now, self.downloaded, self.fragments, throttled_seconds)
+            return delta, False
+        last_t, last_bytes, last_frags, last_throttled = self._last
+        dt = now - last_t
+        if dt < SAMPLE_INTERVAL:
+            return delta, False
+
+        self.speed = max(0, self.downloaded - last_bytes) / dt
+        alpha = 1 - math.exp(-dt / SMOOTHING)
+        self.smoothed = self.speed if self.smoothed is None else self.smoothed + alpha * (self.speed - self.smoothed)
+        self.fragment_rate = (self.fragments - last_frags) / dt if self.fragments else None
+        self.eta = (total - self.downloaded) / self.smoothed if total and self.smoothed else None
+        self.samples.append((round(now, 2), self.downloaded, round(self.speed), round(self.smoothed),
+                             None if self.eta is None else round(self.eta, 1), self.fragment_rate))
+        self._last = (now, self.downloaded, self.fragments, throttled_seconds)
+        return delta, self._check_stall(now, dt, throttled_seconds - last_throttled)
+
+    def _check_stall(self, now, dt, throttled):
+        # 这段时间一半以上在等限速令牌，慢是自己限的，不算停滞
+        if not self.stall_seconds or self.speed >= self.stall_speed or throttled > dt / 2:
+            self._slow_since = None
+            self.stalled = False
+            return False
+        if self._slow_since is None:
+            self._slow_since = now - dt
+        if now - self._slow_since < self.stall_seconds:
+            return False
+        self.stalled = True
+        self.stalls += 1
+        self._slow_since = now  # 重新连接后再给一个完整的观察期
+        return True
+
+    def series(self):
+        keys = ("time", "downloaded", "speed", "smoothed_speed", "eta", "fragments_per_second")
+        return [dict(zip(keys, s)) for s in self.samples]
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        return {
+            "job": self.job_id,
+            "title": self.title,
+            "downloaded": self.downloaded,
+            "total": self.total,
+            "elapsed": round(elapsed, 2),
+            "average_speed": round(self.downloaded / elapsed) if elapsed > 0 else None,
+            "speed": self.speed and round(self.speed),
+            "smoothed_speed": self.smoothed and round(self.smoothed),
+            "eta": self.eta and round(self.eta, 1),
+            "fragments": self.fragments,
+            "fragments_per_second": self.fragment_rate,
+            "stalls": self.stalls,
+            "stalled": self.stalled,
+        }
+
+
+class MetricsRegistry:
+    """所有任务的指标，外加按 CDN 节点（下载地址的主机名）汇总的字节数、连接时长、停滞次数"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = {}
+        self.finished = deque(maxlen=FINISHED_HISTORY)
+        self.hosts = {}
+        self._host_seen = {}  # (任务, 文件名) -> 上次观察时间，用来累计每个连接的时长
+        self._exported = 0
+        self._sources = {}  # 名字 -> 返回计数器字典的函数，如连接池的复用统计
+
+    def add_source(self, name, snapshot):
+        """导出时一并输出 snapshot() 返回的计数器（名字以 idle 开头的按当前值，其余按累计值）"""
+        self._sources[name] = snapshot
+
+    def job(self, job_id, title="", **kwargs):
+        with self._lock:
+            metrics = self.jobs.get(job_id)
+            if metrics is None:
+                metrics = self.jobs[job_id] = JobMetrics(job_id, title, **kwargs)
+            return metrics
+
+    def observe(self, job_id, key, host, downloaded, total=None, fragment_index=None, throttled_seconds=0.0):
+        """记录一次进度，返回是否检测到停滞"""
+        now = time.time()
+        with self._lock:
+            metrics = self.jobs.get(job_id)
+            if metrics is None:
+                return False
+            delta, stalled = metrics.observe(key, downloaded, total, fragment_index, throttled_seconds, now)
+            if host:
+                stats = self.hosts.setdefault(host, {"bytes": 0, "seconds": 0.0, "stalls": 0})
+                last_seen = self._host_seen.get((job_id, key))
+                # 两次回调间隔太长（重试、排队）不算连接时长
+                if last_seen is not None and now - last_seen < 10:
+                    stats["seconds"] += now - last_seen
+                self._host_seen[(job_id, key)] = now
+                stats["bytes"] += delta
+                if stalled:
+                    stats["stalls"] += 1
+        return stalled
+
+    def finish(self, job_id):
+        with self._lock:
+            metrics = self.jobs.pop(job_id, None)
+            if metrics is not None:
+                metrics.eta = None
+                metrics.stalled = False
+                self.finished.append(metrics.summary())
+            for key in [k for k in self._host_seen if k[0] == job_id]:
+                del self._host_seen[key]
+
+    def summary(self):
+        with self._lock:
+            return {
+                "generated": round(time.time(), 2),
+                "active": [dict(m.summary(), series=m.series()) for m in self.jobs.values()],
+                "finished": list(self.finished),
+                "hosts": {
+                    host: dict(s, average_speed=round(s["bytes"] / s["seconds"]) if s["seconds"] else None)
+                    for host, s in self.hosts.items()
+                },
+                "counters": {name: snapshot() for name, snapshot in self._sources.items()},
+            }
+
+    def maybe_export(self, path, interval):
+        """距上次导出超过 interval 秒时导出；各个下载线程的进度回调都会调用，同一时间只有一个线程去写
+
+        写失败（路径不对、磁盘满）时返回 OSError，不抛出：导出指标不能让下载失败
+        """
+        if not path:
+            return None
+        now = time.time()
+        with self._lock:
+            if now - self._exported < interval:
+                return None
+            self._exported = now
+        try:
+            self.export(path)
+        except OSError as e:
+            return e
+        return None
+
+    def export(self, path):
+        """写 path（JSON）和同名的 .prom 文件（Prometheus 文本格式）"""
+        summary = self.summary()
+        _write_atomic(path, json.dumps(summary, ensure_ascii=False, indent=1))
+        _write_atomic(os.path.splitext(path)[0] + ".prom", format_prometheus(summary))
+
+
+def _write_atomic(path, text):
+    # 每次写各自的临时文件，同时导出时不会互相截断或改名走对方写了一半的文件
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.chmod(tmp, 0o644)  # mkstemp 建的文件只有自己能读，textfile collector 可能以别的用户运行
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(summary):
+    lines = []
+
+    def metric(name, kind, help_text, rows):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in rows:
+            if value is not None:
+                label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    jobs = [({"job": j["job"], "title": j["title"]}, j) for j in summary["active"]]
+    metric("ytdl_job_downloaded_bytes", "gauge", "Bytes downloaded so far",
+           [(labels, j["downloaded"]) for labels, j in jobs])
+    metric("ytdl_job_speed_bytes", "gauge", "Smoothed download speed (bytes/s)",
+           [(labels, j["smoothed_speed"]) for labels, j in jobs])
+    metric("ytdl_job_eta_seconds", "gauge", "Estimated time remaining",
+           [(labels, j["eta"]) for labels, j in jobs])
+    metric("ytdl_job_fragments_per_second", "gauge", "Fragments completed per second",
+           [(labels, j["fragments_per_second"]) for labels, j in jobs])
+    metric("ytdl_job_stalls_total", "counter", "Stalls detected for the job",
+           [(labels, j["stalls"]) for labels, j in jobs])
+    hosts = summary["hosts"].items()
+    metric("ytdl_host_bytes_total", "counter", "Bytes downloaded from the host",
+           [({"host": h}, s["bytes"]) for h, s in hosts])
+    metric("ytdl_host_connection_seconds_total", "counter", "Time spent receiving from the host, per connection",
+           [({"host": h}, round(s["seconds"], 2)) for h, s in hosts])
+    metric("ytdl_host_speed_bytes", "gauge", "Average per-connection speed from the host (bytes/s)",
+           [({"host": h}, s["average_speed"]) for h, s in hosts])
+    metric("ytdl_host_stalls_total", "counter", "Stalls detected on connections to the host",
+           [({"host": h}, s["stalls"]) for h, s in hosts])
+    for source, counters in summary.get("counters", {}).items():
+        for key, value in counters.items():
+            if key.startswith("idle"):
+                metric(f"ytdl_{source}_{key}", "gauge", f"{source}: {key.replace('_', ' ')}", [({}, value)])
+            else:
+                metric(f"ytdl_{source}_{key}_total", "counter", f"{source}: {key.replace('_', ' ')}", [({}, value)])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,189 @@
+"""后期处理规划：按选中格式的编码和目标容器，决定每路流直接复制（重新封装）还是转码
+
+重新封装只拷贝数据，几乎不占 CPU；转码要先解码再编码，几分钟的音频也要占满一个核好几秒，视频更慢。
+这里只看格式信息里的编码（vcodec / acodec），不用 ffprobe 去量文件：目标容器装得下的流一律复制；
+装不下时优先换一个什么都能装的容器（mkv），文件名已经定了、不得不用原容器时才转码。
+转码时 FFmpeg 的线程数按本机核数和同时在转码的任务数分配。
+只依赖标准库。
+"""
+import contextlib
+import os
+import re
+import threading
+
+from formats import codec_family
+
+DEFAULT_AUDIO_BITRATE = 192  # kbps，音频需要转码时的码率
+# 各容器能直接装进去的编码（按 formats.codec_family 归类）：(视频, 音频)，None 表示基本什么都能装
+CONTAINER_CODECS = {
+    "mp4": ({"avc1", "hevc", "av1", "vp9"}, {"aac", "mp3", "opus", "flac", "alac", "ac-3", "ec-3"}),
+    "m4a": (set(), {"aac", "alac"}),
+    "mp3": (set(), {"mp3"}),
+    "webm": ({"vp8", "vp9", "av1"}, {"opus", "vorbis"}),
+    "opus": (set(), {"opus"}),
+    "ogg": (set(), {"vorbis", "opus", "flac"}),
+    "flac": (set(), {"flac"}),
+    "mkv": None,
+    "mka": None,
+}
+FALLBACK_CONTAINER = "mkv"
+# 保留原编码（audio_format='original'）时各编码用的容器，没有列出的放进 mka
+NATIVE_AUDIO_CONTAINERS = {"aac": "m4a", "alac": "m4a", "mp3": "mp3", "opus": "opus", "vorbis": "ogg", "flac": "flac"}
+# 格式信息里没有编码时按扩展名猜
+EXT_AUDIO_CODECS = {"m4a": "aac", "mp3": "mp3", "opus": "opus", "ogg": "vorbis", "flac": "flac"}
+# 目标容器 -> 转码时用的编码器和参数（{bitrate}、{n} 替换为码率和该类流的序号）
+AUDIO_ENCODERS = {
+    "mp3": ("mp3", ["-c:a:{n}", "libmp3lame", "-b:a:{n}", "{bitrate}k"]),
+    "opus": ("opus", ["-c:a:{n}", "libopus", "-b:a:{n}", "{bitrate}k"]),
+}
+DEFAULT_AUDIO_ENCODER = ("aac", ["-c:a:{n}", "aac", "-b:a:{n}", "{bitrate}k"])
+VIDEO_ENCODER = ("avc1", ["-c:v:{n}", "libx264", "-preset", "veryfast", "-crf", "20"])
+AUDIO_FORMATS = ("m4a", "mp3", "original")
+AUDIO_CONTAINERS = ("m4a", "mp3", "opus", "ogg", "flac", "mka")  # 只有音频的输出容器
+BENCH_RE = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s")
+
+
+class StreamPlan:
+    __slots__ = ("kind", "index", "codec", "target", "args", "reason")
+
+    def __init__(self, kind, index, codec, target=None, args=(), reason=""):
+        self.kind = kind  # 'video' / 'audio'
+        self.index = index  # 在输出文件同类流中的序号
+        self.codec = codec  # 源编码，不知道时为 None
+        self.target = target  # 转码后的编码，None 表示直接复制
+        self.args = list(args)
+        self.reason = reason
+
+    @property
+    def copy(self):
+        return self.target is None
+
+
+class Plan:
+    """一次 FFmpeg 调用的处理方案：输出容器和每路流的处理方式"""
+    def __init__(self, container, streams, note=""):
+        self.container = container
+        self.streams = streams
+        self.note = note  # 换容器等整体决定的原因
+
+    @property
+    def copy_only(self):
+        return all(s.copy for s in self.streams)
+
+    def codec_args(self, threads=None):
+        """FFmpeg 输出参数：默认全部复制，需要转码的流单独指定编码器"""
+        args = ["-c", "copy"]
+        for s in self.streams:
+            args += s.args
+        if threads and not self.copy_only:
+            args += ["-threads", str(threads)]
+        return args
+
+    def describe(self):
+        kinds = {"video": "视频", "audio": "音频"}
+        parts = []
+        for s in self.streams:
+            codec = s.codec or "未知编码"
+            if s.copy:
+                parts.append(f"{kinds[s.kind]} {codec} 复制")
+            else:
+                parts.append(f"{kinds[s.kind]} {codec}→{s.target} 转码（{s.reason}）")
+        summary = "，".join(parts) + f" → {self.container}"
+        summary += "（只重新封装）" if self.copy_only else ""
+        return summary + (f"；{self.note}" if self.note else "")
+
+
+def _fits(container, kind, codec):
+    allowed = CONTAINER_CODECS.get(container)
+    if allowed is None or codec is None:
+        return True  # 不知道编码时和原来一样直接复制，由 FFmpeg 判断
+    return codec in allowed[0 if kind == "video" else 1]
+
+
+def _encode(kind, index, codec, container, bitrate):
+    target, template = VIDEO_ENCODER if kind == "video" else AUDIO_ENCODERS.get(container, DEFAULT_AUDIO_ENCODER)
+    args = [a.format(n=index, bitrate=bitrate) for a in template]
+    return StreamPlan(kind, index, codec, target, args, f"{container} 装不下 {codec or '未知编码'}")
+
+
+def plan_merge(formats, container, bitrate=DEFAULT_AUDIO_BITRATE, fallback=FALLBACK_CONTAINER):
+    """合并多路流（yt-dlp 的格式字典，按 -map 的顺序）到 container
+
+    有编码 container 装不下时换成 fallback 容器，fallback 为 None（文件名已经定了）时转码装不下的流
+    """
+    streams = []
+    counts = {"video": 0, "audio": 0}
+    for f in formats:
+        for kind, key in (("audio", "acodec"), ("video", "vcodec")):
+            if f.get(key) != "none":
+                streams.append((kind, codec_family(f.get(key))))
+    note = ""
+    misfits = [c for kind, c in streams if not _fits(container, kind, c)]
+    if misfits and fallback:
+        note = f"{container} 装不下 {'/'.join(misfits)}，改用 {fallback} 容器，不重新编码"
+        container = fallback
+    plans = []
+    for kind, codec in streams:
+        index = counts[kind]
+        counts[kind] += 1
+        plans.append(StreamPlan(kind, index, codec) if _fits(container, kind, codec)
+                     else _encode(kind, index, codec, container, bitrate))
+    return Plan(container, plans, note)
+
+
+def audio_codec(acodec, ext=None):
+    """格式信息里的音频编码（如 'mp4a.40.2'）-> 编码族；没有时按扩展名猜"""
+    return codec_family(acodec) if acodec and acodec != "none" else EXT_AUDIO_CODECS.get(ext)
+
+
+def plan_audio(acodec, ext, audio_format="m4a", bitrate=DEFAULT_AUDIO_BITRATE):
+    """仅音频：把源文件的音频放进 audio_format（m4a / mp3 / original）对应的容器
+
+    original 按源编码选容器，永远不转码；m4a / mp3 源编码一样时直接复制
+    """
+    codec = audio_codec(acodec, ext)
+    if audio_format == "original":
+        return Plan(NATIVE_AUDIO_CONTAINERS.get(codec, "mka"), [StreamPlan("audio", 0, codec)])
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"不支持的音频格式: {audio_format}，可选 {', '.join(AUDIO_FORMATS)}")
+    # 编码未知时不能确定装得下，按需要转码处理
+    if codec is not None and _fits(audio_format, "audio", codec):
+        stream = StreamPlan("audio", 0, codec)
+        if codec == "aac":
+            stream.args = ["-bsf:a", "aac_adtstoasc"]  # HLS 下载的 AAC 是 ADTS 格式，放进 m4a 要转换
+        return Plan(audio_format, [stream])
+    return Plan(audio_format, [_encode("audio", 0, codec, audio_format, bitrate)])
+
+
+def parse_benchmark(stderr):
+    """FFmpeg -benchmark 输出里的 (CPU 秒数, 实际秒数)，没有时返回 None"""
+    match = BENCH_RE.search(stderr or "")
+    if match is None:
+        return None
+    utime, stime, rtime = map(float, match.groups())
+    return utime + stime, rtime
+
+
+class TranscodeSlots:
+    """把本机的 CPU 核分给同时进行的转码，分出去的线程总数不超过核数
+
+    concurrency 是最多会同时转码的任务数（后处理并发数），每个转码最多分 cpus // concurrency 个线程；
+    核已经分完时（边下边转之类不占后处理名额的转码）只给 1 个线程。
+    """
+    def __init__(self, cpus=None, concurrency=1):
+        self.cpus = cpus or os.cpu_count() or 1
+        self.concurrency = max(1, concurrency)
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """进入时返回这次转码可以用的线程数，退出时还回去"""
+        with self._lock:
+            threads = max(1, min(self.cpus // self.concurrency, self.cpus - self._used))
+            self._used += threads
+        try:
+            yield threads
+        finally:
+            with self._lock:
+                self._used -= threads
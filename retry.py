@@ -0,0 +1,124 @@
+"""下载失败重试：错误分类 + 指数退避（带随机抖动）
+
+按异常链上的 HTTP 状态码、异常类型和错误信息分类，不同类型的错误处理方式不同：
+限流要等久一点，签名直链过期要重新解析，网络中断就地续传，其他错误不重试。
+只依赖标准库，不需要导入 yt-dlp。
+"""
+import random
+import re
+
+ERR_THROTTLED = "throttled"  # 429 / 503：服务器限流
+ERR_EXPIRED = "expired"  # 403 / 410：签名直链过期，需要重新解析拿新地址
+ERR_NETWORK = "network"  # 连接被重置、超时、数据不完整
+ERR_EXTRACTOR = "extractor"  # 解析失败（网页/接口临时出错）
+ERR_FATAL = "fatal"  # 磁盘满、视频不可用等，重试也没用
+
+ERROR_LABELS = {
+    ERR_THROTTLED: "服务器限流",
+    ERR_EXPIRED: "下载地址过期",
+    ERR_NETWORK: "网络中断",
+    ERR_EXTRACTOR: "解析出错",
+    ERR_FATAL: "无法恢复的错误",
+}
+
+# yt-dlp 的异常类型按名字判断，避免导入 yt-dlp（IncompleteRead 同时也是 http.client 的）
+_NETWORK_ERROR_NAMES = {"TransportError", "ContentTooShortError", "IncompleteRead", "ProxyError"}
+_MESSAGE_PATTERNS = [
+    (ERR_THROTTLED, re.compile(r"HTTP Error 429|Too Many Requests|HTTP Error 503", re.I)),
+    (ERR_EXPIRED, re.compile(r"HTTP Error 403|HTTP Error 410|Forbidden", re.I)),
+    (ERR_NETWORK, re.compile(r"timed out|Connection (reset|aborted|refused)|Remote end closed|IncompleteRead|数据不完整", re.I)),
+    (ERR_EXTRACTOR, re.compile(r"Unable to (extract|download (webpage|API|JSON))", re.I)),
+]
+
+
+def error_chain(exc, limit=8):
+    """异常本身以及它包装的原始异常（yt-dlp 的 exc_info / cause，Python 的 __cause__ / __context__）"""
+    seen = set()
+    todo = [exc]
+    while todo and len(seen) < limit:
+        e = todo.pop(0)
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        yield e
+        exc_info = getattr(e, "exc_info", None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1:
+            todo.append(exc_info[1])
+        cause = getattr(e, "cause", None)
+        if isinstance(cause, BaseException):
+            todo.append(cause)
+        todo += [e.__cause__, e.__context__]
+
+
+def http_status(exc):
+    for e in error_chain(exc):
+        status = getattr(e, "status", None) or getattr(e, "code", None)
+        if isinstance(status, int) and 100 <= status < 600:
+            return status
+    return None
+
+
+def retry_after(exc):
+    """限流响应里的 Retry-After（秒），没有时返回 None"""
+    for e in error_chain(exc):
+        response = getattr(e, "response", None) or getattr(e, "fp", None)
+        headers = getattr(response, "headers", None) or getattr(e, "headers", None)
+        value = headers.get("Retry-After") if headers is not None else None
+        if value and str(value).strip().isdigit():
+            return int(value)
+    return None
+
+
+def classify_error(exc):
+    status = http_status(exc)
+    if status in (429, 503):
+        return ERR_THROTTLED
+    if status in (403, 410):
+        return ERR_EXPIRED
+    if status is not None and status >= 500:
+        return ERR_NETWORK
+    for e in error_chain(exc):
+        if isinstance(e, (ConnectionError, TimeoutError)):
+            return ERR_NETWORK
+        # http.client.IncompleteRead 也按名字判断：导入 http.client 会把 email 等一串模块带进启动阶段
+        if type(e).__name__ in _NETWORK_ERROR_NAMES:
+            return ERR_NETWORK
+        if type(e).__name__ == "ExtractorError":
+            # expected=True 是“视频不存在/需要登录”这类确定的错误
+            return ERR_FATAL if getattr(e, "expected", False) else ERR_EXTRACTOR
+    message = str(exc)
+    for kind, pattern in _MESSAGE_PATTERNS:
+        if pattern.search(message):
+            return kind
+    return ERR_FATAL
+
+
+class RetryPolicy:
+    """attempts 为总尝试次数（含第一次）；第 n 次重试前等待 base * 2^(n-1) 秒左右，不超过 max_delay"""
+    def __init__(self, attempts=3, base=1.0, max_delay=60.0, throttle_base=10.0):
+        self.attempts = attempts
+        self.base = base
+        self.max_delay = max_delay
+        self.throttle_base = throttle_base
+
+    def retryable(self, kind):
+        return kind != ERR_FATAL
+
+    def delay(self, retry, kind=ERR_NETWORK, exc=None):
+        """第 retry 次重试（从 1 开始）前等待的秒数"""
+        if kind == ERR_EXPIRED:
+            return 0.0  # 重新解析拿新地址就行，不用等
+        cap = min(self.max_delay, (self.throttle_base if kind == ERR_THROTTLED else self.base) * 2 ** (retry - 1))
+        # 一半固定、一半随机：多个任务同时失败时错开重试时间，又不会等得太短
+        delay = cap / 2 + random.uniform(0, cap / 2)
+        if kind == ERR_THROTTLED and exc is not None:
+            delay = max(delay, min(retry_after(exc) or 0, self.max_delay))
+        return delay
+
+    def sleep_function(self, kind, on_retry=None):
+        """生成 yt-dlp retry_sleep_functions 用的函数（参数 n 从 0 开始），每次重试时回调 on_retry(kind)"""
+        def sleep(n):
+            if on_retry is not None:
+                on_retry(kind)
+            return self.delay(n + 1, kind)
+        return sleep
@@ -0,0 +1,260 @@
+"""片段下载：只下载覆盖指定时间段的分片或字节范围，不重新编码地剪出这一段
+
+几个小时的直播回放只要其中 30 秒时，不用整个下载下来再剪：DASH 分片按各分片的时长选出覆盖这段时间的
+分片；DASH 直链（分片 MP4）先读文件头部的 sidx 索引，只请求覆盖这段时间的字节范围，拼在初始化段
+（ftyp + moov）后面就是一个能直接播放的文件。分片和 sidx 子段都从关键帧开始，起点向前取到最近的
+关键帧，所以剪切时 FFmpeg 直接复制数据，不需要重新编码。
+HLS、WebM、没有 sidx 的 MP4 抛 SectionUnsupported，由调用方交给 FFmpeg 直接读网络地址。
+只依赖标准库。
+"""
+import re
+import struct
+import time
+
+from retry import ERR_NETWORK, ERR_THROTTLED, RetryPolicy, classify_error
+from storage import DEFAULT_WRITE_BUFFER
+
+READ_CHUNK_SIZE = 256 * 1024
+# 第一次读文件头的大小；DASH 直链的 ftyp + moov + sidx 一般只有几 KB
+INDEX_PROBE_SIZE = 64 * 1024
+# sidx 在这个范围内还没出现就不再找（普通 MP4 的 moov 可能有几十 MB）
+INDEX_LIMIT = 4 * 1024 * 1024
+DEFAULT_RANGE_RETRIES = 5
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"  # WebM / Matroska
+
+
+class SectionUnsupported(Exception):
+    """这个格式没法只下载一部分（没有分片时长或 sidx 索引、服务器不支持 Range）"""
+
+
+def urllib_opener(url, headers):
+    import urllib.request  # 正常运行时用的是 yt-dlp 的连接，这里只是测试用的默认值，不在启动时导入
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30)
+
+
+def parse_timestamp(text):
+    """'90' / '1:30' / '1:02:03.5' / '1h2m3s' -> 秒数；空字符串和 None 返回 None"""
+    if text is None or isinstance(text, (int, float)):
+        return None if text is None else float(text)
+    text = text.strip()
+    if not text:
+        return None
+    match = re.fullmatch(r"(?:(\d+):)?(?:(\d+):)?(\d+(?:\.\d+)?)", text)
+    if match:
+        parts = [float(p) for p in match.groups() if p is not None]
+        seconds = 0.0
+        for p in parts:
+            seconds = seconds * 60 + p
+        return seconds
+    match = re.fullmatch(r"(?:(\d+)h)?(?:(\d+)m)?(?:(\d+(?:\.\d+)?)s)?", text.lower())
+    if match and any(match.groups()):
+        h, m, s = (float(g or 0) for g in match.groups())
+        return h * 3600 + m * 60 + s
+    raise ValueError(f"无法识别的时间: {text}，示例: 90、1:30、1:02:03、1h2m3s")
+
+
+def format_timestamp(seconds):
+    seconds = max(0.0, seconds)
+    whole = int(seconds)
+    h, rest = divmod(whole, 3600)
+    m, s = divmod(rest, 60)
+    frac = f"{seconds - whole:.3f}"[1:].rstrip("0").rstrip(".")
+    return (f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}") + frac
+
+
+def parse_section(start, end):
+    """起止时间（文字或秒数）-> (开始秒数, 结束秒数或 None)；两个都为空时返回 None"""
+    start, end = parse_timestamp(start), parse_timestamp(end)
+    if start is None and end is None:
+        return None
+    start = start or 0.0
+    if end is not None and end <= start:
+        raise ValueError(f"结束时间 {format_timestamp(end)} 要晚于开始时间 {format_timestamp(start)}")
+    return start, end
+
+
+def select_fragments(fragments, start, end=None):
+    """从 yt-dlp 的分片列表里选出覆盖 [start, end) 的分片，返回 (分片列表, 第一个选中分片的开始时间)
+
+    开头没有 duration 的分片是初始化段，总是保留；其他分片缺少时长时没法定位，抛 SectionUnsupported
+    """
+    init = [f for f in fragments[:1] if f.get("duration") is None]
+    media = fragments[len(init):]
+    if not media or any(f.get("duration") is None for f in media):
+        raise SectionUnsupported("分片没有时长信息")
+    selected, offset, t = [], None, 0.0
+    for f in media:
+        f_end = t + f["duration"]
+        if f_end > start and (end is None or t < end):
+            if offset is None:
+                offset = t
+            selected.append(f)
+        t = f_end
+    if not selected:
+        raise ValueError(f"开始时间 {format_timestamp(start)} 超出了视频长度 {format_timestamp(t)}")
+    return init + selected, offset
+
+
+def parse_sidx(data, pos):
+    """解析 pos 处的 sidx 盒子，返回子段列表 [(字节起点, 字节数, 开始时间, 时长, 是否从关键帧开始)]"""
+    size, = struct.unpack_from(">I", data, pos)
+    version = data[pos + 8]
+    p = pos + 12
+    _reference_id, timescale = struct.unpack_from(">II", data, p)
+    p += 8
+    if version == 0:
+        earliest, first_offset = struct.unpack_from(">II", data, p)
+        p += 8
+    else:
+        earliest, first_offset = struct.unpack_from(">QQ", data, p)
+        p += 16
+    _, count = struct.unpack_from(">HH", data, p)
+    p += 4
+    byte, t = pos + size + first_offset, earliest
+    subsegments = []
+    for _ in range(count):
+        reference, duration, sap = struct.unpack_from(">III", data, p)
+        p += 12
+        if reference >> 31:
+            raise SectionUnsupported("分层的 sidx 索引")
+        length = reference & 0x7FFFFFFF
+        subsegments.append((byte, length, t / timescale, duration / timescale, bool(sap >> 31)))
+        byte += length
+        t += duration
+    return subsegments
+
+
+def select_subsegments(subsegments, start, end=None):
+    """选出覆盖 [start, end) 的子段，起点向前退到从关键帧开始的子段，返回 (字节起点, 字节终点, 开始时间)"""
+    first = next((i for i, s in enumerate(subsegments) if s[2] + s[3] > start), None)
+    if first is None:
+        last = subsegments[-1] if subsegments else None
+        total = last[2] + last[3] if last else 0
+        raise ValueError(f"开始时间 {format_timestamp(start)} 超出了视频长度 {format_timestamp(total)}")
+    # 有的封装器不填关键帧标记，全都没有时按 DASH 的规定当作每个子段都从关键帧开始
+    if any(s[4] for s in subsegments):
+        while first > 0 and not subsegments[first][4]:
+            first -= 1
+    last = first
+    while last + 1 < len(subsegments) and (end is None or subsegments[last + 1][2] < end):
+        last += 1
+    byte_end = subsegments[last][0] + subsegments[last][1] - 1
+    return subsegments[first][0], byte_end, subsegments[first][2]
+
+
+def cut_input_args(start, end, offset=0.0):
+    """FFmpeg 输入选项：从文件里剪出 [start, end)；offset 是文件开头对应的原视频时间
+
+    -ss 放在输入前，复制数据时从 start 之前最近的关键帧开始，多路输入按同一时间点对齐
+    """
+    args = ["-ss", f"{max(0.0, start - offset):.3f}"]
+    if end is not None:
+        args += ["-t", f"{end - start:.3f}"]
+    return args
+
+
+class SectionDownloader:
+    """只下载 DASH 直链（带 sidx 索引的分片 MP4）里覆盖 [start, end) 的部分，写到 filename
+
+    写出的文件是初始化段 + 选中的子段，时间戳保留原视频里的时间；progress(downloaded, total, speed)
+    在下载线程中回调。网络中断、限流时从断开的位置续传，每次重试回调 on_retry(kind)
+    """
+    def __init__(self, url, filename, start, end=None, headers=None, opener=urllib_opener, progress=None,
+                 retries=DEFAULT_RANGE_RETRIES, retry_policy=None, on_retry=None, write_buffer=DEFAULT_WRITE_BUFFER):
+        self.url = url
+        self.filename = filename
+        self.start = start
+        self.end = end
+        self.headers = dict(headers or {})
+        self.opener = opener
+        self.progress = progress
+        self.retries = retries
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.on_retry = on_retry
+        self.write_buffer = write_buffer
+        self._transferred = 0
+
+    def _fetch(self, start, end):
+        with self.opener(self.url, {**self.headers, "Range": f"bytes={start}-{end}"}) as resp:
+            if resp.status != 206:
+                raise SectionUnsupported(f"服务器不支持 Range 请求 (HTTP {resp.status})")
+            data = resp.read()
+        self._transferred += len(data)
+        return data
+
+    def read_index(self):
+        """读文件头，返回 (初始化段的数据, sidx 子段列表)"""
+        data = self._fetch(0, INDEX_PROBE_SIZE - 1)
+        if data.startswith(EBML_MAGIC):
+            raise SectionUnsupported("WebM 格式")
+        pos = 0
+        while True:
+            if pos + 16 > len(data):
+                data += self._more(data, pos + 16)
+            size, kind = struct.unpack_from(">I4s", data, pos)
+            if size == 1:
+                size, = struct.unpack_from(">Q", data, pos + 8)
+            if kind in (b"moof", b"mdat") or size < 8:
+                raise SectionUnsupported("文件头里没有 sidx 索引")
+            if kind == b"sidx":
+                if pos + size > len(data):
+                    data += self._more(data, pos + size)
+                return data[:pos], parse_sidx(data, pos)
+            pos += size
+            if pos > INDEX_LIMIT:
+                raise SectionUnsupported("文件头里没有 sidx 索引")
+
+    def _more(self, data, needed):
+        if needed > INDEX_LIMIT:
+            raise SectionUnsupported("文件头里没有 sidx 索引")
+        more = self._fetch(len(data), max(needed, len(data) + INDEX_PROBE_SIZE) - 1)
+        if len(data) + len(more) < needed:
+            raise SectionUnsupported("文件不完整")
+        return more
+
+    def download(self):
+        """下载并写出文件，返回统计信息（offset 是文件开头对应的原视频时间）"""
+        started = time.time()
+        init, subsegments = self.read_index()
+        first, last, offset = select_subsegments(subsegments, self.start, self.end)
+        total = len(init) + last - first + 1
+        with open(self.filename, "wb", buffering=self.write_buffer) as f:
+            f.write(init)
+            pos = [first]
+            retry = 0
+            while pos[0] <= last:
+                try:
+                    self._copy_range(f, pos, last, len(init) - first, total, started)
+                except Exception as e:
+                    kind = classify_error(e)
+                    retry += 1
+                    if retry > self.retries or kind not in (ERR_NETWORK, ERR_THROTTLED):
+                        raise
+                    if self.on_retry is not None:
+                        self.on_retry(kind)
+                    time.sleep(self.retry_policy.delay(retry, kind, e))
+        elapsed = max(time.time() - started, 1e-6)
+        return {
+            "total_bytes": total,
+            "transferred_bytes": self._transferred,
+            "offset": offset,
+            "elapsed": elapsed,
+            "speed": self._transferred / elapsed,
+        }
+
+    def _copy_range(self, f, pos, end, shift, total, started):
+        with self.opener(self.url, {**self.headers, "Range": f"bytes={pos[0]}-{end}"}) as resp:
+            if resp.status != 206:
+                raise SectionUnsupported(f"服务器不支持 Range 请求 (HTTP {resp.status})")
+            f.seek(pos[0] + shift)
+            while pos[0] <= end:
+                chunk = resp.read(min(READ_CHUNK_SIZE, end - pos[0] + 1))
+                if not chunk:
+                    break
+                f.write(chunk)
+                pos[0] += len(chunk)
+                self._transferred += len(chunk)
+                if self.progress is not None:
+                    self.progress(pos[0] + shift, total, self._transferred / max(time.time() - started, 1e-6))
+        if pos[0] <= end:
+            raise IOError(f"数据不完整: 停在 {pos[0]}，应到 {end}")
@@ -0,0 +1,229 @@
+"""分段并发下载：一个文件拆成多个字节区间（HTTP Range），多条连接同时下载
+
+每完成一段就记录到 <文件>.segments.json，程序中断/重启后只补下载缺失的段。
+只依赖标准库，可以直接对本地支持 Range 的 HTTP 服务测试。
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from retry import ERR_NETWORK, ERR_THROTTLED, RetryPolicy, classify_error
+from storage import DEFAULT_WRITE_BUFFER, reserve_blocks
+
+DEFAULT_SEGMENT_SIZE = 10 * 1024 * 1024
+DEFAULT_SEGMENT_WORKERS = 4
+READ_CHUNK_SIZE = 256 * 1024
+# 单个分段失败后就地重试的次数，从断开的位置续传，不影响其他分段
+DEFAULT_SEGMENT_RETRIES = 5
+
+
+class RangeNotSupported(Exception):
+    """服务器不支持 Range 请求或无法得知文件大小，只能单连接下载
+
+    下载到一半才发现时，SegmentedDownloader.download 会先删掉目标文件和分段记录再抛出
+    """
+
+
+def urllib_opener(url, headers):
+    import urllib.request  # 正常运行时用的是 yt-dlp 的连接，这里只是测试用的默认值，不在启动时导入
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30)
+
+
+class SegmentMap:
+    """记录哪些段已经下载完成，保存在 <文件>.segments.json"""
+    def __init__(self, path, total_bytes, segment_size):
+        self.path = path
+        self.total_bytes = total_bytes
+        self.segment_size = segment_size
+        self.count = (total_bytes + segment_size - 1) // segment_size
+        self.done = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # 文件大小或分段大小变了，旧记录作废
+        if data.get("total_bytes") == self.total_bytes and data.get("segment_size") == self.segment_size:
+            self.done = set(data.get("done", []))
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"total_bytes": self.total_bytes, "segment_size": self.segment_size,
+                       "done": sorted(self.done)}, f)
+        os.replace(tmp, self.path)
+
+    def byte_range(self, index):
+        start = index * self.segment_size
+        return start, min(self.total_bytes, start + self.segment_size) - 1
+
+    def missing(self):
+        return [i for i in range(self.count) if i not in self.done]
+
+    def done_bytes(self):
+        return sum(end - start + 1 for start, end in map(self.byte_range, self.done))
+
+    def mark_done(self, index):
+        with self._lock:
+            self.done.add(index)
+            self.save()
+
+    def reset(self):
+        self.done = set()
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SegmentedDownloader:
+    """把 url 下载到 filename，progress(downloaded_bytes, total_bytes, speed) 会在下载线程中回调
+
+    网络中断、限流时只重试出错的那一段（从断开处续传），每次重试回调 on_retry(kind)；
+    其他错误（如下载地址过期）直接抛出，由调用方重新解析后再续传
+    """
+    def __init__(self, url, filename, total_bytes=None, headers=None, segment_size=DEFAULT_SEGMENT_SIZE,
+                 workers=DEFAULT_SEGMENT_WORKERS, opener=urllib_opener, progress=None,
+                 retries=DEFAULT_SEGMENT_RETRIES, retry_policy=None, on_retry=None,
+                 write_buffer=DEFAULT_WRITE_BUFFER, preallocate=True):
+        self.url = url
+        self.filename = filename
+        self.total_bytes = total_bytes
+        self.headers = dict(headers or {})
+        self.segment_size = segment_size
+        self.workers = workers
+        self.opener = opener
+        self.progress = progress
+        self.retries = retries
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.on_retry = on_retry
+        self.write_buffer = write_buffer  # 每个分段的写缓冲大小
+        self.preallocate = preallocate
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._downloaded = 0
+        self._session_bytes = 0
+        self._start = None
+
+    def probe_size(self):
+        """用 Range: bytes=0-0 请求确认服务器支持分段，并拿到文件总大小"""
+        with self.opener(self.url, {**self.headers, "Range": "bytes=0-0"}) as resp:
+            content_range = resp.headers.get("Content-Range") or ""
+            if resp.status != 206 or "/" not in content_range:
+                raise RangeNotSupported(f"HTTP {resp.status}")
+            total = content_range.rsplit("/", 1)[1]
+            if not total.isdigit():
+                raise RangeNotSupported(content_range)
+            return int(total)
+
+    def download(self):
+        """下载全部缺失的段，返回本次下载的统计信息"""
+        total = self.total_bytes = self.total_bytes or self.probe_size()
+        seg_map = SegmentMap(self.filename + ".segments.json", total, self.segment_size)
+
+        # 目标文件预先占满空间，各段直接写到自己的偏移位置；先分配磁盘块再撑大文件，
+        # 否则是稀疏文件，几个分段同时写会在磁盘上交错存放，磁盘满也要写到一半才发现
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) != total:
+            seg_map.reset()
+            with open(self.filename, "wb") as f:
+                if self.preallocate:
+                    reserve_blocks(f, total)
+                f.truncate(total)
+
+        missing = seg_map.missing()
+        resumed = seg_map.done_bytes()
+        self._downloaded = resumed
+        self._start = time.time()
+        seg_map.save()
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            futures = [pool.submit(self._fetch_segment, seg_map, i) for i in missing]
+            try:
+                for fut in futures:
+                    fut.result()
+            except BaseException as e:
+                # 一段失败就让其他段尽快停下，已完成的段保留在记录里，下次续传
+                self._stop.set()
+                for fut in futures:
+                    fut.cancel()
+                if isinstance(e, RangeNotSupported):
+                    pool.shutdown(wait=True)
+                    self.discard()
+                raise
+
+        seg_map.remove()
+        elapsed = max(time.time() - self._start, 1e-6)
+        return {
+            "total_bytes": total,
+            "resumed_bytes": resumed,
+            "downloaded_bytes": self._session_bytes,
+            "segments": len(missing),
+            "elapsed": elapsed,
+            "speed": self._session_bytes / elapsed,
+        }
+
+    def discard(self):
+        """删掉已经撑满大小的目标文件和分段记录
+
+        调用方改用单连接下载时会按已有文件的大小续传，留着预先分配好的文件只会得到损坏的结果
+        """
+        for path in (self.filename, self.filename + ".segments.json"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _fetch_segment(self, seg_map, index):
+        start, end = seg_map.byte_range(index)
+        pos = [start]  # 已写入到的位置，重试时从这里继续，已写入的部分保留
+        retry = 0
+        while not self._stop.is_set():
+            try:
+                self._fetch_range(seg_map, index, pos, end)
+            except Exception as e:
+                kind = classify_error(e)
+                retry += 1
+                if self._stop.is_set() or retry > self.retries or kind not in (ERR_NETWORK, ERR_THROTTLED):
+                    raise
+                if self.on_retry is not None:
+                    self.on_retry(kind)
+                # 等待期间其他分段失败时立即退出
+                self._stop.wait(self.retry_policy.delay(retry, kind, e))
+                continue
+            if not self._stop.is_set():
+                seg_map.mark_done(index)
+            return
+
+    def _fetch_range(self, seg_map, index, pos, end):
+        start = pos[0]
+        headers = {**self.headers, "Range": f"bytes={start}-{end}"}
+        with self.opener(self.url, headers) as resp, open(self.filename, "r+b", buffering=self.write_buffer) as f:
+            if resp.status != 206 and not (resp.status == 200 and start == 0 and end == seg_map.total_bytes - 1):
+                raise RangeNotSupported(f"HTTP {resp.status}")
+            f.seek(start)
+            while pos[0] <= end and not self._stop.is_set():
+                chunk = resp.read(min(READ_CHUNK_SIZE, end - pos[0] + 1))
+                if not chunk:
+                    break
+                f.write(chunk)
+                pos[0] += len(chunk)
+                self._report(len(chunk))
+        if pos[0] <= end and not self._stop.is_set():
+            raise IOError(f"分段 {index} 数据不完整: 停在 {pos[0]}，应到 {end}")
+
+    def _report(self, n):
+        with self._lock:
+            self._downloaded += n
+            self._session_bytes += n
+            downloaded = self._downloaded
+            speed = self._session_bytes / max(time.time() - self._start, 1e-6)
+        if self.progress is not None:
+            self.progress(downloaded, self.total_bytes, speed)
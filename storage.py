@@ -0,0 +1,259 @@
+"""输出文件管理：磁盘空间准入、预留磁盘块、大块写缓冲、临时目录到保存目录的原子移动
+
+下载前按选中格式的大小估算任务会占用多少空间（下载的中间文件 + 合并输出），磁盘放不下时
+先等其他任务结束释放预留，任何情况下都放不下的直接失败，不会下到一半才发现磁盘满。
+可以把下载和合并放在单独的临时目录（如本机 SSD），完成后再移动到保存目录；跨磁盘时先复制到
+保存目录里的临时名字再改名，保存目录里不会出现写了一半的文件。
+只依赖标准库。
+"""
+import errno
+import os
+import re
+import shutil
+import sys
+import threading
+
+DEFAULT_WRITE_BUFFER = 1024 * 1024
+# 磁盘至少留这么多空间，估算不准时也不至于把系统盘写满
+DEFAULT_MIN_FREE_SPACE = 256 * 1024 * 1024
+# 合并后的文件比两路流加起来略大（容器头、索引），按这个比例多估一点
+MERGE_OVERHEAD = 0.02
+# 等待空间时隔多久重新检查一次（用户可能手动清理了磁盘）
+SPACE_RECHECK_INTERVAL = 5
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+FALLOC_FL_KEEP_SIZE = 1
+F_PREALLOCATE = 42  # macOS fcntl
+F_ALLOCATEALL = 4
+F_PEOFPOSMODE = 3
+
+
+class InsufficientSpace(Exception):
+    """磁盘空间不够放下这个任务，等其他任务结束也不够"""
+
+
+def parse_size(text):
+    """'512M' / '1.5G' / '1048576' -> 字节数；'0'、'none'、空字符串返回 None"""
+    if text is None or isinstance(text, (int, float)):
+        return int(text) if text else None
+    text = text.strip().upper()
+    if text in ("", "0", "NONE"):
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?", text)
+    if not match:
+        raise ValueError(f"无法识别的大小: {text}，示例: 512K、4M、1.5G")
+    return int(float(match.group(1)) * _UNITS[match.group(2)]) or None
+
+
+def format_size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.1f}{unit}" if unit != "B" else f"{n}B"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+
+def existing_dir(path):
+    """path 本身或离它最近的已存在的上级目录（保存目录可能还没创建）"""
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def same_device(a, b):
+    return os.stat(existing_dir(a)).st_dev == os.stat(existing_dir(b)).st_dev
+
+
+class DiskSpaceManager:
+    """按磁盘（st_dev）记录各任务预留的空间，新任务放得下才开始下载
+
+    可用空间 = 磁盘剩余 - min_free - 其他任务还没写完的预留。任务已经写下的部分已经体现在
+    磁盘剩余里，所以预留按 written() 递减，不会重复扣除
+    """
+    def __init__(self, min_free=DEFAULT_MIN_FREE_SPACE):
+        self.min_free = min_free
+        self._cond = threading.Condition()
+        self._reservations = {}  # 任务 -> ({设备: [目录, 字节数]}, 下载所在的设备, written)
+        self.stats = {"admitted": 0, "waited": 0, "rejected": 0}
+
+    def _outstanding(self, device, reservation):
+        needs, download_device, written = reservation
+        size = needs[device][1] if device in needs else 0
+        if device == download_device and written is not None:
+            size -= written()
+        return max(0, size)
+
+    def _shortfall(self, key, needs):
+        """第一个放不下的 (目录, 需要, 可用, 不算预留是否也放不下)；都放得下时返回 None"""
+        for device, (path, size) in needs.items():
+            free = shutil.disk_usage(path).free - (self.min_free or 0)
+            available = free - sum(self._outstanding(device, r) for k, r in self._reservations.items()
+                                   if k != key and device in r[0])
+            if size > available:
+                # 其他任务写完只会占用更多空间，不算它们的预留都放不下的，等下去也没用
+                return path, size, max(0, available), size > free
+        return None
+
+    def reserve(self, key, needs, download_dir=None, written=None, on_wait=None):
+        """needs 为 {目录: 字节数}，同一块磁盘上的合并计算；download_dir 是下载写入的目录，
+        written() 返回已经写下的字节数。被其他任务的预留挤占时等它们释放，不算预留都放不下时抛 InsufficientSpace
+        """
+        by_device = {}
+        for path, size in needs.items():
+            path = existing_dir(path)
+            entry = by_device.setdefault(os.stat(path).st_dev, [path, 0])
+            entry[1] += int(size)
+        download_device = os.stat(existing_dir(download_dir)).st_dev if download_dir else None
+        waited = False
+        with self._cond:
+            while True:
+                shortfall = self._shortfall(key, by_device)
+                if shortfall is None:
+                    self._reservations[key] = (by_device, download_device, written)
+                    self.stats["admitted"] += 1
+                    return
+                path, size, available, hopeless = shortfall
+                if hopeless:
+                    self.stats["rejected"] += 1
+                    raise InsufficientSpace(f"磁盘空间不足: {path} 需要约 {format_size(size)}，"
+                                            f"可用 {format_size(available)}（已保留 {format_size(self.min_free or 0)}）")
+                if not waited:
+                    waited = True
+                    self.stats["waited"] += 1
+                    if on_wait is not None:
+                        on_wait(path, size, available)
+                self._cond.wait(SPACE_RECHECK_INTERVAL)
+
+    def release(self, key):
+        with self._cond:
+            if self._reservations.pop(key, None) is not None:
+                self._cond.notify_all()
+
+    def reserved(self):
+        """各目录上还没写完的预留字节数"""
+        with self._cond:
+            totals = {}
+            for reservation in self._reservations.values():
+                for device, (path, _) in reservation[0].items():
+                    totals[path] = totals.get(path, 0) + self._outstanding(device, reservation)
+            return totals
+
+
+_fallocate = None
+
+
+def _linux_fallocate(fd, offset, length):
+    global _fallocate
+    if _fallocate is None:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        _fallocate = libc.fallocate
+        _fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    if _fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length) != 0:
+        import ctypes
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def _macos_preallocate(fd, length):
+    import fcntl
+    import struct
+    fcntl.fcntl(fd, F_PREALLOCATE, struct.pack("=Iiqqq", F_ALLOCATEALL, F_PEOFPOSMODE, 0, length, 0))
+
+
+def reserve_blocks(f, length):
+    """从文件当前末尾起给 length 字节预先分配磁盘块，文件大小不变，返回是否成功
+
+    续传按 .part 文件的大小判断已经下载了多少，所以只分配、不把文件撑大。分配过的文件在磁盘上
+    尽量连续存放，磁盘满也会在这里就报出来（ENOSPC 照常抛出）；文件系统不支持时什么都不做
+    """
+    if length <= 0:
+        return False
+    fd = f.fileno()
+    try:
+        if sys.platform.startswith("linux"):
+            _linux_fallocate(fd, os.fstat(fd).st_size, length)
+        elif sys.platform == "darwin":
+            _macos_preallocate(fd, length)
+        else:
+            return False
+    except (OSError, AttributeError) as e:
+        if getattr(e, "errno", None) == errno.ENOSPC:
+            raise
+        return False
+    return True
+
+
+class BufferedOutput:
+    """把零碎的小块写入攒到 size 字节再写盘，flush / close 时写出剩余部分，其余属性交给原文件对象
+
+    慢速连接每次只读到几 KB，直接写盘就是大量小 IO；机械硬盘、网络盘上尤其明显
+    """
+    def __init__(self, f, size=DEFAULT_WRITE_BUFFER):
+        self.f = f
+        self.size = size
+        self._buffer = bytearray()
+
+    def write(self, data):
+        n = len(data)
+        if self._buffer or n < self.size:
+            self._buffer += data
+            if len(self._buffer) < self.size:
+                return n
+            data, self._buffer = self._buffer, bytearray()
+        self.f.write(data)
+        return n
+
+    def _drain(self):
+        if self._buffer:
+            data, self._buffer = self._buffer, bytearray()
+            self.f.write(data)
+
+    def flush(self):
+        self._drain()
+        self.f.flush()
+
+    def tell(self):
+        return self.f.tell() + len(self._buffer)
+
+    def close(self, *args):
+        try:
+            self._drain()
+        finally:
+            self.f.close(*args)
+
+    def __getattr__(self, attr):
+        return getattr(self.f, attr)
+
+
+def atomic_move(src, dst, buffer_size=DEFAULT_WRITE_BUFFER):
+    """把 src 移动到 dst：同一块磁盘直接改名；跨磁盘时先复制到 dst 旁边的临时文件，写完落盘后再改名
+
+    dst 要么是旧文件、要么是完整的新文件，中途断电或磁盘满时不会留下半个文件
+    """
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.moving")
+    try:
+        with open(src, "rb") as fin, open(tmp, "wb") as fout:
+            reserve_blocks(fout, os.fstat(fin.fileno()).st_size)
+            shutil.copyfileobj(fin, fout, buffer_size)
+            fout.flush()
+            os.fsync(fout.fileno())
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.remove(src)
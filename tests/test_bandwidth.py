@@ -0,0 +1,43 @@
+"""bandwidth.Limiter 包装后的读取"""
+import io
+import unittest
+
+from bandwidth import THROTTLE_CHUNK, BandwidthManager
+
+
+class FakeResponse(io.BytesIO):
+    """记录每次 read 的参数"""
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, amt=None):
+        self.reads.append(amt)
+        return super().read(amt)
+
+
+class LimiterReadTest(unittest.TestCase):
+    def test_read_to_end_goes_through_limiter_in_chunks(self):
+        data = bytes(range(256)) * 1024
+        limiter = BandwidthManager().limiter(rate=1024 ** 3)  # 速率足够高，不真的等待
+        response = limiter.wrap(FakeResponse(data))
+        self.assertEqual(response.read(), data)
+        self.assertNotIn(None, response.reads)
+        self.assertLessEqual(max(response.reads), THROTTLE_CHUNK)
+        self.assertEqual(limiter.bytes, len(data))
+
+    def test_sized_read_is_capped(self):
+        limiter = BandwidthManager().limiter(rate=1024 ** 3)
+        response = limiter.wrap(FakeResponse(b"x" * (THROTTLE_CHUNK * 4)))
+        self.assertLessEqual(len(response.read(THROTTLE_CHUNK * 4)), THROTTLE_CHUNK)
+
+    def test_reconnect_interrupts_open_responses(self):
+        limiter = BandwidthManager().limiter()
+        response = limiter.wrap(FakeResponse(b"x" * 1024))
+        limiter.reconnect()
+        with self.assertRaises(ConnectionResetError):
+            response.read()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""formats.select_formats 及界面画质选项的测试，输入是保存下来的 info dict（tests/fixtures）"""
+import json
+import os
+import unittest
+
+import engine
+from formats import build_formats, codec_family, select_formats
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+MB = 1024 * 1024
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class SelectFormatsTest(unittest.TestCase):
+    """youtube_dash.json：360p~2160p 的 avc1 / vp9 / av1 纯视频流、三路纯音频、一个 360p 完整格式和故事板"""
+    def setUp(self):
+        self.info = load_fixture("youtube_dash.json")
+
+    def select(self, **criteria):
+        return select_formats(self.info, **criteria)
+
+    def test_build_formats_skips_storyboards(self):
+        ids = {f.format_id for f in build_formats(self.info)}
+        self.assertNotIn("sb0", ids)
+        self.assertEqual(len(ids), len(self.info["formats"]) - 1)
+
+    def test_codec_family(self):
+        self.assertEqual(codec_family("avc1.64002a"), "avc1")
+        self.assertEqual(codec_family("vp09.00.40.08"), "vp9")
+        self.assertEqual(codec_family("av01.0.08M.08"), "av1")
+        self.assertEqual(codec_family("mp4a.40.2"), "aac")
+        self.assertIsNone(codec_family("none"))
+
+    def test_best_without_limits(self):
+        # 2160p 只有 vp9 / av1，按默认偏好选 vp9，webm 视频配 webm 音频
+        selection = self.select()
+        self.assertEqual(selection.format_spec, "313+251")
+        self.assertIsNone(selection.relaxed)
+
+    def test_height_cap(self):
+        self.assertEqual(self.select(height=720).format_spec, "136+140")
+        # 同一高度 avc1 里帧率高的优先
+        self.assertEqual(self.select(height=1080).format_spec, "299+140")
+
+    def test_height_cap_between_available_heights(self):
+        # 没有 480p 时选不超过它的最高档；合并格式的音频码率高于 360p 完整格式自带的
+        selection = self.select(height=480)
+        self.assertEqual(selection.height, 360)
+        self.assertEqual(selection.format_spec, "134+140")
+
+    def test_height_below_all_formats_is_relaxed(self):
+        selection = self.select(height=144)
+        self.assertEqual(selection.height, 360)
+        self.assertIn("144p", selection.relaxed)
+
+    def test_codec_preference_order(self):
+        self.assertEqual(self.select(height=1080, codecs=("av1", "vp9", "avc1")).format_spec, "399+140")
+        self.assertEqual(self.select(height=1080, codecs=("vp9", "avc1", "av1")).format_spec, "248+251")
+
+    def test_max_filesize(self):
+        # 1080p avc1 超出上限，同一高度的 vp9 放得下，比降到 720p 更好
+        selection = self.select(max_filesize=50 * MB)
+        self.assertEqual(selection.format_spec, "248+251")
+        self.assertLessEqual(selection.filesize, 50 * MB)
+        selection = self.select(max_filesize=30 * MB)
+        self.assertEqual(selection.format_spec, "247+251")
+        self.assertEqual(selection.height, 720)
+
+    def test_filesize_from_approx_and_bitrate(self):
+        # 没有 filesize 时用 filesize_approx，再没有就按码率 × 时长估算
+        info = dict(self.info, formats=[dict(f) for f in self.info["formats"]])
+        for f in info["formats"]:
+            f.pop("filesize", None)
+            f.pop("filesize_approx", None)
+        selection = select_formats(info, height=720)
+        self.assertEqual(selection.filesize, int((1164.2 + 129.5) * 1000 / 8 * info["duration"]))
+        self.assertEqual(select_formats(self.info, height=360, can_merge=False).filesize,
+                         int(521.3 * 1000 / 8 * self.info["duration"]))
+
+    def test_max_bitrate(self):
+        selection = self.select(max_bitrate=1000)
+        self.assertEqual(selection.format_spec, "247+251")
+        self.assertLessEqual(selection.tbr, 1000)
+
+    def test_limits_too_small_picks_smallest(self):
+        selection = self.select(max_filesize=1 * MB)
+        self.assertEqual(selection.format_spec, "243+139")
+        self.assertIn("大小/码率", selection.relaxed)
+
+    def test_height_and_size_relaxed_together(self):
+        selection = self.select(height=144, max_filesize=1 * MB)
+        self.assertIn("144p", selection.relaxed)
+        self.assertIn("大小/码率", selection.relaxed)
+
+    def test_without_ffmpeg_only_muxed_formats(self):
+        self.assertEqual(self.select(can_merge=False).format_spec, "18")
+
+    def test_audio_only(self):
+        self.assertEqual(self.select(audio_only=True).format_spec, "251")
+        # 目标是 m4a 时优先 AAC，可以直接复制不用转码
+        self.assertEqual(self.select(audio_only=True, audio_codecs=("aac",)).format_spec, "140")
+        self.assertEqual(self.select(audio_only=True, max_bitrate=64).format_spec, "139")
+        self.assertIsNone(self.select(audio_only=True).video)
+
+
+class ProgressiveFormatsTest(unittest.TestCase):
+    """vimeo_progressive.json：只有完整格式（音视频一体），没有大小和码率"""
+    def setUp(self):
+        self.info = load_fixture("vimeo_progressive.json")
+
+    def test_height_cap(self):
+        self.assertEqual(select_formats(self.info, height=600).format_spec, "http-540p")
+
+    def test_audio_only_falls_back_to_muxed(self):
+        # 音频码率都不知道，保持原顺序取第一个，下载量最小
+        selection = select_formats(self.info, audio_only=True)
+        self.assertEqual(selection.format_spec, "http-360p")
+        self.assertIsNone(selection.audio)
+
+    def test_unknown_size_does_not_fit_size_limit(self):
+        selection = select_formats(self.info, max_filesize=100 * MB)
+        self.assertIsNotNone(selection.relaxed)
+
+    def test_unknown_bitrate_fits_bitrate_limit(self):
+        selection = select_formats(self.info, max_bitrate=500)
+        self.assertEqual(selection.format_spec, "http-720p")
+        self.assertIsNone(selection.relaxed)
+
+    def test_no_formats(self):
+        self.assertIsNone(select_formats({"formats": []}))
+
+
+class QualityOptionsTest(unittest.TestCase):
+    """界面画质选项 <-> 选择条件"""
+    def setUp(self):
+        self.saved = {k: getattr(engine, k) for k in ("ffmpeg_available", "max_bitrate", "codec_preference", "audio_format")}
+        engine.ffmpeg_available = True
+        engine.max_bitrate = None
+        engine.codec_preference = engine.DEFAULT_CODEC_PREFERENCE
+        engine.audio_format = "mp3"
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(engine, k, v)
+
+    def test_quality_criteria(self):
+        self.assertEqual(engine.quality_criteria(engine.QUALITY_BEST), {})
+        self.assertEqual(engine.quality_criteria("3. 720p (MP4) · avc1 30fps aac 130k 约33.5MiB"), {"height": 720})
+        self.assertEqual(engine.quality_criteria(f"9. {engine.QUALITY_AUDIO}"), {"audio_only": True})
+        # 旧版本的选项文字（任务日志里恢复的任务）
+        self.assertEqual(engine.quality_criteria("4. 仅音频 (MP3)"), {"audio_only": True})
+        self.assertEqual(engine.quality_criteria("2. 标准画质"), {"height": 720})
+
+    def test_list_quality_options(self):
+        options = engine.list_quality_options(load_fixture("youtube_dash.json"))
+        self.assertEqual(options[0], engine.QUALITY_BEST)
+        self.assertEqual(options[-1], "6. 仅音频 (MP3)")
+        heights = [engine.quality_criteria(o).get("height") for o in options[1:-1]]
+        self.assertEqual(heights, [2160, 1080, 720, 360])
+        self.assertIn("avc1 60fps", options[2])
+
+    def test_options_round_trip(self):
+        # 每个选项解析出的条件都能选到标注的那一档
+        info = load_fixture("youtube_dash.json")
+        for option in engine.list_quality_options(info)[1:-1]:
+            criteria = engine.quality_criteria(option)
+            self.assertEqual(select_formats(info, **criteria).height, criteria["height"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""journal.JobJournal：重启后恢复未结束的任务；读写出错时停用，不影响调用方"""
+import os
+import tempfile
+import unittest
+
+import engine
+from engine import JOB_DONE, DownloadScheduler
+from journal import JobJournal
+
+
+class JobJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "jobs")
+        self.errors = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def journal(self, directory=None):
+        return JobJournal(directory or self.directory, fsync_interval=0.01, on_error=self.errors.append)
+
+    def test_replay_unfinished_jobs(self):
+        journal = self.journal()
+        journal.append("a", url="https://example.com/a", state="queued")
+        journal.append("b", url="https://example.com/b", state="queued")
+        journal.append("a", state="downloading", downloaded_bytes=100)
+        journal.save_info("a", {"id": "a"})
+        journal.remove("b")
+        journal.flush()
+        journal = self.journal()
+        self.assertEqual(journal.replay(), [{"id": "a", "url": "https://example.com/a", "state": "downloading",
+                                             "downloaded_bytes": 100}])
+        self.assertEqual(journal.load_info("a"), {"id": "a"})
+        self.assertEqual(self.errors, [])
+
+    def test_unwritable_directory_disables_journal(self):
+        # 上级路径是个普通文件，目录建不出来
+        blocker = os.path.join(self.tmp.name, "blocker")
+        open(blocker, "w").close()
+        journal = self.journal(os.path.join(blocker, "jobs"))
+        journal.append("a", url="https://example.com/a")
+        journal.save_info("a", {"id": "a"})
+        journal.remove("a")
+        journal.flush()
+        self.assertEqual(journal.replay(), [])
+        self.assertIsInstance(journal.error, OSError)
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(journal._pending, [])
+
+    def test_write_error_disables_journal(self):
+        journal = self.journal()
+        journal.append("a", url="https://example.com/a")
+        journal.flush()
+        journal._file = open("/dev/full", "a", encoding="utf-8")  # 之后的写入都是 ENOSPC
+        journal.append("a", state="downloading")
+        journal.flush()
+        self.assertEqual(len(self.errors), 1)
+        for _ in range(10):
+            journal.append("a", downloaded_bytes=1)
+        self.assertEqual(journal._pending, [])
+        self.assertEqual(len(self.errors), 1)
+
+    def test_scheduler_runs_without_journal_directory(self):
+        blocker = os.path.join(self.tmp.name, "blocker")
+        open(blocker, "w").close()
+        patched = ("job_journal", "disk_space", "wait_for_components", "run_extract_task", "run_download_task")
+        saved = {k: getattr(engine, k) for k in patched}
+        self.addCleanup(lambda: [setattr(engine, k, v) for k, v in saved.items()])
+        engine.job_journal = self.journal(os.path.join(blocker, "jobs"))
+        engine.disk_space = None
+        engine.wait_for_components = lambda: True
+
+        def extract(job):
+            job.info = {"id": job.url}
+            return True
+
+        engine.run_extract_task = extract
+        engine.run_download_task = lambda job, scheduler: None
+        scheduler = DownloadScheduler(lambda job: None, max_downloads=1, max_extractions=1, max_postprocess=1)
+        self.assertEqual(scheduler.resume_journal(), [])
+        job = scheduler.submit("a", engine.QUALITY_BEST, self.tmp.name)
+        with scheduler._idle:
+            self.assertTrue(scheduler._idle.wait_for(lambda: job.finished, 5))
+        self.assertEqual(job.state, JOB_DONE)
+        self.assertEqual(len(self.errors), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+"""live.LiveRecorder 对本地 HLS 服务的测试：滚动分文件、漏掉分片、停止录制
+
+本地服务每被请求一次播放列表就追加一个分片（不依赖时间，结果是确定的），
+分片内容里写着自己的序号，录下来的文件可以直接检查是不是连续、完整的分片。
+"""
+import http.server
+import os
+import re
+import tempfile
+import threading
+import unittest
+
+from live import LiveRecorder, next_index, parse_playlist
+from retry import RetryPolicy
+
+SEGMENT_SECONDS = 1.0
+TARGET_DURATION = 0.02  # 只影响刷新间隔，让测试跑得快；分段时长按 #EXTINF 计算
+
+
+def segment_data(seq):
+    return f"[{seq:04d}]".encode() * 50
+
+
+class HlsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        if self.path == "/live/index.m3u8":
+            with server.lock:
+                body = server.playlist()
+            if body is None:
+                self.send_error(404)
+                return
+            self.reply(body.encode(), "application/vnd.apple.mpegurl")
+            return
+        match = re.fullmatch(r"/live/(\d+)\.ts", self.path)
+        if not match or int(match.group(1)) in server.missing:
+            self.send_error(404)
+            return
+        self.reply(segment_data(int(match.group(1))), "video/mp2t")
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HlsServer(http.server.ThreadingHTTPServer):
+    """window: 播放列表里保留的分片数；step: 每次请求播放列表新增的分片数；total: 推到这么多个分片后结束
+    jumps: {第几次请求: 额外新增的分片数}，模拟两次刷新之间已经滑出窗口的分片；missing: 返回 404 的分片
+    offline: 为 True 时播放列表返回 404（直播已经下线）
+    """
+    def __init__(self, window=4, step=1, total=None, jumps=None, missing=()):
+        super().__init__(("127.0.0.1", 0), HlsHandler)
+        self.lock = threading.Lock()
+        self.window = window
+        self.step = step
+        self.total = total
+        self.jumps = jumps or {}
+        self.missing = set(missing)
+        self.offline = False
+        self.produced = window
+        self.requests = 0
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/live/index.m3u8"
+
+    def playlist(self):
+        if self.offline:
+            return None
+        if self.requests:
+            self.produced += self.step + self.jumps.get(self.requests, 0)
+        self.requests += 1
+        if self.total is not None:
+            self.produced = min(self.produced, self.total)
+        first = max(0, self.produced - self.window)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{TARGET_DURATION}",
+                 f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+        for seq in range(first, self.produced):
+            lines += [f"#EXTINF:{SEGMENT_SECONDS},", f"{seq}.ts"]
+        if self.total is not None and self.produced >= self.total:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+
+class LiveRecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.tmp.cleanup()
+
+    def serve(self, **kwargs):
+        self.server = HlsServer(**kwargs)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def recorder(self, roll_seconds=3, **kwargs):
+        return LiveRecorder(self.server.url, self.directory, "live", roll_seconds=roll_seconds,
+                            retry_policy=RetryPolicy(base=0.01, throttle_base=0.01), **kwargs)
+
+    def recorded(self):
+        """{文件名: 文件里的分片序号列表}；同时检查没有留下 .part 文件、每个分片都完整"""
+        files = {}
+        for name in sorted(os.listdir(self.directory)):
+            self.assertFalse(name.endswith(".part"), name)
+            with open(os.path.join(self.directory, name), "rb") as f:
+                data = f.read()
+            seqs = [int(s) for s in re.findall(rb"\[(\d{4})\]", data)[::50]]
+            self.assertEqual(b"".join(map(segment_data, seqs)), data, name)
+            files[name] = seqs
+        return files
+
+    def assertContiguous(self, seqs):
+        self.assertEqual(seqs, list(range(seqs[0], seqs[0] + len(seqs))))
+
+    def test_rolls_files_by_duration(self):
+        self.serve(total=12)
+        stats = self.recorder(roll_seconds=3).record()
+        files = self.recorded()
+        # 从直播末端倒数第 3 个分片（序号 1）开始，录到结束
+        self.assertEqual(files, {
+            "live.001.ts": [1, 2, 3],
+            "live.002.ts": [4, 5, 6],
+            "live.003.ts": [7, 8, 9],
+            "live.004.ts": [10, 11],
+        })
+        self.assertTrue(stats["ended"])
+        self.assertEqual(stats["files"], 4)
+        self.assertEqual(stats["segments"], 11)
+        self.assertEqual(stats["seconds"], 11 * SEGMENT_SECONDS)
+        self.assertEqual(stats["gaps"], 0)
+
+    def test_manifest_gap_starts_new_file(self):
+        # 第 3 次刷新前一共推了 5 个新分片，窗口只有 4 个：漏掉 1 个（按目标时长估算秒数）
+        self.serve(total=16, jumps={3: 4})
+        gaps = []
+        stats = self.recorder(roll_seconds=100, on_gap=lambda n, seconds: gaps.append((n, seconds))).record()
+        files = self.recorded()
+        self.assertEqual(gaps, [(1, TARGET_DURATION)])
+        self.assertEqual(stats["missed_segments"], 1)
+        self.assertEqual(list(files.values()), [[1, 2, 3, 4, 5], [7, 8, 9, 10, 11, 12, 13, 14, 15]])
+
+    def test_missing_segment_is_skipped(self):
+        # 分片已经取不到（404）：记为漏掉，前后分成两个文件，录制继续
+        self.serve(total=10, missing={5})
+        stats = self.recorder(roll_seconds=100).record()
+        files = list(self.recorded().values())
+        self.assertEqual(files, [[1, 2, 3, 4], [6, 7, 8, 9]])
+        self.assertEqual(stats["gaps"], 1)
+        for seqs in files:
+            self.assertContiguous(seqs)
+
+    def test_stop_keeps_recorded_files(self):
+        self.serve()  # 不会结束的直播
+        stop = threading.Event()
+
+        def on_file(path, seconds):
+            if len(os.listdir(self.directory)) >= 3:
+                stop.set()
+
+        stats = self.recorder(roll_seconds=2, stop_event=stop, on_file=on_file,
+                              progress=lambda *args: None).record()
+        files = self.recorded()
+        self.assertFalse(stats["ended"])
+        self.assertGreaterEqual(len(files), 2)
+        self.assertContiguous([seq for seqs in files.values() for seq in seqs])
+
+    def test_stop_mid_file_finalizes_partial_file(self):
+        self.serve()
+        stop = threading.Event()
+        recorder = self.recorder(roll_seconds=100, stop_event=stop,
+                                 progress=lambda path, recorded, seconds, speed: seconds >= 4 and stop.set())
+        stats = recorder.record()
+        files = self.recorded()
+        self.assertEqual(len(files), 1)
+        self.assertEqual(stats["segments"], len(next(iter(files.values()))))
+        self.assertGreaterEqual(stats["segments"], 5)
+
+    def test_offline_playlist_ends_after_timeout(self):
+        server = self.serve()
+        server.offline = True
+        stats = self.recorder(gone_timeout=0.2).record()
+        self.assertTrue(stats["ended"])
+        self.assertGreater(stats["retries"], 0)
+        self.assertEqual(self.recorded(), {})
+
+    def test_numbering_continues_after_restart(self):
+        open(os.path.join(self.directory, "live.004.ts"), "wb").close()
+        self.assertEqual(next_index("live", self.directory), 5)
+        self.serve(total=6)
+        self.recorder(roll_seconds=100).record()
+        self.assertIn("live.005.ts", os.listdir(self.directory))
+
+
+class ParsePlaylistTest(unittest.TestCase):
+    def test_master_and_media_playlists(self):
+        master = parse_playlist("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\nlow/index.m3u8\n"
+                                "#EXT-X-STREAM-INF:BANDWIDTH=2400000\nhigh/index.m3u8\n",
+                                "http://example.com/live/master.m3u8")
+        self.assertEqual(max(master.variants)[1], "http://example.com/live/high/index.m3u8")
+        media = parse_playlist("#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXT-X-MEDIA-SEQUENCE:41\n"
+                               "#EXTINF:6.0,\na.ts\n#EXT-X-DISCONTINUITY\n#EXTINF:5.5,\nb.ts\n",
+                               "http://example.com/live/index.m3u8")
+        self.assertEqual([(s.seq, s.duration, s.discontinuity) for s in media.segments],
+                         [(41, 6.0, False), (42, 5.5, True)])
+        self.assertFalse(media.ended)
+
+
+if __name__ == "__main__":
+    unittest.main()
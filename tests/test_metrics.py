@@ -0,0 +1,68 @@
+"""metrics.MetricsRegistry 的导出"""
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from metrics import MetricsRegistry
+
+
+class MetricsExportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "metrics.json")
+        self.registry = MetricsRegistry()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_export_writes_json_and_prom(self):
+        self.assertIsNone(self.registry.maybe_export(self.path, 10))
+        with open(self.path, encoding="utf-8") as f:
+            self.assertIn("active", json.load(f))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, "metrics.prom")))
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["metrics.json", "metrics.prom"])
+
+    def test_interval_checked_once_across_threads(self):
+        exports = []
+        export = self.registry.export
+        self.registry.export = lambda path: exports.append(path) or export(path)
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            self.registry.maybe_export(self.path, 60)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(exports), 1)
+
+    def test_concurrent_exports_do_not_collide(self):
+        errors = []
+
+        def worker():
+            for _ in range(20):
+                try:
+                    self.registry.export(self.path)
+                except OSError as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["metrics.json", "metrics.prom"])
+
+    def test_write_error_is_returned_not_raised(self):
+        error = self.registry.maybe_export(os.path.join(self.tmp.name, "missing", "metrics.json"), 0)
+        self.assertIsInstance(error, OSError)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+"""remux.TranscodeSlots 的线程分配"""
+import contextlib
+import unittest
+
+from remux import TranscodeSlots
+
+
+class TranscodeSlotsTest(unittest.TestCase):
+    def test_threads_never_exceed_cpus(self):
+        # 4 个后处理并发：第一个转码也只分 1/4，四个同时转码正好用满
+        slots = TranscodeSlots(cpus=8, concurrency=4)
+        with contextlib.ExitStack() as stack:
+            threads = [stack.enter_context(slots.acquire()) for _ in range(4)]
+            self.assertEqual(threads, [2, 2, 2, 2])
+            # 不占后处理名额的转码（边下边转）在核分完时只给 1 个线程
+            self.assertEqual(stack.enter_context(slots.acquire()), 1)
+
+    def test_threads_returned_on_exit(self):
+        slots = TranscodeSlots(cpus=4, concurrency=1)
+        with slots.acquire() as threads:
+            self.assertEqual(threads, 4)
+            with slots.acquire() as extra:
+                self.assertEqual(extra, 1)
+        with slots.acquire() as threads:
+            self.assertEqual(threads, 4)
+
+    def test_concurrency_above_cpus(self):
+        slots = TranscodeSlots(cpus=2, concurrency=8)
+        with slots.acquire() as threads:
+            self.assertEqual(threads, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""DownloadScheduler 三级流水线在阶段函数出错时的行为；解析、下载换成测试里的函数，不联网"""
+import threading
+import unittest
+
+import engine
+from engine import JOB_DONE, JOB_FAILED, DownloadScheduler, StagePool
+
+
+class FailingJournal:
+    """save_info 总是失败的任务日志"""
+    def append(self, job_id, **fields):
+        pass
+
+    def remove(self, job_id):
+        pass
+
+    def save_info(self, job_id, info):
+        raise OSError("No space left on device")
+
+
+class SchedulerTest(unittest.TestCase):
+    PATCHED = ("job_journal", "disk_space", "wait_for_components", "run_extract_task", "run_download_task")
+
+    def setUp(self):
+        self.saved = {k: getattr(engine, k) for k in self.PATCHED}
+        engine.job_journal = None
+        engine.disk_space = None
+        engine.wait_for_components = lambda: True
+        engine.run_extract_task = self.extract
+        engine.run_download_task = lambda job, scheduler: None  # 下载完成，不需要后期处理
+        self.updates = []
+        self.scheduler = DownloadScheduler(self.on_update, max_downloads=1, max_extractions=1, max_postprocess=1)
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(engine, k, v)
+
+    def extract(self, job):
+        job.info = {"id": job.url}
+        job.title = job.url
+        return True
+
+    def on_update(self, job):
+        self.updates.append((job, job.state))
+
+    def wait_idle(self, timeout=5):
+        with self.scheduler._idle:
+            ok = self.scheduler._idle.wait_for(
+                lambda: self.scheduler._backlog == 0 and all(j.finished for j in self.scheduler.jobs), timeout)
+        self.assertTrue(ok, "调度器没有回到空闲状态")
+
+    def test_stage_pool_survives_exception(self):
+        pool = StagePool("test", 1)
+        done = threading.Event()
+
+        def boom():
+            raise RuntimeError("boom")
+
+        pool.submit(boom)
+        pool.submit(done.set)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(pool._workers, 1)
+
+    def test_journal_error_fails_job_and_clears_backlog(self):
+        engine.job_journal = FailingJournal()
+        job = self.scheduler.submit("a", engine.QUALITY_BEST, "/tmp")
+        self.wait_idle()
+        self.assertEqual(job.state, JOB_FAILED)
+        self.assertIn("No space", job.error)
+        # 后面的任务照常进行
+        engine.job_journal = None
+        self.assertEqual(self.scheduler.submit("b", engine.QUALITY_BEST, "/tmp").state, engine.JOB_QUEUED)
+        self.wait_idle()
+        self.assertEqual(self.scheduler.take_finished()[0], 1)
+
+    def test_unexpected_reserve_error_releases_slot(self):
+        def reserve(job):
+            raise RuntimeError("statvfs failed")
+
+        self.scheduler._reserve_disk_space = reserve
+        jobs = [self.scheduler.submit(url, engine.QUALITY_BEST, "/tmp") for url in ("a", "b")]
+        self.wait_idle()
+        self.assertEqual([j.state for j in jobs], [JOB_FAILED, JOB_FAILED])
+        self.assertEqual(self.scheduler.pending_postprocess(), 0)
+
+    def test_download_done(self):
+        job = self.scheduler.submit("a", engine.QUALITY_BEST, "/tmp")
+        self.wait_idle()
+        self.assertEqual(job.state, JOB_DONE)
+        self.assertEqual(self.scheduler.pending_postprocess(), 0)
+
+    def test_take_finished_from_update_callback(self):
+        # 界面在最后一个任务结束的回调里就会取走汇总（active_count() == 0 时），不能和调度器自己移除任务冲突
+        taken = []
+
+        def on_update(job):
+            if job.finished and self.scheduler.active_count() == 0:
+                taken.append(self.scheduler.take_finished())
+
+        self.scheduler.on_update = on_update
+        for url in ("a", "b", "c"):
+            self.scheduler.submit(url, engine.QUALITY_BEST, "/tmp")
+            self.wait_idle()
+        self.assertEqual(sum(done for done, failed in taken), 3)
+        self.assertEqual(self.scheduler.jobs, [])
+        self.assertEqual(self.scheduler.take_finished(), (0, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
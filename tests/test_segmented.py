@@ -0,0 +1,119 @@
+"""segmented.SegmentedDownloader 对本地 HTTP 服务的测试：分段、断点续传、服务器不支持 Range 时的回退"""
+import http.server
+import os
+import re
+import tempfile
+import threading
+import unittest
+
+from segmented import RangeNotSupported, SegmentedDownloader
+
+SEGMENT_SIZE = 64 * 1024
+PAYLOAD = bytes(range(256)) * (SEGMENT_SIZE * 5 // 256) + b"tail"  # 5 段多一点，最后一段不满
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """server.ranges: 'all' 支持 Range；'probe' 只有探测请求（bytes=0-0）返回 206；'none' 一律 200
+    server.fail_at: 这些起始位置的请求返回 500，模拟下载中断
+    """
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("Range"))
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range") or "")
+        ranges = self.server.ranges
+        if match and (ranges == "all" or ranges == "probe" and match.group(0) == "bytes=0-0"):
+            start, end = int(match.group(1)), int(match.group(2))
+            if start in self.server.fail_at:
+                self.send_error(500)
+                return
+            body = PAYLOAD[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(PAYLOAD)}")
+        else:
+            body = PAYLOAD
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SegmentedDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        self.server.ranges = "all"
+        self.server.fail_at = set()
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/media"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "media.part")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def downloader(self, **kwargs):
+        kwargs.setdefault("workers", 3)
+        return SegmentedDownloader(self.url, self.filename, segment_size=SEGMENT_SIZE, retries=0, **kwargs)
+
+    def read_output(self):
+        with open(self.filename, "rb") as f:
+            return f.read()
+
+    def test_split_into_ranges(self):
+        stats = self.downloader().download()
+        self.assertEqual(self.read_output(), PAYLOAD)
+        self.assertEqual(stats["segments"], 6)
+        self.assertEqual(stats["downloaded_bytes"], len(PAYLOAD))
+        self.assertEqual(stats["resumed_bytes"], 0)
+        self.assertGreater(stats["speed"], 0)
+        # 探测一次，之后每段一个 Range 请求
+        self.assertEqual(len(self.server.requests), 7)
+        self.assertFalse(os.path.exists(self.filename + ".segments.json"))
+
+    def test_resume_downloads_only_missing_segments(self):
+        self.server.fail_at = {2 * SEGMENT_SIZE}
+        with self.assertRaises(Exception):
+            self.downloader(workers=1).download()
+        self.assertTrue(os.path.exists(self.filename + ".segments.json"))
+
+        self.server.fail_at = set()
+        self.server.requests = []
+        stats = self.downloader().download()
+        self.assertEqual(self.read_output(), PAYLOAD)
+        self.assertEqual(stats["resumed_bytes"], 2 * SEGMENT_SIZE)
+        self.assertEqual(stats["downloaded_bytes"], len(PAYLOAD) - 2 * SEGMENT_SIZE)
+        self.assertNotIn(f"bytes=0-{SEGMENT_SIZE - 1}", self.server.requests)
+        self.assertFalse(os.path.exists(self.filename + ".segments.json"))
+
+    def test_segment_map_discarded_when_file_size_changes(self):
+        self.server.fail_at = {SEGMENT_SIZE}
+        with self.assertRaises(Exception):
+            self.downloader(workers=1).download()
+        with open(self.filename, "r+b") as f:
+            f.truncate(10)  # 文件被别的程序动过，记录不可信，全部重新下载
+        self.server.fail_at = set()
+        stats = self.downloader().download()
+        self.assertEqual(self.read_output(), PAYLOAD)
+        self.assertEqual(stats["resumed_bytes"], 0)
+
+    def test_no_range_support(self):
+        self.server.ranges = "none"
+        with self.assertRaises(RangeNotSupported):
+            self.downloader().download()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_range_refused_after_probe_leaves_nothing_behind(self):
+        # 探测通过、文件已经撑满之后才发现不支持：要删掉文件和分段记录，单连接下载才不会从错误的位置续传
+        self.server.ranges = "probe"
+        with self.assertRaises(RangeNotSupported):
+            self.downloader().download()
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertFalse(os.path.exists(self.filename + ".segments.json"))
+
+
+if __name__ == "__main__":
+    unittest.main()